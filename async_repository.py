@@ -0,0 +1,178 @@
+import asyncio
+import functools
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from background import ReadWriteLock
+from repository import Repository, Progress, CancelToken
+
+# 1つのリポジトリで同時にワーカースレッドを使う処理の既定の数
+DEFAULT_MAX_CONCURRENCY = 4
+
+# 非同期イテレーターが1回のワーカー呼び出しで取り出す要素の数
+ITER_BATCH_SIZE = 64
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_shared_executor():
+    """すべての AsyncRepository で共有するワーカースレッドのプールを取得する"""
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(
+                max_workers=min(32, (os.cpu_count() or 1) + 4),
+                thread_name_prefix='lvcs-async'
+            )
+        return _shared_executor
+
+
+class AsyncRepository:
+    """Repository の操作をワーカースレッドで実行し、asyncio のイベントループを止めない窓口
+    
+    ディスクI/Oと圧縮の処理はワーカースレッドで行い、同時に実行する処理の数は max_concurrency で制限する。
+    リポジトリを変更する操作（add・commit・checkout）は、同じリポジトリの他の操作と同時に実行しない。
+    複数のリポジトリを扱う場合、既定ではワーカースレッドのプールを共有する。
+    """
+    
+    def __init__(self, repo_path, executor=None, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """窓口を初期化する（repo_path には Repository も渡せる）"""
+        self.repo = repo_path if isinstance(repo_path, Repository) else Repository(repo_path)
+        self.executor = executor or get_shared_executor()
+        self.max_concurrency = max_concurrency
+        self.rw_lock = ReadWriteLock()
+        self.semaphore = None
+    
+    def _call_locked(self, func, args, exclusive):
+        """ワーカースレッドでロックを取得して関数を呼び出す"""
+        if exclusive:
+            self.rw_lock.acquire_write()
+        else:
+            self.rw_lock.acquire_read()
+        try:
+            return func(*args)
+        finally:
+            if exclusive:
+                self.rw_lock.release_write()
+            else:
+                self.rw_lock.release_read()
+    
+    async def _run(self, func, *args, exclusive=False, cancel_token=None):
+        """関数をワーカースレッドで実行し、結果を待つ
+        
+        待機中のタスクが取り消された場合は cancel_token で操作の中断を要求し、
+        ワーカースレッドの処理（チェックアウトの巻き戻しなど）が終わってから CancelledError を送出する。
+        """
+        if self.semaphore is None:
+            # Python 3.8/3.9 ではセマフォが作成時のイベントループに結び付くため、ループ内で作成する
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.executor, functools.partial(self._call_locked, func, args, exclusive)
+            )
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if cancel_token is not None:
+                    cancel_token.cancel()
+                    try:
+                        await future
+                    except Exception:
+                        pass
+                raise
+    
+    async def _run_with_progress(self, func, *args, on_progress=None, exclusive=False):
+        """進捗の通知と取り消しに対応した操作をワーカースレッドで実行する"""
+        token = CancelToken()
+        progress = Progress(on_progress, token)
+        return await self._run(func, *args, progress, exclusive=exclusive, cancel_token=token)
+    
+    async def _iterate(self, make_iterator, cancel_token=None):
+        """同期イテレーターを ITER_BATCH_SIZE 件ずつワーカースレッドで進め、要素を1つずつ返す
+        
+        ロックは1回の取り出しの間だけ取得するため、取り出しの合間に他の操作が実行されることがある。
+        """
+        state = {}
+        
+        def next_batch():
+            if 'iterator' not in state:
+                state['iterator'] = make_iterator()
+            return list(itertools.islice(state['iterator'], ITER_BATCH_SIZE))
+        
+        try:
+            while True:
+                batch = await self._run(next_batch, cancel_token=cancel_token)
+                for item in batch:
+                    yield item
+                if len(batch) < ITER_BATCH_SIZE:
+                    break
+        finally:
+            # 途中で打ち切られた場合もジェネレーターを閉じ、ワーカーの後始末を行う
+            if 'iterator' in state:
+                await self._run(state['iterator'].close)
+    
+    async def add(self, path_pattern, on_progress=None):
+        """ファイルをインデックスに追加する（on_progress はワーカースレッドから呼ばれる）"""
+        return await self._run_with_progress(self.repo.add, path_pattern, on_progress=on_progress, exclusive=True)
+    
+    async def commit(self, message):
+        """インデックスの内容をコミットする"""
+        return await self._run(self.repo.commit, message, exclusive=True)
+    
+    async def status(self, paths=None, on_progress=None):
+        """ワーキングディレクトリの状態を取得する"""
+        return await self._run_with_progress(self.repo.status, paths, on_progress=on_progress)
+    
+    async def log(self, count=10, name_status=False, renames=None, stat=False):
+        """コミットログを取得する"""
+        return await self._run(self.repo.log, count, name_status, renames, stat)
+    
+    async def diff(self, path=None, algorithm=None, context=None, on_progress=None):
+        """インデックスとワーキングディレクトリ間の差分を取得する"""
+        return await self._run_with_progress(
+            self.repo.diff, path, algorithm, context, on_progress=on_progress
+        )
+    
+    async def diff_commits(self, old_revision, new_revision, name_status=False, algorithm=None, context=None, renames=None):
+        """2つのコミット（ブランチ）間の差分を取得する"""
+        return await self._run(
+            self.repo.diff_commits, old_revision, new_revision, name_status, algorithm, context, renames
+        )
+    
+    async def checkout(self, branch_name, on_progress=None):
+        """指定されたブランチにチェックアウトする（取り消された場合は書き出したファイルを元に戻す）"""
+        return await self._run_with_progress(
+            self.repo.checkout, branch_name, on_progress=on_progress, exclusive=True
+        )
+    
+    def iter_status(self, paths=None):
+        """ワーキングディレクトリの状態をファイルごとに返す非同期イテレーター"""
+        token = CancelToken()
+        progress = Progress(cancel_token=token)
+        return self._iterate(lambda: self.repo.iter_status(paths, progress), token)
+    
+    def iter_log(self, start=None, name_status=False, renames=None, stat=False):
+        """start（省略時はHEAD）からログエントリを1つずつ返す非同期イテレーター"""
+        return self._iterate(lambda: self.repo.iter_log(start, name_status, renames, stat))
+    
+    def iter_diff(self, path=None, algorithm=None, context=None):
+        """インデックスとワーキングディレクトリ間の差分を1行ずつ返す非同期イテレーター
+        
+        取り消されると OperationCancelled ではなく asyncio.CancelledError を送出する。
+        """
+        token = CancelToken()
+        progress = Progress(cancel_token=token)
+        return self._iterate(
+            lambda: self.repo.iter_diff(path, algorithm, context=context, progress=progress), token
+        )
+    
+    def iter_diff_commits(self, old_revision, new_revision, name_status=False, algorithm=None, context=None, renames=None):
+        """2つのコミット（ブランチ）間の差分を1行ずつ返す非同期イテレーター"""
+        return self._iterate(
+            lambda: self.repo.iter_diff_commits(old_revision, new_revision, name_status, algorithm, context, renames)
+        )
@@ -0,0 +1,205 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ReadWriteLock:
+    """読み取りは同時に、書き込みは単独で実行させるロック"""
+    
+    def __init__(self):
+        """ロックを初期化する"""
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+    
+    def acquire_read(self):
+        """読み取りロックを取得する（書き込み待ちがある間は新しい読み取りを待たせる）"""
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+    
+    def release_read(self):
+        """読み取りロックを解放する"""
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+    
+    def acquire_write(self):
+        """書き込みロックを取得する"""
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+    
+    def release_write(self):
+        """書き込みロックを解放する"""
+        with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+
+class TaskHandle:
+    """実行を依頼したタスクの状態を表す"""
+    
+    def __init__(self, task, args, callback, key, exclusive, generation):
+        """ハンドルを初期化する"""
+        self.task = task
+        self.args = args
+        self.callback = callback
+        self.key = key
+        self.exclusive = exclusive
+        self.generation = generation
+        self.future = None
+        self.cancelled = threading.Event()
+        self.done_callbacks = []
+        self.done = False
+    
+    def cancel(self):
+        """タスクを取り消す（開始前なら実行せず、実行中なら結果を捨てる）"""
+        self.cancelled.set()
+    
+    def add_done_callback(self, func):
+        """タスクが終了したとき、または実行されずに破棄されたときに呼ぶ関数を登録する（UIスレッドで呼ばれる）"""
+        self.done_callbacks.append(func)
+    
+    def _mark_done(self):
+        """登録された関数を一度だけ呼ぶ（取り消されたかどうかにかかわらず呼ぶ）"""
+        if self.done:
+            return
+        self.done = True
+        for func in self.done_callbacks:
+            func()
+
+
+class BackgroundExecutor:
+    """ワーカースレッドでタスクを実行し、結果をUIスレッドへ受け渡す
+    
+    結果は内部のキューに積まれ、UIスレッドから定期的に呼ばれる dispatch() でコールバックが実行される。
+    同じキーのタスクは実行中・待機中のものと統合され、完了後に最新の依頼だけが1回実行される。
+    """
+    
+    def __init__(self, max_workers=None):
+        """エグゼキューターを初期化する"""
+        self.pool = ThreadPoolExecutor(
+            max_workers=max_workers or min(4, os.cpu_count() or 1),
+            thread_name_prefix='lvcs-worker'
+        )
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.rw_lock = ReadWriteLock()
+        self.active = {}
+        self.queued = {}
+        self.generation = 0
+    
+    def submit(self, task, args=(), callback=None, key=None, exclusive=False):
+        """タスクの実行を依頼する（exclusive=True のタスクは他のタスクと同時に実行しない）"""
+        with self.lock:
+            handle = TaskHandle(task, args, callback, key, exclusive, self.generation)
+            
+            if key is not None and key in self.active:
+                # 同じキーのタスクが実行中・待機中なら、完了後に最新の依頼だけを実行する
+                previous = self.queued.get(key)
+                if previous is not None:
+                    previous.cancel()
+                self.queued[key] = handle
+            else:
+                if key is not None:
+                    self.active[key] = handle
+                self._start(handle)
+                previous = None
+        
+        # 置き換えられた依頼は実行されないため、ここで終了として扱う
+        if previous is not None:
+            previous._mark_done()
+        return handle
+    
+    def _start(self, handle):
+        """ワーカースレッドでタスクを開始する"""
+        handle.future = self.pool.submit(self._run, handle)
+    
+    def _run(self, handle):
+        """ワーカースレッドでタスクを実行し、結果をキューに積む"""
+        error = None
+        result = None
+        
+        if not handle.cancelled.is_set():
+            if handle.exclusive:
+                self.rw_lock.acquire_write()
+            else:
+                self.rw_lock.acquire_read()
+            
+            try:
+                if not handle.cancelled.is_set():
+                    result = handle.task(*handle.args)
+            except Exception as e:
+                error = e
+            finally:
+                if handle.exclusive:
+                    self.rw_lock.release_write()
+                else:
+                    self.rw_lock.release_read()
+        
+        self.results.put((handle, result, error))
+    
+    def _finish(self, handle):
+        """完了したタスクのキーを解放し、統合された次の依頼があれば開始する"""
+        dropped = None
+        with self.lock:
+            if handle.key is None or self.active.get(handle.key) is not handle:
+                return
+            
+            queued = self.queued.pop(handle.key, None)
+            if queued is not None and not queued.cancelled.is_set():
+                # 統合された依頼を開始する（依頼が続いても表示が止まらないよう、この結果も届ける）
+                self.active[handle.key] = queued
+                self._start(queued)
+            else:
+                del self.active[handle.key]
+                dropped = queued
+        
+        # 取り消された待機中の依頼は実行されないため、ここで終了として扱う
+        if dropped is not None:
+            dropped._mark_done()
+    
+    def dispatch(self, on_error=None, limit=50):
+        """完了したタスクのコールバックを呼び出す（UIスレッドから呼ぶ）"""
+        for _ in range(limit):
+            try:
+                handle, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            
+            self._finish(handle)
+            handle._mark_done()
+            if handle.cancelled.is_set() or handle.generation != self.generation:
+                continue
+            
+            if error is not None:
+                if on_error:
+                    on_error(error)
+            elif handle.callback:
+                handle.callback(result)
+    
+    def cancel_all(self):
+        """待機中・実行中のすべてのタスクを取り消し、以降に届く古い結果を捨てる"""
+        with self.lock:
+            self.generation += 1
+            for handle in list(self.active.values()) + list(self.queued.values()):
+                handle.cancel()
+            dropped = list(self.queued.values())
+            self.queued.clear()
+        
+        # 待機中の依頼は実行されないため、ここで終了として扱う（実行中のものは dispatch() で扱う）
+        for handle in dropped:
+            handle._mark_done()
+    
+    def shutdown(self):
+        """エグゼキューターを終了する（実行中のタスクの完了は待たない）"""
+        self.cancel_all()
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,234 @@
+import io
+import os
+import json
+import base64
+import inspect
+import socket
+import socketserver
+import stat
+from background import ReadWriteLock
+
+
+class BatchSession:
+    """1つの Repository を使い回して、JSON で表したコマンドを次々に実行する
+    
+    リクエストは {"id": 任意, "command": "status", "args": {...}} の形で、
+    レスポンスは {"id": ..., "ok": true, "result": ...} または {"id": ..., "ok": false, "error": "..."} となる。
+    同じ Repository を使い続けるため、オブジェクト・インデックス・設定のキャッシュが効いた状態で実行される。
+    """
+    
+    def __init__(self, repo, lock=None):
+        """セッションを初期化する（lock を共有すると複数の接続から同時に使える）"""
+        self.repo = repo
+        self.lock = lock or ReadWriteLock()
+        # コマンド名: (処理する関数, リポジトリを変更するかどうか)
+        self.commands = {
+            'add': (self._add, True),
+            'commit': (self._commit, True),
+            'status': (self._status, False),
+            'log': (self._log, False),
+            'diff': (self._diff, False),
+            'branch': (self._branch, True),
+            'checkout': (self._checkout, True),
+            'reset': (self._reset, True),
+            'merge': (self._merge, True),
+            'cat-object': (self._cat_object, False),
+            'rev-parse': (self._rev_parse, False),
+            'config': (self._config, False)
+        }
+    
+    def execute(self, request):
+        """リクエストの辞書を実行し、レスポンスの辞書を返す"""
+        if not isinstance(request, dict):
+            return {'id': None, 'ok': False, 'error': "リクエストはJSONオブジェクトで指定してください"}
+        
+        request_id = request.get('id')
+        command = request.get('command')
+        args = request.get('args') or {}
+        
+        if command not in self.commands:
+            return {'id': request_id, 'ok': False, 'error': f"不明なコマンドです: {command}"}
+        if not isinstance(args, dict):
+            return {'id': request_id, 'ok': False, 'error': "args はJSONオブジェクトで指定してください"}
+        
+        handler, exclusive = self.commands[command]
+        try:
+            inspect.signature(handler).bind(**args)
+        except TypeError as e:
+            return {'id': request_id, 'ok': False, 'error': f"引数が正しくありません: {str(e)}"}
+        
+        if exclusive:
+            self.lock.acquire_write()
+        else:
+            self.lock.acquire_read()
+        
+        try:
+            success, result = handler(**args)
+        except Exception as e:
+            return {'id': request_id, 'ok': False, 'error': str(e)}
+        finally:
+            if exclusive:
+                self.lock.release_write()
+            else:
+                self.lock.release_read()
+        
+        if success:
+            return {'id': request_id, 'ok': True, 'result': result}
+        return {'id': request_id, 'ok': False, 'error': result}
+    
+    def execute_line(self, line):
+        """NDJSON の1行を実行し、レスポンスの辞書を返す"""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {'id': None, 'ok': False, 'error': f"JSONとして解析できません: {str(e)}"}
+        return self.execute(request)
+    
+    def serve(self, input_stream, output_stream):
+        """入力から1行ずつリクエストを読み、レスポンスを1行ずつ書き出す（入力の終わりまで続ける）"""
+        for line in input_stream:
+            if not line.strip():
+                continue
+            response = self.execute_line(line)
+            output_stream.write(json.dumps(response, ensure_ascii=False, default=str) + '\n')
+            output_stream.flush()
+    
+    def _add(self, path):
+        """ファイルを追加する"""
+        return self.repo.add(path)
+    
+    def _commit(self, message):
+        """コミットを作成する"""
+        return self.repo.commit(message)
+    
+    def _status(self, paths=None):
+        """ワーキングディレクトリの状態を取得する"""
+        return self.repo.status(paths)
+    
+    def _log(self, count=10, name_status=False, stat=False, renames=None):
+        """コミットログを取得する"""
+        return self.repo.log(count, name_status, renames, stat)
+    
+    def _diff(self, path=None, old=None, new=None, name_status=False, algorithm=None, context=None, renames=None):
+        """差分の行のリストを取得する（old と new を指定した場合はコミット間の差分）"""
+        if old is not None or new is not None:
+            return self.repo.diff_commits(old, new, name_status, algorithm, context, renames)
+        return self.repo.diff(path, algorithm, context)
+    
+    def _branch(self, name=None, delete=False):
+        """ブランチを一覧・作成・削除する"""
+        return self.repo.branch(name, delete)
+    
+    def _checkout(self, branch):
+        """ブランチをチェックアウトする"""
+        return self.repo.checkout(branch)
+    
+    def _reset(self, path=None, hard=False):
+        """インデックスまたはワーキングディレクトリをリセットする"""
+        return self.repo.reset(path, hard)
+    
+    def _merge(self, branch):
+        """ブランチをマージする"""
+        return self.repo.merge(branch)
+    
+    def _cat_object(self, object_id):
+        """オブジェクトの型と内容を取得する（UTF-8 として読めない内容は base64 で返す）"""
+        obj_type, data = self.repo.get_object(object_id)
+        if obj_type is None:
+            return False, f"オブジェクト {object_id} が見つかりません"
+        
+        try:
+            content, encoding = data.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            content, encoding = base64.b64encode(data).decode('ascii'), 'base64'
+        return True, {'id': object_id, 'type': obj_type, 'size': len(data), 'encoding': encoding, 'data': content}
+    
+    def _rev_parse(self, revision):
+        """リビジョン名をコミットのハッシュに解決する"""
+        commit_hash = self.repo.resolve_revision(revision)
+        if not commit_hash:
+            return False, f"リビジョン '{revision}' が見つかりません"
+        return True, commit_hash
+    
+    def _config(self):
+        """リポジトリの設定を取得する"""
+        return True, self.repo.get_config()
+
+
+class _BatchRequestHandler(socketserver.StreamRequestHandler):
+    """ソケットの接続ごとに NDJSON のリクエストを処理する"""
+    
+    def handle(self):
+        """接続が閉じられるまでリクエストを処理する"""
+        reader = io.TextIOWrapper(self.rfile, encoding='utf-8')
+        writer = io.TextIOWrapper(self.wfile, encoding='utf-8')
+        try:
+            self.server.session.serve(reader, writer)
+        except (ConnectionError, BrokenPipeError):
+            pass
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """接続ごとにスレッドで処理する TCP サーバー"""
+    
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """接続ごとにスレッドで処理する Unix ドメインソケットのサーバー"""
+        
+        daemon_threads = True
+else:
+    _ThreadingUnixServer = None
+
+
+def parse_address(address):
+    """待ち受けるアドレスを解析する（'HOST:PORT' または 'PORT' は TCP、それ以外は Unix ドメインソケットのパス）"""
+    host, _, port = address.rpartition(':')
+    if port.isdigit():
+        return 'tcp', (host or '127.0.0.1', int(port))
+    return 'unix', address
+
+
+def is_loopback_host(host):
+    """ホストがループバックアドレス（このマシンからしか接続できないアドレス）だけを指すかどうかを判定する"""
+    import ipaddress
+    
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        pass
+    
+    # ホスト名は解決したすべてのアドレスがループバックの場合だけ認める
+    try:
+        infos = socket.getaddrinfo(host, None, socket.AF_INET, socket.SOCK_STREAM)
+    except OSError:
+        return False
+    return bool(infos) and all(ipaddress.ip_address(info[4][0]).is_loopback for info in infos)
+
+
+def create_server(session, address, allow_remote=False):
+    """バッチセッションを提供するサーバーを作成する
+    
+    認証を行わず、リポジトリを変更するコマンドも実行できるため、TCP ではループバックアドレスだけで待ち受ける。
+    それ以外のアドレス（0.0.0.0 など）は allow_remote が真の場合だけ認め、そうでなければ ValueError を送出する。
+    """
+    kind, target = parse_address(address)
+    if kind == 'tcp':
+        if not allow_remote and not is_loopback_host(target[0]):
+            raise ValueError(
+                f"{target[0]} はループバックアドレスではありません。バッチモードは認証を行わないため、"
+                f"他のマシンから接続できるアドレスで待ち受けるには --allow-remote を指定してください"
+            )
+        server = _ThreadingTCPServer(target, _BatchRequestHandler)
+    else:
+        if _ThreadingUnixServer is None or not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("この環境では Unix ドメインソケットを使用できません。HOST:PORT を指定してください")
+        # 前回のサーバーが残したソケットファイルだけを削除する
+        if os.path.exists(target) and stat.S_ISSOCK(os.stat(target).st_mode):
+            os.unlink(target)
+        server = _ThreadingUnixServer(target, _BatchRequestHandler)
+    server.session = session
+    return server
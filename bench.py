@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from repository import Repository
+
+# 計測するシナリオ（実行順）
+SCENARIOS = [
+    'add_initial', 'commit_initial', 'status_clean', 'status_dirty', 'diff',
+    'add', 'commit', 'log', 'checkout', 'merge', 'startup'
+]
+
+# 起動時間の計測で実行するコマンド（リポジトリの大きさにほぼ依存しない軽い操作）
+STARTUP_COMMAND = ['branch']
+
+# 既定のリポジトリの形
+DEFAULT_SHAPE = {
+    'files': 1000,
+    'depth': 3,
+    'fanout': 8,
+    'min_size': 256,
+    'max_size': 64 * 1024,
+    'binary_ratio': 0.1,
+    'commits': 20,
+    'changes_per_commit': 20,
+    'seed': 0
+}
+
+# 回帰とみなす中央値の増加率の既定値
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+
+# これより小さい差は計測誤差として回帰とみなさない（秒）
+MIN_REGRESSION_DELTA = 0.005
+
+# テキストファイルの内容に使う単語
+WORDS = [
+    'alpha', 'beta', 'gamma', 'delta', 'commit', 'tree', 'blob', 'index', 'branch', 'merge',
+    'status', 'diff', 'value', 'return', 'import', 'class', 'def', 'self', 'data', 'path',
+    'config', 'object', 'hash', 'parent', 'author', 'message', 'file', 'line', 'update', 'cache'
+]
+
+
+class SyntheticRepository:
+    """決まった乱数の種から、指定した形のリポジトリを生成する
+    
+    同じ形と種からは常に同じファイル構成と内容が生成される（コミットのハッシュは日時を含むため異なる）。
+    """
+    
+    def __init__(self, path, shape=None):
+        """生成器を初期化する"""
+        self.path = Path(path)
+        self.shape = dict(DEFAULT_SHAPE, **(shape or {}))
+        self.rng = random.Random(self.shape['seed'])
+        self.repo = Repository(self.path)
+        self.files = []
+        self.binary = set()
+        self.counter = 0
+    
+    def _random_dir(self):
+        """ファイルを置くディレクトリを選ぶ"""
+        depth = self.rng.randint(0, self.shape['depth'])
+        parts = [f"d{self.rng.randrange(self.shape['fanout']):02d}" for _ in range(depth)]
+        return os.path.join(*parts) if parts else ''
+    
+    def _random_size(self):
+        """ファイルサイズを対数一様分布で選ぶ"""
+        low = max(1, self.shape['min_size'])
+        high = max(low, self.shape['max_size'])
+        return int(low * (high / low) ** self.rng.random())
+    
+    def _text(self, size):
+        """指定したサイズ程度のテキストを生成する"""
+        lines = []
+        length = 0
+        while length < size:
+            line = ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(3, 12)))
+            lines.append(line)
+            length += len(line) + 1
+        return ('\n'.join(lines) + '\n').encode()
+    
+    def _binary(self, size):
+        """指定したサイズのバイナリデータを生成する"""
+        return self.rng.getrandbits(size * 8).to_bytes(size, 'little') if size else b''
+    
+    def _write(self, rel_path, binary):
+        """ファイルの内容を生成して書き込む"""
+        size = self._random_size()
+        data = self._binary(size) if binary else self._text(size)
+        full_path = self.path / rel_path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_bytes(data)
+    
+    def _new_file(self):
+        """新しいファイルを作成し、相対パスを返す"""
+        binary = self.rng.random() < self.shape['binary_ratio']
+        rel_path = os.path.join(self._random_dir(), f"f{self.counter:06d}{'.bin' if binary else '.txt'}")
+        self.counter += 1
+        self._write(rel_path, binary)
+        self.files.append(rel_path)
+        if binary:
+            self.binary.add(rel_path)
+        return rel_path
+    
+    def init(self):
+        """リポジトリを初期化し、作業ファイルを生成する（まだ追加・コミットはしない）"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        success, message = self.repo.init()
+        if not success:
+            raise RuntimeError(message)
+        
+        config = self.repo.get_config()
+        config['user'] = {'name': 'bench', 'email': 'bench@example.com'}
+        self.repo.set_config(config)
+        
+        for _ in range(self.shape['files']):
+            self._new_file()
+    
+    def mutate(self, count, new_files=0):
+        """既存のファイルを count 個書き換え、new_files 個のファイルを追加する"""
+        changed = []
+        for rel_path in self.rng.sample(self.files, min(count, len(self.files))):
+            if rel_path in self.binary:
+                self._write(rel_path, True)
+            else:
+                with open(self.path / rel_path, 'ab') as f:
+                    f.write(self._text(self.rng.randint(20, 200)))
+            changed.append(rel_path)
+        
+        for _ in range(new_files):
+            changed.append(self._new_file())
+        return changed
+    
+    def commit_all(self, message):
+        """すべての変更を追加してコミットする"""
+        for operation, arg in ((self.repo.add, '.'), (self.repo.commit, message)):
+            success, result = operation(arg)
+            if not success:
+                raise RuntimeError(result)
+    
+    def build_history(self, commits=None):
+        """変更とコミットを繰り返して履歴を作る"""
+        changes = self.shape['changes_per_commit']
+        for number in range(commits if commits is not None else self.shape['commits']):
+            self.mutate(changes, new_files=max(1, changes // 10))
+            self.commit_all(f"合成コミット {number + 1}")
+    
+    def generate(self):
+        """作業ファイルと履歴を持つリポジトリを生成する"""
+        self.init()
+        self.commit_all("初期コミット")
+        self.build_history(max(0, self.shape['commits'] - 1))
+
+
+def summarize(runs):
+    """計測結果（秒）の一覧から統計値を求める"""
+    return {
+        'runs': runs,
+        'min': min(runs),
+        'median': statistics.median(runs),
+        'mean': statistics.mean(runs)
+    }
+
+
+def _timed(func, *args):
+    """関数を実行して経過時間（秒）を返す（失敗した場合は RuntimeError を送出する）"""
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    if isinstance(result, tuple) and result and result[0] is False:
+        raise RuntimeError(f"{getattr(func, '__name__', func)}: {result[1]}")
+    return elapsed
+
+
+def run_cli(cwd, args):
+    """別のプロセスで lvcs コマンドを実行する（起動時間の計測用。失敗した場合は RuntimeError を送出する）"""
+    env = dict(os.environ)
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_dir, env.get('PYTHONPATH')]))
+    
+    # -m で実行し、インストールされたコマンドと同じくバイトコードのキャッシュを使わせる
+    result = subprocess.run(
+        [sys.executable, '-m', 'cli'] + list(args),
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode(errors='replace'))
+
+
+def run_benchmarks(shape=None, scenarios=None, repeat=5, work_dir=None, on_result=None):
+    """合成リポジトリでシナリオを計測し、結果の辞書を返す
+    
+    work_dir を省略すると一時ディレクトリを使い、終了後に削除する。
+    on_result が指定されていれば、シナリオごとに (名前, 統計値) で呼ばれる。
+    """
+    selected = set(scenarios or SCENARIOS)
+    unknown = selected - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"不明なシナリオです: {', '.join(sorted(unknown))}")
+    
+    temporary = work_dir is None
+    path = Path(tempfile.mkdtemp(prefix='lvcs-bench-') if temporary else work_dir)
+    if (path / '.lvcs').exists():
+        raise ValueError(f"{path} にはすでにリポジトリがあります")
+    
+    synthetic = SyntheticRepository(path, shape)
+    repo = synthetic.repo
+    changes = synthetic.shape['changes_per_commit']
+    results = {}
+    
+    def record(name, runs):
+        if name not in selected:
+            return
+        results[name] = summarize(runs)
+        if on_result:
+            on_result(name, results[name])
+    
+    def measure(name, prepare, func, *args):
+        # 準備（計測外）と実行を repeat 回繰り返す。選択されていないシナリオは実行しない
+        if name not in selected:
+            return
+        runs = []
+        for number in range(repeat):
+            call_args = prepare(number) if prepare else args
+            runs.append(_timed(func, *call_args))
+        record(name, runs)
+    
+    try:
+        synthetic.init()
+        record('add_initial', [_timed(repo.add, '.')])
+        record('commit_initial', [_timed(repo.commit, "初期コミット")])
+        synthetic.build_history(max(0, synthetic.shape['commits'] - 1))
+        
+        measure('status_clean', None, repo.status)
+        
+        synthetic.mutate(changes, new_files=max(1, changes // 10))
+        measure('status_dirty', None, repo.status)
+        measure('diff', None, repo.diff)
+        
+        def prepare_add(number):
+            if number:
+                synthetic.mutate(changes)
+            return ('.',)
+        
+        measure('add', prepare_add, repo.add)
+        
+        def prepare_commit(number):
+            synthetic.mutate(changes)
+            repo.add('.')
+            return (f"計測コミット {number + 1}",)
+        
+        measure('commit', prepare_commit, repo.commit)
+        measure('log', None, repo.log, synthetic.shape['commits'] + repeat)
+        
+        if 'checkout' in selected:
+            # 多くのファイルが異なるブランチを作り、交互に切り替える
+            base_branch = repo.get_current_branch()
+            repo.branch('bench-feature')
+            repo.checkout('bench-feature')
+            synthetic.mutate(changes * 5, new_files=changes)
+            synthetic.commit_all("ブランチの変更")
+            repo.checkout(base_branch)
+            measure('checkout', lambda number: (base_branch if number % 2 else 'bench-feature',), repo.checkout)
+            repo.checkout(base_branch)
+        
+        def prepare_merge(number):
+            base_branch = repo.get_current_branch()
+            branch_name = f"bench-merge-{number}"
+            repo.branch(branch_name)
+            repo.checkout(branch_name)
+            synthetic.mutate(changes)
+            synthetic.commit_all(f"マージ対象 {number + 1}")
+            repo.checkout(base_branch)
+            return (branch_name,)
+        
+        measure('merge', prepare_merge, repo.merge)
+        measure('startup', None, run_cli, path, STARTUP_COMMAND)
+    finally:
+        if temporary:
+            shutil.rmtree(path, ignore_errors=True)
+    
+    return {
+        'shape': synthetic.shape,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scenarios': results
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """基準の結果と中央値を比較し、threshold を超えて遅くなったシナリオの一覧を返す"""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base or not base['median']:
+            continue
+        
+        ratio = current['median'] / base['median']
+        if ratio > 1 + threshold and current['median'] - base['median'] > MIN_REGRESSION_DELTA:
+            regressions.append({
+                'scenario': name,
+                'baseline': base['median'],
+                'current': current['median'],
+                'ratio': ratio
+            })
+    return regressions
+
+
+def load_results(path):
+    """保存した計測結果を読み込む"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    """計測結果をJSONで保存する"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,193 @@
+import os
+import json
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Windowsではfcntlが利用できないため、reflinkは使用しない
+    fcntl = None
+
+# Linuxの ioctl(FICLONE) 番号（Btrfs、XFS などのコピーオンライト対応ファイルシステム用）
+FICLONE = 0x40049409
+
+
+class BlobCache:
+    """大きなblobの非圧縮コピーをハッシュ単位で保持するキャッシュ"""
+    
+    def __init__(self, cache_dir, threshold=1024 * 1024, max_size=1024 * 1024 * 1024, hardlink=False):
+        """キャッシュを初期化する"""
+        self.cache_dir = Path(cache_dir)
+        self.manifest_file = self.cache_dir / 'manifest.json'
+        self.threshold = threshold
+        self.max_size = max_size
+        self.hardlink = hardlink
+        self.manifest = None
+        self.dirty = False
+    
+    def _load_manifest(self):
+        """キャッシュのマニフェストを読み込む"""
+        if self.manifest is not None:
+            return self.manifest
+        
+        self.manifest = {}
+        if self.manifest_file.exists():
+            try:
+                with open(self.manifest_file, 'r') as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                # 壊れたマニフェストは作り直す
+                self.manifest = {}
+        
+        return self.manifest
+    
+    def _entry_path(self, sha1):
+        """キャッシュファイルのパスを返す"""
+        return self.cache_dir / sha1[:2] / sha1[2:]
+    
+    def lookup(self, sha1):
+        """有効なキャッシュファイルのパスを返す（存在しない場合はNone）"""
+        manifest = self._load_manifest()
+        entry = manifest.get(sha1)
+        if not entry:
+            return None
+        
+        path = self._entry_path(sha1)
+        try:
+            stat = path.stat()
+        except OSError:
+            stat = None
+        
+        # ハードリンク先が直接編集された場合などは内容が信用できないため破棄する
+        if stat is None or stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime_ns']:
+            self._discard(sha1)
+            return None
+        
+        entry['last_used'] = time.time()
+        self.dirty = True
+        return path
+    
+    def store(self, sha1, data):
+        """blobの非圧縮データをキャッシュに保存する"""
+        manifest = self._load_manifest()
+        path = self._entry_path(sha1)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        
+        stat = path.stat()
+        manifest[sha1] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'last_used': time.time()
+        }
+        self.dirty = True
+        return path
+    
+    def place(self, sha1, dest_path):
+        """キャッシュからファイルを配置する（キャッシュにない場合はFalse）"""
+        src_path = self.lookup(sha1)
+        if src_path is None:
+            return False
+        
+        dest_path = Path(dest_path)
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # すでに同じキャッシュファイルへのハードリンクであれば何もしない
+        try:
+            if dest_path.exists() and os.path.samefile(src_path, dest_path):
+                return True
+        except OSError:
+            pass
+        
+        # 別のキャッシュファイルと共有しているinodeを上書きしないよう、先に切り離す
+        unlink_if_shared(dest_path)
+        
+        if self._reflink(src_path, dest_path):
+            return True
+        if self.hardlink and self._hardlink(src_path, dest_path):
+            return True
+        
+        # shutil は起動時に読み込まないよう、コピーが必要になったときだけ読み込む
+        import shutil
+        shutil.copyfile(src_path, dest_path)
+        return True
+    
+    def _reflink(self, src_path, dest_path):
+        """コピーオンライトのクローンを作成する"""
+        if fcntl is None:
+            return False
+        
+        try:
+            with open(src_path, 'rb') as src, open(dest_path, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError:
+            return False
+    
+    def _hardlink(self, src_path, dest_path):
+        """ハードリンクでファイルを配置する"""
+        tmp_path = dest_path.with_name(dest_path.name + '.lvcs-link')
+        try:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            os.link(src_path, tmp_path)
+            os.replace(tmp_path, dest_path)
+            return True
+        except OSError:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            return False
+    
+    def _discard(self, sha1):
+        """キャッシュエントリを削除する"""
+        manifest = self._load_manifest()
+        entry = manifest.pop(sha1, None)
+        
+        path = self._entry_path(sha1)
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        
+        self.dirty = True
+        return entry['size'] if entry else 0
+    
+    def evict(self):
+        """最大サイズを超えた分を、最も長く使われていないエントリから削除する"""
+        manifest = self._load_manifest()
+        total = sum(entry['size'] for entry in manifest.values())
+        
+        for sha1, entry in sorted(manifest.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_size:
+                break
+            total -= self._discard(sha1)
+        
+        return total
+    
+    def save(self):
+        """LRU削除を行い、マニフェストを保存する"""
+        if not self.dirty:
+            return
+        
+        self.evict()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        tmp_path = self.manifest_file.with_name('manifest.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_file)
+        self.dirty = False
+
+
+def unlink_if_shared(path):
+    """ハードリンクで共有されているファイルを削除する（上書き前の保護用）"""
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.unlink(path)
+    except OSError:
+        pass
@@ -1,84 +1,257 @@
 import os
 import sys
+import json
+import signal
 import argparse
-from pathlib import Path
-from repository import Repository
+import contextlib
+
+# 起動を速くするため、リポジトリ操作・計測・ベンチマークのモジュールは使用するコマンドの中で読み込む
+
+
+# サブコマンドとその説明（引数の定義は実行するコマンドの分だけ作成する）
+COMMANDS = {
+    'init': '新しいリポジトリを初期化',
+    'config': 'リポジトリの設定を変更',
+    'add': 'ファイルをステージングエリアに追加',
+    'commit': 'ステージングされた変更をコミット',
+    'status': 'リポジトリの状態を表示',
+    'log': 'コミット履歴を表示',
+    'diff': '変更の差分を表示',
+    'branch': 'ブランチを作成、削除、または一覧表示',
+    'checkout': 'ブランチをチェックアウト',
+    'reset': 'ファイルをリセットまたはインデックスをクリア',
+    'merge': '指定したブランチを現在のブランチにマージ',
+    'sparse-checkout': '作業対象のディレクトリを限定（スパースチェックアウト）',
+    'gc': '到達できない古いオブジェクトを削除',
+    'maintenance': 'リポジトリのメンテナンス（不要なオブジェクトの削除）を実行',
+    'fsck': 'オブジェクトの破損と参照切れを検査',
+    'cat-object': 'オブジェクトの型・サイズ・内容を表示（--batch で標準入力のIDを続けて処理）',
+    'bench': '合成リポジトリで性能を計測',
+    'batch': '標準入力の NDJSON のコマンドを1つのプロセスで続けて実行'
+}
+
+# 値を取るグローバルオプション（コマンド名を探すときに値を読み飛ばす）
+GLOBAL_OPTIONS_WITH_VALUE = ('--trace', '--cprofile')
+
+# status・log・diff の出力形式（ndjson は1行に1つの JSON、porcelain は色を付けないスクリプト向けの形式）
+OUTPUT_FORMATS = ('text', 'ndjson', 'porcelain')
+
+# status --porcelain で表示する状態の記号（左がインデックス、右がワーキングディレクトリ）
+STATUS_PORCELAIN_CODES = {
+    'staged': 'M ',
+    'modified': ' M',
+    'deleted': ' D',
+    'renamed': ' R',
+    'untracked': '??'
+}
+
+# cat-object --batch --unordered で、まとめて並べ替えてから読み込むIDの数
+CAT_OBJECT_GROUP_SIZE = 4096
+
+# プロセス内で見つけたリポジトリのルート（カレントディレクトリごと）
+_repo_root_cache = {}
+
 
 class CLI:
     """バージョン管理システムのコマンドラインインターフェース"""
     
     def __init__(self):
-        """CLIを初期化"""
-        self.parser = self._create_parser()
+        """CLIを初期化（パーサーは実行時に、指定されたコマンドの分だけ作成する）"""
+        self.parser = None
         self.repo = None
+        self.progress_shown = False
+        self.metrics = None
+    
+    def _peek_command(self, args):
+        """引数からサブコマンド名を探す（見つからない場合は None）"""
+        skip = False
+        for arg in args:
+            if skip:
+                skip = False
+            elif arg in GLOBAL_OPTIONS_WITH_VALUE:
+                skip = True
+            elif not arg.startswith('-'):
+                return arg if arg in COMMANDS else None
+        return None
     
-    def _create_parser(self):
-        """コマンドラインパーサーを作成"""
+    def _create_parser(self, command=None):
+        """コマンドラインパーサーを作成（command を指定した場合は、そのサブコマンドだけを定義する）"""
         parser = argparse.ArgumentParser(
             description='ローカルバージョン管理システム（LVCS）',
             prog='lvcs'
         )
+        parser.add_argument('--profile', action='store_true',
+                            help='フェーズ別の時間とカウンターを標準エラー出力に表示（環境変数 LVCS_TRACE=1 と同じ）')
+        parser.add_argument('--trace', metavar='FILE',
+                            help='Chrome のトレースイベント形式（JSON）で計測結果を保存（LVCS_TRACE=FILE と同じ）')
+        parser.add_argument('--cprofile', metavar='FILE', help='cProfile の結果を保存（- の場合は上位を表示）')
+        parser.add_argument('--tracemalloc', action='store_true', help='メモリ割り当ての多い箇所とピーク使用量を表示')
         
         subparsers = parser.add_subparsers(dest='command', help='使用可能なコマンド')
         
-        # 初期化コマンド
-        init_parser = subparsers.add_parser('init', help='新しいリポジトリを初期化')
-        
-        # 設定コマンド
-        config_parser = subparsers.add_parser('config', help='リポジトリの設定を変更')
-        config_parser.add_argument('--name', help='ユーザー名を設定')
-        config_parser.add_argument('--email', help='メールアドレスを設定')
-        config_parser.add_argument('--list', action='store_true', help='現在の設定を表示')
-        
-        # 追加コマンド
-        add_parser = subparsers.add_parser('add', help='ファイルをステージングエリアに追加')
-        add_parser.add_argument('path', help='追加するファイルまたはディレクトリのパス')
-        
-        # コミットコマンド
-        commit_parser = subparsers.add_parser('commit', help='ステージングされた変更をコミット')
-        commit_parser.add_argument('-m', '--message', required=True, help='コミットメッセージ')
-        
-        # ステータスコマンド
-        status_parser = subparsers.add_parser('status', help='リポジトリの状態を表示')
-        
-        # ログコマンド
-        log_parser = subparsers.add_parser('log', help='コミット履歴を表示')
-        log_parser.add_argument('-n', '--count', type=int, default=10, help='表示するコミット数')
-        
-        # 差分コマンド
-        diff_parser = subparsers.add_parser('diff', help='変更の差分を表示')
-        diff_parser.add_argument('path', nargs='?', help='差分を表示するファイルのパス（指定しない場合はすべての変更）')
-        
-        # ブランチコマンド
-        branch_parser = subparsers.add_parser('branch', help='ブランチを作成、削除、または一覧表示')
-        branch_parser.add_argument('name', nargs='?', help='作成または削除するブランチ名')
-        branch_parser.add_argument('-d', '--delete', action='store_true', help='指定されたブランチを削除')
-        
-        # チェックアウトコマンド
-        checkout_parser = subparsers.add_parser('checkout', help='ブランチをチェックアウト')
-        checkout_parser.add_argument('branch', help='チェックアウトするブランチ名')
+        for name, help_text in COMMANDS.items():
+            if command is not None and name != command:
+                continue
+            
+            command_parser = subparsers.add_parser(name, help=help_text)
+            add_arguments = getattr(self, f"_add_{name.replace('-', '_')}_arguments", None)
+            if add_arguments:
+                add_arguments(command_parser)
         
-        # リセットコマンド
-        reset_parser = subparsers.add_parser('reset', help='ファイルをリセットまたはインデックスをクリア')
-        reset_parser.add_argument('path', nargs='?', help='リセットするファイルのパス（指定しない場合はすべての変更）')
-        reset_parser.add_argument('--hard', action='store_true', help='ハードリセットを実行（ファイルも変更）')
+        return parser
+    
+    def _add_config_arguments(self, parser):
+        """設定コマンドの引数を定義"""
+        parser.add_argument('--name', help='ユーザー名を設定')
+        parser.add_argument('--email', help='メールアドレスを設定')
+        parser.add_argument('--list', action='store_true', help='現在の設定を表示')
+        parser.add_argument('--set', nargs=2, action='append', metavar=('KEY', 'VALUE'),
+                            help='任意の設定項目を変更（例: --set blobcache.enabled true）')
+    
+    def _add_add_arguments(self, parser):
+        """追加コマンドの引数を定義"""
+        parser.add_argument('path', help='追加するファイルまたはディレクトリのパス')
+    
+    def _add_commit_arguments(self, parser):
+        """コミットコマンドの引数を定義"""
+        parser.add_argument('-m', '--message', required=True, help='コミットメッセージ')
+    
+    def _add_status_arguments(self, parser):
+        """ステータスコマンドの引数を定義"""
+        self._add_format_arguments(parser)
+    
+    def _add_log_arguments(self, parser):
+        """ログコマンドの引数を定義"""
+        parser.add_argument('-n', '--count', type=int, default=10, help='表示するコミット数')
+        parser.add_argument('--name-status', action='store_true',
+                            help='各コミットで変更されたファイル名と状態（A/M/D/R/C）を表示')
+        parser.add_argument('--stat', action='store_true', help='各コミットで変更されたファイルと行数を表示')
+        self._add_rename_arguments(parser)
+        self._add_format_arguments(parser)
+    
+    def _add_diff_arguments(self, parser):
+        """差分コマンドの引数を定義"""
+        from diff_engine import ALGORITHMS
         
-        # マージコマンド
-        merge_parser = subparsers.add_parser('merge', help='指定したブランチを現在のブランチにマージ')
-        merge_parser.add_argument('branch', help='マージするブランチ名')
+        parser.add_argument('targets', nargs='*', metavar='path|commit',
+                            help='差分を表示するファイルのパス（指定しない場合はすべての変更）、'
+                                 'または比較する2つのコミット/ブランチ')
+        parser.add_argument('--name-status', action='store_true',
+                            help='コミット間の差分で、変更されたファイル名と状態（A/M/D/R/C）のみを表示')
+        parser.add_argument('--stat', action='store_true',
+                            help='コミット間の差分で、変更されたファイルと行数のみを表示')
+        parser.add_argument('--diff-algorithm', choices=ALGORITHMS,
+                            help='差分アルゴリズム（指定しない場合は設定 diff.algorithm）')
+        parser.add_argument('-U', '--unified', type=int, metavar='N',
+                            help='変更箇所の前後に表示する行数（指定しない場合は設定 diff.context）')
+        self._add_rename_arguments(parser)
+        self._add_format_arguments(parser)
+    
+    def _add_branch_arguments(self, parser):
+        """ブランチコマンドの引数を定義"""
+        parser.add_argument('name', nargs='?', help='作成または削除するブランチ名')
+        parser.add_argument('-d', '--delete', action='store_true', help='指定されたブランチを削除')
+    
+    def _add_checkout_arguments(self, parser):
+        """チェックアウトコマンドの引数を定義"""
+        parser.add_argument('branch', help='チェックアウトするブランチ名')
+    
+    def _add_reset_arguments(self, parser):
+        """リセットコマンドの引数を定義"""
+        parser.add_argument('path', nargs='?', help='リセットするファイルのパス（指定しない場合はすべての変更）')
+        parser.add_argument('--hard', action='store_true', help='ハードリセットを実行（ファイルも変更）')
+    
+    def _add_merge_arguments(self, parser):
+        """マージコマンドの引数を定義"""
+        parser.add_argument('branch', help='マージするブランチ名')
+    
+    def _add_sparse_checkout_arguments(self, parser):
+        """スパースチェックアウトコマンドの引数を定義"""
+        parser.add_argument('action', choices=['set', 'add', 'list', 'disable'], help='実行する操作')
+        parser.add_argument('paths', nargs='*', help='対象とするディレクトリ（set/add のとき）')
+    
+    def _add_gc_arguments(self, parser):
+        """ガベージコレクションコマンドの引数を定義"""
+        parser.add_argument('--expire', type=float, metavar='DAYS',
+                            help='これより前に書き込まれたオブジェクトだけを削除（日数。指定しない場合は設定 gc.pruneexpire）')
+        parser.add_argument('-n', '--dry-run', action='store_true', help='削除せずに、削除されるオブジェクトの数とサイズを表示')
+    
+    def _add_maintenance_arguments(self, parser):
+        """メンテナンスコマンドの引数を定義"""
+        parser.add_argument('action', choices=['run', 'status'], help='実行する操作')
+        parser.add_argument('--auto', action='store_true', help='設定 maintenance.* の目安を超えている場合だけ実行')
+    
+    def _add_fsck_arguments(self, parser):
+        """検査コマンドの引数を定義"""
+        parser.add_argument('--reachable', action='store_true',
+                            help='ブランチ・HEAD・インデックスから到達可能なオブジェクトだけを検査')
+        parser.add_argument('-j', '--jobs', type=int, help='並列に検査するプロセス数（既定値はCPU数）')
+    
+    def _add_cat_object_arguments(self, parser):
+        """オブジェクト表示コマンドの引数を定義"""
+        parser.add_argument('object', nargs='?', help='表示するオブジェクトのID、またはブランチ名・コミットハッシュ')
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('-t', dest='show_type', action='store_true', help='型のみを表示')
+        mode.add_argument('-s', dest='show_size', action='store_true', help='サイズのみを表示')
+        mode.add_argument('--batch', action='store_true',
+                          help='標準入力から1行ずつIDを読み、"<id> <type> <size>" の行と内容を出力')
+        mode.add_argument('--batch-check', action='store_true',
+                          help='標準入力から1行ずつIDを読み、"<id> <type> <size>" の行のみを出力')
+        parser.add_argument('--unordered', action='store_true',
+                            help='IDを並べ替えてから読み込む（出力も並べ替えた順になる）')
+        parser.add_argument('--buffer', action='store_true',
+                            help='1件ごとに出力をフラッシュしない（パイプで大量に読み出す場合）')
+    
+    def _add_batch_arguments(self, parser):
+        """バッチコマンドの引数を定義"""
+        parser.add_argument('--listen', metavar='ADDRESS',
+                            help='標準入力の代わりにソケットで待ち受ける（Unix ドメインソケットのパス、または HOST:PORT）。'
+                                 'TCP はループバックアドレス（127.0.0.1・localhost）だけを受け付ける')
+        parser.add_argument('--allow-remote', action='store_true',
+                            help='ループバック以外のアドレス（0.0.0.0 など）での待ち受けを許可する。'
+                                 '認証を行わないため、接続できる誰もがリポジトリを変更できる')
+    
+    def _add_bench_arguments(self, parser):
+        """ベンチマークコマンドの引数を定義"""
+        from bench import SCENARIOS, DEFAULT_SHAPE, DEFAULT_REGRESSION_THRESHOLD
         
-        return parser
+        parser.add_argument('--files', type=int, default=DEFAULT_SHAPE['files'], help='ファイル数')
+        parser.add_argument('--depth', type=int, default=DEFAULT_SHAPE['depth'], help='ディレクトリの最大の深さ')
+        parser.add_argument('--min-size', type=int, default=DEFAULT_SHAPE['min_size'], help='ファイルの最小サイズ（バイト）')
+        parser.add_argument('--max-size', type=int, default=DEFAULT_SHAPE['max_size'], help='ファイルの最大サイズ（バイト）')
+        parser.add_argument('--binary-ratio', type=float, default=DEFAULT_SHAPE['binary_ratio'], help='バイナリファイルの割合（0〜1）')
+        parser.add_argument('--commits', type=int, default=DEFAULT_SHAPE['commits'], help='履歴のコミット数')
+        parser.add_argument('--changes', type=int, default=DEFAULT_SHAPE['changes_per_commit'], help='1コミットで変更するファイル数')
+        parser.add_argument('--seed', type=int, default=DEFAULT_SHAPE['seed'], help='乱数の種')
+        parser.add_argument('--repeat', type=int, default=5, help='各シナリオの実行回数')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='計測するシナリオ（複数指定可、省略時はすべて）')
+        parser.add_argument('--output', help='計測結果を保存するJSONファイル')
+        parser.add_argument('--baseline', help='比較する基準の計測結果（JSONファイル）')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                            help='回帰とみなす中央値の増加率（既定: 0.2 = 20%%）')
+        parser.add_argument('--json', action='store_true', help='計測結果をJSONで標準出力に表示')
+        parser.add_argument('--keep', metavar='DIR', help='合成リポジトリを一時ディレクトリではなく DIR に作成して残す')
+        parser.add_argument('--generate', metavar='DIR', help='計測せずに DIR へ合成リポジトリを生成する')
     
     def _find_repo_root(self):
-        """カレントディレクトリから上位に向かってリポジトリのルートを探す"""
-        current_path = Path(os.getcwd())
+        """カレントディレクトリから上位に向かってリポジトリのルートを探す（結果はプロセス内でキャッシュする）"""
+        cwd = os.getcwd()
+        if cwd in _repo_root_cache:
+            return _repo_root_cache[cwd]
         
-        while current_path != current_path.parent:
-            if (current_path / '.lvcs').exists():
-                return current_path
-            current_path = current_path.parent
-            
-        return None
+        root = None
+        current_path = cwd
+        parent = os.path.dirname(current_path)
+        while current_path != parent:
+            if os.path.isdir(os.path.join(current_path, '.lvcs')):
+                root = current_path
+                break
+            current_path, parent = parent, os.path.dirname(parent)
+        
+        # 見つからなかった場合はキャッシュせず、あとで作成されたリポジトリも見つけられるようにする
+        if root is not None:
+            _repo_root_cache[cwd] = root
+        return root
     
     def _print_success(self, message):
         """成功メッセージを表示"""
@@ -88,6 +261,20 @@ class CLI:
         """エラーメッセージを表示"""
         print(f"\033[91mエラー: {message}\033[0m")
     
+    def _report_error(self, args, message):
+        """コマンドのエラーを表示する
+        
+        機械可読な形式では、出力を読むスクリプトが失敗を判別できるよう、
+        色を付けずに標準エラー出力に書き、終了コード1で終了する。
+        """
+        if args.format == 'text':
+            self._print_error(message)
+            return
+        self._clear_progress()
+        sys.stdout.flush()
+        print(f"エラー: {message}", file=sys.stderr)
+        sys.exit(1)
+    
     def _print_info(self, message):
         """情報メッセージを表示"""
         print(f"\033[94m{message}\033[0m")
@@ -96,13 +283,137 @@ class CLI:
         """警告メッセージを表示"""
         print(f"\033[93m{message}\033[0m")
     
+    def _format_bytes(self, size):
+        """バイト数を読みやすい単位で表す"""
+        for unit in ('B', 'KiB', 'MiB', 'GiB'):
+            if size < 1024 or unit == 'GiB':
+                return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+            size /= 1024
+    
+    def _clear_progress(self):
+        """表示中の進捗行を消す"""
+        if self.progress_shown:
+            sys.stderr.write("\r\033[K")
+            sys.stderr.flush()
+            self.progress_shown = False
+    
+    @contextlib.contextmanager
+    def _progress(self):
+        """進捗行の表示（端末の場合のみ）と、Ctrl+C による操作の取り消しを設定"""
+        from repository import Progress, CancelToken, PROGRESS_PHASES
+        
+        token = CancelToken()
+        
+        def report(phase, done, total, bytes_done):
+            label = PROGRESS_PHASES.get(phase, phase)
+            text = f"{label}: {done}/{total} ({done * 100 // total}%)" if total else f"{label}: {done}"
+            if bytes_done:
+                text += f", {self._format_bytes(bytes_done)}"
+            sys.stderr.write(f"\r\033[K{text}")
+            sys.stderr.flush()
+            self.progress_shown = True
+        
+        def on_interrupt(signum, frame):
+            # 1回目は安全に取り消し、2回目は強制的に中断する
+            if token.cancelled:
+                raise KeyboardInterrupt
+            token.cancel()
+        
+        previous = signal.signal(signal.SIGINT, on_interrupt)
+        try:
+            yield Progress(report if sys.stderr.isatty() else None, token)
+        finally:
+            signal.signal(signal.SIGINT, previous)
+            self._clear_progress()
+    
     def run(self, args=None):
         """CLIを実行"""
+        if args is None:
+            args = sys.argv[1:]
+        self.parser = self._create_parser(self._peek_command(args))
         args = self.parser.parse_args(args)
         
+        with self._profiling(args):
+            self._dispatch(args)
+    
+    @contextlib.contextmanager
+    def _profiling(self, args):
+        """--profile / --trace / --cprofile / --tracemalloc と LVCS_TRACE に応じてコマンドを計測する"""
+        # LVCS_TRACE は 1 ならフェーズ別の表示、それ以外の値ならトレースの保存先として扱う
+        trace_env = os.environ.get('LVCS_TRACE', '')
+        env_summary = trace_env.lower() in ('1', 'true', 'summary')
+        summary = args.profile or env_summary
+        trace_file = args.trace or (trace_env if trace_env not in ('', '0') and not env_summary else None)
+        
+        if summary or trace_file:
+            from metrics import Metrics
+            self.metrics = Metrics(trace=bool(trace_file))
+        profiler = None
+        if args.cprofile:
+            import cProfile
+            profiler = cProfile.Profile()
+        if args.tracemalloc:
+            import tracemalloc
+            tracemalloc.start()
+        
+        try:
+            if profiler:
+                profiler.enable()
+            with self.metrics.phase(args.command or 'lvcs') if self.metrics else contextlib.nullcontext():
+                yield
+        finally:
+            if profiler:
+                profiler.disable()
+            self._clear_progress()
+            self._report_profiling(args, profiler, summary, trace_file)
+    
+    def _report_profiling(self, args, profiler, summary, trace_file):
+        """計測結果を表示・保存する"""
+        if self.metrics and summary:
+            for line in self.metrics.format_summary():
+                print(line, file=sys.stderr)
+        
+        if self.metrics and trace_file:
+            try:
+                self.metrics.write_chrome_trace(trace_file)
+                print(f"トレースを {trace_file} に保存しました", file=sys.stderr)
+            except OSError as e:
+                print(f"トレースを保存できません: {str(e)}", file=sys.stderr)
+        
+        if profiler and args.cprofile == '-':
+            import pstats
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(30)
+        elif profiler:
+            profiler.dump_stats(args.cprofile)
+            print(f"プロファイルを {args.cprofile} に保存しました（python -m pstats で表示できます）", file=sys.stderr)
+        
+        if args.tracemalloc:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"メモリ使用量: 現在 {self._format_bytes(current)}、ピーク {self._format_bytes(peak)}", file=sys.stderr)
+            for stat in snapshot.statistics('lineno')[:10]:
+                print(f"  {stat}", file=sys.stderr)
+    
+    def _dispatch(self, args):
+        """サブコマンドを実行"""
+        if args.command is None:
+            self.parser.print_help()
+            return
+        
+        if args.command == 'bench':
+            # ベンチマークは合成リポジトリで実行するため、既存のリポジトリは不要
+            self._handle_bench(args)
+            return
+        
+        from repository import Repository
+        
         if args.command == 'init':
             # カレントディレクトリで新しいリポジトリを初期化
             self.repo = Repository(os.getcwd())
+            if self.metrics:
+                self.repo.metrics = self.metrics
             success, message = self.repo.init()
             
             if success:
@@ -119,6 +430,8 @@ class CLI:
             sys.exit(1)
             
         self.repo = Repository(repo_root)
+        if self.metrics:
+            self.repo.metrics = self.metrics
         
         # コマンドを実行
         if args.command == 'config':
@@ -141,9 +454,88 @@ class CLI:
             self._handle_reset(args)
         elif args.command == 'merge':
             self._handle_merge(args)
+        elif args.command == 'sparse-checkout':
+            self._handle_sparse_checkout(args)
+        elif args.command == 'gc':
+            self._handle_gc(args)
+        elif args.command == 'maintenance':
+            self._handle_maintenance(args)
+        elif args.command == 'fsck':
+            self._handle_fsck(args)
+        elif args.command == 'cat-object':
+            self._handle_cat_object(args)
+        elif args.command == 'batch':
+            self._handle_batch(args)
         else:
             self.parser.print_help()
     
+    def _add_rename_arguments(self, parser):
+        """名前変更・コピー検出のオプションを追加"""
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--no-renames', dest='renames', action='store_false', default=None,
+                           help='名前変更を検出しない（指定しない場合は設定 diff.renames）')
+        group.add_argument('-C', '--find-copies', dest='renames', action='store_const', const='copies',
+                           help='名前変更に加えて、変更されたファイルからのコピーも検出')
+    
+    def _add_format_arguments(self, parser):
+        """出力形式のオプションを追加"""
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--format', choices=OUTPUT_FORMATS, default='text',
+                           help='出力形式（ndjson はファイルまたはコミットごとに1行の JSON）')
+        group.add_argument('--porcelain', dest='format', action='store_const', const='porcelain',
+                           help='色を付けない、スクリプト向けの安定した形式で出力（--format=porcelain と同じ）')
+    
+    def _discard_stdout(self):
+        """読み手が先に終了した場合に、残りの出力を捨てて静かに終了できるようにする"""
+        sys.stdout = open(os.devnull, 'w')
+    
+    def _write_records(self, records, output_format, format_line):
+        """レコードを1件ずつ NDJSON または format_line で整形した行として書き出す
+        
+        レコードは生成され次第書き出すが、print は使わずに標準出力のバッファーにまとめて書く。
+        エラーは標準出力のレコードと混ざらないよう標準エラー出力に書き、終了コード1で終了する。
+        """
+        write = sys.stdout.write
+        try:
+            for record in records:
+                self._clear_progress()
+                if output_format == 'ndjson':
+                    write(json.dumps(record, ensure_ascii=False) + '\n')
+                else:
+                    write(format_line(record))
+            sys.stdout.flush()
+        except BrokenPipeError:
+            self._discard_stdout()
+        except Exception as e:
+            self._clear_progress()
+            sys.stdout.flush()
+            print(f"エラー: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+    
+    def _format_status_porcelain(self, record):
+        """status --porcelain の1行を作成する"""
+        code = STATUS_PORCELAIN_CODES[record['state']]
+        if record['state'] == 'renamed':
+            return f"{code} {record['old_path']} -> {record['path']}\n"
+        return f"{code} {record['path']}\n"
+    
+    def _format_log_porcelain(self, entry):
+        """log --porcelain のコミット1件分の行を作成する（変更ファイルは ':' で始まる行）"""
+        subject = entry['message'].split('\n', 1)[0]
+        lines = [f"{entry['hash']}\t{' '.join(entry['parents'])}\t{entry['author']}\t{entry['date']}\t{subject}\n"]
+        for change in entry.get('changes', ()):
+            if change['status'][0] in 'RC':
+                lines.append(f":{change['status']}\t{change['old_path']}\t{change['path']}\n")
+            else:
+                lines.append(f":{change['status']}\t{change['path']}\n")
+        return ''.join(lines)
+    
+    def _format_numstat(self, stat):
+        """diff --stat --porcelain の1行（追加行数、削除行数、パス。バイナリは '-'）を作成する"""
+        if stat['binary']:
+            return f"-\t-\t{stat['path']}\n"
+        return f"{stat['added']}\t{stat['deleted']}\t{stat['path']}\n"
+    
     def _handle_config(self, args):
         """コンフィグコマンドを処理"""
         config = self.repo.get_config()
@@ -155,8 +547,40 @@ class CLI:
             print("現在の設定:")
             print(f"  user.name: {name}")
             print(f"  user.email: {email}")
+            for section, values in config.items():
+                if section == 'user' or not isinstance(values, dict):
+                    continue
+                for key, value in values.items():
+                    print(f"  {section}.{key}: {json.dumps(value)}")
             return
         
+        if args.set:
+            updated = []
+            for key, value in args.set:
+                if '.' not in key:
+                    self._print_error(f"設定キーは 'セクション.キー' の形式で指定してください: {key}")
+                    return
+                
+                section, name = key.split('.', 1)
+                try:
+                    # true/false や数値はJSONとして解釈する
+                    parsed = json.loads(value)
+                except ValueError:
+                    parsed = value
+                
+                config.setdefault(section, {})[name] = parsed
+                updated.append((key, value))
+            
+            try:
+                self.repo.set_config(config)
+            except ValueError as e:
+                self._print_error(str(e))
+                return
+            for key, value in updated:
+                self._print_success(f"{key} を {value} に設定しました")
+            if not (args.name or args.email):
+                return
+        
         if args.name or args.email:
             if 'user' not in config:
                 config['user'] = {}
@@ -175,10 +599,12 @@ class CLI:
     
     def _handle_add(self, args):
         """追加コマンドを処理"""
-        success, message = self.repo.add(args.path)
+        with self._progress() as progress:
+            success, message = self.repo.add(args.path, progress)
         
         if success:
             self._print_success(message)
+            self._maybe_start_maintenance()
         else:
             self._print_error(message)
     
@@ -188,15 +614,32 @@ class CLI:
         
         if success:
             self._print_success(message)
+            self._maybe_start_maintenance()
         else:
             self._print_error(message)
     
+    def _maybe_start_maintenance(self):
+        """オブジェクトが増えていれば、バックグラウンドでメンテナンスを開始"""
+        from maintenance import maybe_start_maintenance
+        
+        if maybe_start_maintenance(self.repo):
+            self._print_info("バックグラウンドでリポジトリのメンテナンスを開始しました")
+    
     def _handle_status(self, args):
         """ステータスコマンドを処理"""
-        success, status_info = self.repo.status()
+        if args.format != 'text':
+            # ファイルごとのレコードを、状態が分かり次第書き出す
+            with self._progress() as progress:
+                self._write_records(
+                    self.repo.iter_status(progress=progress), args.format, self._format_status_porcelain
+                )
+            return
+        
+        with self._progress() as progress:
+            success, status_info = self.repo.status(progress=progress)
         
         if not success:
-            self._print_error("リポジトリの状態を取得できませんでした")
+            self._print_error(f"リポジトリの状態を取得できませんでした: {status_info}")
             return
         
         branch = status_info['branch'] if status_info['branch'] else '（デタッチドHEAD）'
@@ -215,20 +658,45 @@ class CLI:
                 print(f"  {item}")
             print()
         
+        if status_info['renamed_files']:
+            print("名前変更されたファイル:")
+            for item in status_info['renamed_files']:
+                print(f"  {item['old_path']} → {item['path']} ({item['score']}%)")
+            print()
+        
+        if status_info['deleted_files']:
+            print("削除されたファイル:")
+            for item in status_info['deleted_files']:
+                print(f"  {item}")
+            print()
+        
         if status_info['untracked_files']:
             print("未追跡のファイル:")
             for item in status_info['untracked_files']:
                 print(f"  {item}")
             print()
             
-        if not (status_info['staged_changes'] or status_info['unstaged_changes'] or status_info['untracked_files']):
+        if not (status_info['staged_changes'] or status_info['unstaged_changes'] or status_info['untracked_files']
+                or status_info['deleted_files'] or status_info['renamed_files']):
             print("ワーキングディレクトリはクリーンです")
     
     def _handle_log(self, args):
         """ログコマンドを処理"""
-        success, log_entries = self.repo.log(args.count)
+        import itertools
         
-        if not success:
+        head = self.repo.resolve_revision('HEAD')
+        # コミットは読み込み次第表示し、一覧を作ってから表示することはしない
+        log_entries = itertools.islice(
+            self.repo.iter_log(head, args.name_status, args.renames, args.stat), args.count
+        ) if head else iter(())
+        
+        if args.format != 'text':
+            if args.stat and args.format == 'porcelain':
+                self._report_error(args, "--stat は --porcelain と同時に使用できません（--format=ndjson を使用してください）")
+            self._write_records(log_entries, args.format, self._format_log_porcelain)
+            return
+        
+        if not head:
             self._print_error("コミット履歴を取得できませんでした")
             return
         
@@ -239,27 +707,113 @@ class CLI:
             print()
             print(f"    {entry['message']}")
             print()
+            if args.name_status:
+                for change in entry['changes']:
+                    if change['status'][0] in 'RC':
+                        print(f"{change['status']}\t{change['old_path']}\t{change['path']}")
+                    else:
+                        print(f"{change['status']}\t{change['path']}")
+                print()
+            if args.stat:
+                self._print_stat(entry['stats'])
+                print()
             print("=" * 50)
     
+    def _print_stat(self, stats, width=40):
+        """ファイルごとの変更行数をグラフ付きで表示"""
+        names = []
+        for stat in stats:
+            if stat['old_path'] and stat['old_path'] != stat['path']:
+                names.append(f"{stat['old_path']} => {stat['path']}")
+            else:
+                names.append(stat['path'])
+        
+        name_width = max((len(name) for name in names), default=0)
+        max_changes = max((stat['added'] + stat['deleted'] for stat in stats), default=0)
+        count_width = len(str(max_changes))
+        
+        for name, stat in zip(names, stats):
+            if stat['binary']:
+                print(f" {name.ljust(name_width)} | バイナリ {stat['old_size']} → {stat['new_size']} バイト")
+                continue
+            
+            changes = stat['added'] + stat['deleted']
+            added, deleted = stat['added'], stat['deleted']
+            if max_changes > width:
+                # 最も大きな変更がグラフの幅に収まるよう縮小する（変更があれば最低1文字）
+                added = (added * width + max_changes - 1) // max_changes
+                deleted = (deleted * width + max_changes - 1) // max_changes
+            graph = f"\033[92m{'+' * added}\033[91m{'-' * deleted}\033[0m"
+            print(f" {name.ljust(name_width)} | {str(changes).rjust(count_width)} {graph}")
+        
+        total_added = sum(stat['added'] for stat in stats)
+        total_deleted = sum(stat['deleted'] for stat in stats)
+        print(f" {len(stats)} ファイル変更、{total_added} 行追加(+)、{total_deleted} 行削除(-)")
+    
     def _handle_diff(self, args):
         """差分コマンドを処理"""
-        success, diff_output = self.repo.diff(args.path)
+        with self._progress() as progress:
+            self._show_diff(args, progress)
+    
+    def _show_diff(self, args, progress):
+        """差分を表示"""
+        if len(args.targets) > 2:
+            self._report_error(args, "比較できるのは2つのコミットまでです")
+            return
         
-        if not success:
-            self._print_error("差分を取得できませんでした")
+        if args.stat and len(args.targets) != 2:
+            self._report_error(args, "--stat は2つのコミットを指定した場合のみ使用できます")
             return
         
-        for line in diff_output:
-            if line.startswith('+'):
-                print(f"\033[92m{line}\033[0m")
-            elif line.startswith('-'):
-                print(f"\033[91m{line}\033[0m")
-            elif line.startswith('@@'):
-                print(f"\033[96m{line}\033[0m")
-            elif line.startswith('---') or line.startswith('+++'):
-                print(f"\033[94m{line}\033[0m")
+        if args.stat:
+            success, stats = self.repo.diff_stat(args.targets[0], args.targets[1], args.diff_algorithm, args.renames)
+            if not success:
+                self._report_error(args, f"差分を取得できませんでした: {stats}")
+                return
+            if args.format == 'text':
+                self._print_stat(stats)
             else:
-                print(line)
+                self._write_records(stats, args.format, self._format_numstat)
+            return
+        
+        # NDJSON ではファイルごとのレコードを、それ以外では差分の行を生成する
+        if len(args.targets) == 2:
+            # コミット/ブランチ間の差分（チェックアウト不要）
+            iter_diff = self.repo.iter_diff_commit_files if args.format == 'ndjson' else self.repo.iter_diff_commits
+            diff_output = iter_diff(
+                args.targets[0], args.targets[1], args.name_status, args.diff_algorithm, args.unified, args.renames
+            )
+        elif args.name_status:
+            self._report_error(args, "--name-status は2つのコミットを指定した場合のみ使用できます")
+            return
+        else:
+            iter_diff = self.repo.iter_diff_files if args.format == 'ndjson' else self.repo.iter_diff
+            diff_output = iter_diff(
+                args.targets[0] if args.targets else None, args.diff_algorithm, context=args.unified,
+                progress=progress
+            )
+        
+        if args.format != 'text':
+            self._write_records(diff_output, args.format, lambda line: line + '\n')
+            return
+        
+        # 差分は計算され次第、ファイル単位で順に表示する（進捗行は出力の前に消す）
+        try:
+            for line in diff_output:
+                self._clear_progress()
+                if line.startswith('+'):
+                    print(f"\033[92m{line}\033[0m")
+                elif line.startswith('-'):
+                    print(f"\033[91m{line}\033[0m")
+                elif line.startswith('@@'):
+                    print(f"\033[96m{line}\033[0m")
+                elif line.startswith('---') or line.startswith('+++'):
+                    print(f"\033[94m{line}\033[0m")
+                else:
+                    print(line)
+        except Exception as e:
+            self._clear_progress()
+            self._print_error(f"差分を取得できませんでした: {str(e)}")
     
     def _handle_branch(self, args):
         """ブランチコマンドを処理"""
@@ -285,7 +839,8 @@ class CLI:
     
     def _handle_checkout(self, args):
         """チェックアウトコマンドを処理"""
-        success, message = self.repo.checkout(args.branch)
+        with self._progress() as progress:
+            success, message = self.repo.checkout(args.branch, progress)
         
         if success:
             self._print_success(message)
@@ -294,7 +849,8 @@ class CLI:
     
     def _handle_reset(self, args):
         """リセットコマンドを処理"""
-        success, message = self.repo.reset(args.path, args.hard)
+        with self._progress() as progress:
+            success, message = self.repo.reset(args.path, args.hard, progress)
         
         if success:
             self._print_success(message)
@@ -309,6 +865,284 @@ class CLI:
             self._print_success(message)
         else:
             self._print_error(message)
+    
+    def _handle_sparse_checkout(self, args):
+        """スパースチェックアウトコマンドを処理"""
+        patterns = self.repo.get_sparse_patterns()
+        
+        if args.action == 'list':
+            if patterns is None:
+                self._print_info("スパースチェックアウトは無効です")
+                return
+            for pattern in patterns:
+                print(pattern)
+            return
+        
+        if args.action == 'disable':
+            success, message = self.repo.sparse_checkout(disable=True)
+        elif args.action == 'add':
+            success, message = self.repo.sparse_checkout((patterns or []) + args.paths)
+        else:
+            success, message = self.repo.sparse_checkout(args.paths)
+        
+        if success:
+            self._print_success(message)
+        else:
+            self._print_error(message)
+    
+    def _handle_gc(self, args):
+        """ガベージコレクションコマンドを処理"""
+        with self._progress() as progress:
+            success, result = self.repo.gc(args.expire, args.dry_run, progress)
+        
+        if not success:
+            self._print_error(result)
+            sys.exit(1)
+        
+        size = self._format_bytes(result['pruned_bytes'])
+        if result['dry_run']:
+            self._print_info(f"{result['pruned']} 個のオブジェクト（{size}）が削除されます")
+        else:
+            self._print_success(f"{result['pruned']} 個のオブジェクトを削除しました（{size} を解放）")
+        print(f"到達可能: {result['reachable']} 個、調べたオブジェクト: {result['examined']} 個、"
+              f"猶予期間内のため残したもの: {result['kept_recent']} 個")
+    
+    def _handle_maintenance(self, args):
+        """メンテナンスコマンドを処理"""
+        import time
+        from maintenance import get_settings, estimate_loose_objects, needs_maintenance, read_state, run_maintenance
+        
+        if args.action == 'status':
+            settings = get_settings(self.repo)
+            state = read_state(self.repo)
+            print(f"自動実行: {'有効' if settings['auto'] else '無効'}")
+            print(f"ルーズオブジェクトの見積もり: {estimate_loose_objects(self.repo)} 個"
+                  f"（しきい値 {settings['looseobjects']} 個）")
+            if state.get('last_run'):
+                last_run = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(state['last_run']))
+                print(f"前回の実行: {last_run}（{state.get('duration', 0):.1f} 秒）")
+                if 'error' in state:
+                    print(f"前回のエラー: {state['error']}")
+                elif 'gc' in state:
+                    print(f"前回削除したオブジェクト: {state['gc']['pruned']} 個"
+                          f"（{self._format_bytes(state['gc']['pruned_bytes'])}）")
+            else:
+                print("前回の実行: なし")
+            return
+        
+        if args.auto and not needs_maintenance(self.repo):
+            self._print_info("メンテナンスは必要ありません")
+            return
+        
+        with self._progress() as progress:
+            success, result = run_maintenance(self.repo, progress)
+        
+        if not success:
+            self._print_error(result)
+            sys.exit(1)
+        self._print_success(f"メンテナンスが完了しました（{result['pruned']} 個のオブジェクト、"
+                            f"{self._format_bytes(result['pruned_bytes'])} を削除）")
+    
+    def _handle_fsck(self, args):
+        """検査コマンドを処理（問題が見つかった場合は終了コード1で終了）"""
+        from fsck import fsck
+        
+        with self._progress() as progress:
+            success, result = fsck(self.repo, args.reachable, args.jobs, progress)
+        
+        if not success:
+            self._print_error(result)
+            sys.exit(1)
+        
+        for problem in result['problems']:
+            print(f"{problem['type'] or '不明'} {problem['id']}: {problem['error']}")
+        
+        if result['problems']:
+            self._print_error(f"{result['checked']} 個のオブジェクトを検査し、{len(result['problems'])} 件の問題が見つかりました")
+            sys.exit(1)
+        self._print_success(f"{result['checked']} 個のオブジェクトを検査しました。問題は見つかりませんでした")
+    
+    def _handle_cat_object(self, args):
+        """オブジェクト表示コマンドを処理（内容はバイト列のまま標準出力に書く）"""
+        from repository import is_object_id
+        
+        if args.batch or args.batch_check:
+            if args.object:
+                self._print_error("--batch と --batch-check ではIDを標準入力から読み込みます")
+                sys.exit(1)
+            try:
+                self._cat_object_batch(args.batch_check, args.unordered, not args.buffer)
+            except BrokenPipeError:
+                self._discard_stdout()
+            return
+        
+        if not args.object:
+            self._print_error("オブジェクトのIDを指定してください")
+            sys.exit(1)
+        
+        object_id = args.object if is_object_id(args.object) else self.repo.resolve_revision(args.object)
+        try:
+            obj_type, data = self.repo.get_object(object_id) if object_id else (None, None)
+        except ValueError as e:
+            self._print_error(str(e))
+            sys.exit(1)
+        if obj_type is None:
+            self._print_error(f"オブジェクト '{args.object}' が見つかりません")
+            sys.exit(1)
+        
+        if args.show_type:
+            print(obj_type)
+        elif args.show_size:
+            print(len(data))
+        else:
+            sys.stdout.flush()
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+    
+    def _cat_object_batch(self, check_only, unordered, flush_each):
+        """標準入力のIDごとに "<id> <type> <size>" の行と内容（check_only でない場合）を標準出力に書く
+        
+        内容は解凍しながらそのまま書き出し、後に改行を1つ付ける。存在しないIDには "<id> missing" を出力する。
+        unordered の場合は CAT_OBJECT_GROUP_SIZE 件ずつIDを並べ替え、同じファンアウトディレクトリのオブジェクトを続けて読む。
+        """
+        import itertools
+        
+        out = sys.stdout.buffer
+        
+        def write_record(object_id):
+            if check_only:
+                obj_type, size = self.repo.read_object_header(object_id)
+                chunks = ()
+            else:
+                chunks = self.repo.open_object(object_id)
+                obj_type, size = next(chunks) if chunks is not None else (None, None)
+            
+            if obj_type is None:
+                out.write(f"{object_id} missing\n".encode())
+                return
+            
+            out.write(f"{object_id} {obj_type} {size}\n".encode())
+            if not check_only:
+                for chunk in chunks:
+                    out.write(chunk)
+                out.write(b'\n')
+        
+        def read_ids():
+            for line in sys.stdin.buffer:
+                object_id = line.strip().decode('utf-8', 'replace')
+                if object_id:
+                    yield object_id
+        
+        ids = read_ids()
+        try:
+            if unordered:
+                while True:
+                    group = sorted(itertools.islice(ids, CAT_OBJECT_GROUP_SIZE))
+                    if not group:
+                        break
+                    for object_id in group:
+                        write_record(object_id)
+                    out.flush()
+            else:
+                for object_id in ids:
+                    write_record(object_id)
+                    if flush_each:
+                        out.flush()
+        except ValueError as e:
+            # 壊れたオブジェクトがあると後続の出力を区切れないため、そこで終了する
+            out.flush()
+            print(f"エラー: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        out.flush()
+    
+    def _handle_batch(self, args):
+        """バッチコマンドを処理（結果は NDJSON で出力するため、メッセージは標準エラー出力に書く）"""
+        from batch import BatchSession, create_server
+        
+        session = BatchSession(self.repo)
+        if not args.listen:
+            session.serve(sys.stdin, sys.stdout)
+            return
+        
+        try:
+            server = create_server(session, args.listen, args.allow_remote)
+        except (OSError, ValueError) as e:
+            print(f"エラー: 待ち受けを開始できません: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        
+        print(f"{args.listen} で待ち受けています（Ctrl+C で終了）", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    
+    def _handle_bench(self, args):
+        """ベンチマークコマンドを処理"""
+        from bench import SyntheticRepository, run_benchmarks, compare, load_results, save_results
+        
+        shape = {
+            'files': args.files,
+            'depth': args.depth,
+            'min_size': args.min_size,
+            'max_size': args.max_size,
+            'binary_ratio': args.binary_ratio,
+            'commits': args.commits,
+            'changes_per_commit': args.changes,
+            'seed': args.seed
+        }
+        
+        if args.generate:
+            try:
+                SyntheticRepository(args.generate, shape).generate()
+            except (OSError, RuntimeError) as e:
+                self._print_error(f"リポジトリの生成に失敗しました: {str(e)}")
+                sys.exit(1)
+            self._print_success(f"{args.generate} に合成リポジトリを生成しました")
+            return
+        
+        def report(name, stats):
+            if not args.json:
+                print(f"  {name:<16} 中央値 {stats['median'] * 1000:9.1f} ms  最小 {stats['min'] * 1000:9.1f} ms")
+        
+        if not args.json:
+            self._print_info(f"合成リポジトリ（{args.files} ファイル、{args.commits} コミット）で計測しています...")
+        
+        try:
+            results = run_benchmarks(shape, args.scenario, max(1, args.repeat), args.keep, report)
+        except (OSError, ValueError, RuntimeError) as e:
+            self._print_error(f"計測に失敗しました: {str(e)}")
+            sys.exit(1)
+        
+        if args.output:
+            save_results(results, args.output)
+        if args.json:
+            print(json.dumps(results, indent=2, ensure_ascii=False))
+        
+        if not args.baseline:
+            return
+        
+        try:
+            baseline = load_results(args.baseline)
+        except (OSError, ValueError) as e:
+            self._print_error(f"基準の計測結果を読み込めません: {str(e)}")
+            sys.exit(1)
+        
+        if baseline.get('shape') != results['shape']:
+            self._print_warning("基準とリポジトリの形が異なるため、比較結果は参考値です")
+        
+        regressions = compare(results, baseline, args.threshold)
+        if not regressions:
+            self._print_success("基準からの性能の低下はありません")
+            return
+        
+        for regression in regressions:
+            self._print_error(
+                f"{regression['scenario']}: {regression['baseline'] * 1000:.1f} ms → "
+                f"{regression['current'] * 1000:.1f} ms（{regression['ratio']:.2f} 倍）"
+            )
+        sys.exit(1)
 
 
 def main():
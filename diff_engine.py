@@ -0,0 +1,642 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# 使用可能な差分アルゴリズム（difflib は従来の SequenceMatcher）
+ALGORITHMS = ('myers', 'histogram', 'difflib')
+DEFAULT_ALGORITHM = 'myers'
+
+# 既定のコンテキスト行数
+DEFAULT_CONTEXT = 3
+
+# Myers法の編集コスト探索の下限（これを超えると近似的な分割に切り替える）
+MAX_COST_MIN = 256
+
+# 1回の差分計算で行う探索の総量の上限（行数あたりの量と最低量）
+# 使い切った後の未解決の領域は置換として扱うため、同じ行が多い大きなファイルでも計算量は行数に比例する
+WORK_PER_LINE = 20
+WORK_MIN = 1000000
+
+# 探索量を使い切った後、一致しない行の前後で揃え直す位置を探す行数
+RESYNC_WINDOW = 16
+
+# histogram法で扱う行の最大出現回数（これより多い行しかない領域はMyers法に任せる）
+MAX_CHAIN_LENGTH = 64
+
+# 名前変更とみなす類似度の既定値（%）
+DEFAULT_RENAME_THRESHOLD = 50
+
+# 名前変更の検出で、追加されたファイルごとに類似度を計算する候補の最大数
+MAX_RENAME_CANDIDATES = 10
+
+# 名前変更の検出で、長い行を分割するバイト数
+FINGERPRINT_CHUNK_SIZE = 64
+
+# 候補の絞り込みに使う断片の出現ファイル数の下限（これより多いファイルに現れる断片は無視する）
+COMMON_FINGERPRINT_MIN = 8
+
+# 探索コストの上限に達したことを示す値
+_CUTOFF = object()
+
+
+def diff_opcodes(a, b, algorithm=DEFAULT_ALGORITHM):
+    """2つの行リストの差分を SequenceMatcher.get_opcodes() と同じ形式で返す"""
+    if algorithm == 'difflib':
+        # difflib は既定では使わないため、必要になったときだけ読み込む
+        import difflib
+        return difflib.SequenceMatcher(None, a, b).get_opcodes()
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"不明な差分アルゴリズムです: {algorithm}")
+    
+    a_ids, b_ids = _intern_lines(a, b)
+    n, m = len(a_ids), len(b_ids)
+    
+    # 共通の先頭・末尾を先に取り除く
+    prefix = 0
+    while prefix < n and prefix < m and a_ids[prefix] == b_ids[prefix]:
+        prefix += 1
+    
+    suffix = 0
+    while suffix < n - prefix and suffix < m - prefix and a_ids[n - suffix - 1] == b_ids[m - suffix - 1]:
+        suffix += 1
+    
+    # 相手側に一度も現れない行は一致しえないため、探索対象から除外する
+    common = set(a_ids[prefix:n - suffix]).intersection(b_ids[prefix:m - suffix])
+    a_index = [i for i in range(prefix, n - suffix) if a_ids[i] in common]
+    b_index = [j for j in range(prefix, m - suffix) if b_ids[j] in common]
+    a_reduced = [a_ids[i] for i in a_index]
+    b_reduced = [b_ids[j] for j in b_index]
+    
+    matches = []
+    # 残りの探索量（呼び出し先で共有して減らす）
+    budget = [WORK_PER_LINE * (len(a_reduced) + len(b_reduced)) + WORK_MIN]
+    if algorithm == 'histogram':
+        _histogram_matches(a_reduced, b_reduced, 0, len(a_reduced), 0, len(b_reduced), matches, budget)
+    else:
+        _myers_matches(a_reduced, b_reduced, 0, len(a_reduced), 0, len(b_reduced), matches, budget)
+    matches = sorted((a_index[i], b_index[j]) for i, j in matches)
+    
+    blocks = []
+    if prefix:
+        blocks.append([0, 0, prefix])
+    for i, j in matches:
+        last = blocks[-1] if blocks else None
+        if last and last[0] + last[2] == i and last[1] + last[2] == j:
+            last[2] += 1
+        else:
+            blocks.append([i, j, 1])
+    if suffix:
+        blocks.append([n - suffix, m - suffix, suffix])
+    blocks.append([n, m, 0])
+    
+    return _blocks_to_opcodes(blocks)
+
+
+def unified_diff(a, b, fromfile='', tofile='', n=3, lineterm='\n', algorithm=DEFAULT_ALGORITHM):
+    """difflib.unified_diff と同じ形式の差分を生成する"""
+    started = False
+    for group in grouped_opcodes(diff_opcodes(a, b, algorithm), n):
+        if not started:
+            started = True
+            yield f'--- {fromfile}{lineterm}'
+            yield f'+++ {tofile}{lineterm}'
+        
+        first, last = group[0], group[-1]
+        file1_range = _format_range_unified(first[1], last[2])
+        file2_range = _format_range_unified(first[3], last[4])
+        yield f'@@ -{file1_range} +{file2_range} @@{lineterm}'
+        
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in ('replace', 'delete'):
+                for line in a[i1:i2]:
+                    yield '-' + line
+            if tag in ('replace', 'insert'):
+                for line in b[j1:j2]:
+                    yield '+' + line
+
+
+def count_changes(a, b, algorithm=DEFAULT_ALGORITHM):
+    """2つの行リストの追加行数と削除行数を (追加, 削除) で返す"""
+    added = deleted = 0
+    for tag, i1, i2, j1, j2 in diff_opcodes(a, b, algorithm):
+        if tag != 'equal':
+            deleted += i2 - i1
+            added += j2 - j1
+    return added, deleted
+
+
+def grouped_opcodes(codes, n=3):
+    """前後n行のコンテキストを含むハンクごとにopcodeをまとめる（difflibと同じ規則）"""
+    codes = list(codes)
+    if not codes:
+        codes = [('equal', 0, 1, 0, 1)]
+    
+    # 先頭と末尾の変更のない部分をコンテキスト分だけに縮める
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    
+    nn = n + n
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        # 長い一致部分でハンクを分割する
+        if tag == 'equal' and i2 - i1 > nn:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def _format_range_unified(start, stop):
+    """ハンクヘッダーの範囲表記を作成する"""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f'{beginning}'
+    if not length:
+        beginning -= 1
+    return f'{beginning},{length}'
+
+
+def _intern_lines(a, b):
+    """行を整数IDに置き換え、以降の比較を整数比較にする"""
+    table = {}
+    a_ids = [table.setdefault(line, len(table)) for line in a]
+    b_ids = [table.setdefault(line, len(table)) for line in b]
+    return a_ids, b_ids
+
+
+def _blocks_to_opcodes(blocks):
+    """一致ブロックのリストをopcodeに変換する"""
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in blocks:
+        if i < ai and j < bj:
+            opcodes.append(('replace', i, ai, j, bj))
+        elif i < ai:
+            opcodes.append(('delete', i, ai, j, bj))
+        elif j < bj:
+            opcodes.append(('insert', i, ai, j, bj))
+        
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append(('equal', ai, i, bj, j))
+    return opcodes
+
+
+def _myers_matches(a, b, a_lo, a_hi, b_lo, b_hi, matches, budget, fallback=True):
+    """Myers法（線形空間の分割統治）で一致する行の組を求める（budget を使い切った領域は置換として扱う）"""
+    max_cost = max(MAX_COST_MIN, int((a_hi - a_lo + b_hi - b_lo) ** 0.5))
+    stack = [(a_lo, a_hi, b_lo, b_hi)]
+    
+    while stack:
+        a_lo, a_hi, b_lo, b_hi = stack.pop()
+        
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            matches.append((a_hi, b_hi))
+        
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        if budget[0] <= 0:
+            _greedy_matches(a, b, a_lo, a_hi, b_lo, b_hi, matches)
+            continue
+        
+        split = _bisect(a, b, a_lo, a_hi, b_lo, b_hi, max_cost, budget, heuristic=not fallback)
+        if split is _CUTOFF:
+            # 編集量の多い領域は出現回数の少ない行を軸に分割する
+            _histogram_matches(a, b, a_lo, a_hi, b_lo, b_hi, matches, budget)
+            continue
+        if split is None:
+            if budget[0] <= 0:
+                _greedy_matches(a, b, a_lo, a_hi, b_lo, b_hi, matches)
+            # 共通部分が見つからない（または探索を打ち切った）領域は置換として扱う
+            continue
+        
+        x, y = split
+        stack.append((x, a_hi, y, b_hi))
+        stack.append((a_lo, x, b_lo, y))
+
+
+def _bisect(a, b, a_lo, a_hi, b_lo, b_hi, max_cost, budget, heuristic=True):
+    """前後両方向から探索し、最短編集経路の中間点を求める（budget を使い切った場合は None）"""
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    max_d = (n + m + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    v1 = [-1] * v_length
+    v2 = [-1] * v_length
+    v1[v_offset + 1] = 0
+    v2[v_offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    
+    for d in range(max_d):
+        if budget[0] <= 0:
+            return None
+        if d > max_cost:
+            if not heuristic:
+                return _CUTOFF
+            return _heuristic_split(v1, v_offset, d, n, m, a_lo, b_lo)
+        
+        # 前方向の探索
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            start = x1
+            while x1 < n and y1 < m and a[a_lo + x1] == b[b_lo + y1]:
+                x1 += 1
+                y1 += 1
+            budget[0] -= x1 - start + 1
+            v1[k1_offset] = x1
+            
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if 0 <= k2_offset < v_length and v2[k2_offset] != -1:
+                    if x1 >= n - v2[k2_offset]:
+                        return a_lo + x1, b_lo + y1
+        
+        # 後ろ方向の探索
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            start = x2
+            while x2 < n and y2 < m and a[a_hi - x2 - 1] == b[b_hi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            budget[0] -= x2 - start + 1
+            v2[k2_offset] = x2
+            
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = v_offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return a_lo + x1, b_lo + y1
+    
+    return None
+
+
+def _heuristic_split(v1, v_offset, d, n, m, a_lo, b_lo):
+    """探索コストの上限に達した場合、最も先まで進んだ前方向の点で分割する"""
+    best = None
+    for k in range(-(d - 1), d, 2):
+        x = v1[v_offset + k]
+        if x < 0:
+            continue
+        x = min(x, n)
+        y = x - k
+        if y < 0 or y > m:
+            continue
+        if best is None or x + y > best[0] + best[1]:
+            best = (x, y)
+    
+    # 分割しても領域が小さくならない場合は打ち切る
+    if best is None or best in ((0, 0), (n, m)):
+        return None
+    return a_lo + best[0], b_lo + best[1]
+
+
+def _greedy_matches(a, b, a_lo, a_hi, b_lo, b_hi, matches):
+    """探索量を使い切った領域を先頭から貪欲に対応付ける（行数に比例する時間で終わる）
+    
+    一致しない行に出会ったら、前後 RESYNC_WINDOW 行以内で2行続けて一致する位置を探して揃え直す。
+    """
+    i, j = a_lo, b_lo
+    while i < a_hi and j < b_hi:
+        if a[i] == b[j]:
+            matches.append((i, j))
+            i += 1
+            j += 1
+            continue
+        
+        for step in range(1, RESYNC_WINDOW + 1):
+            if i + step + 1 < a_hi and j + 1 < b_hi and a[i + step] == b[j] and a[i + step + 1] == b[j + 1]:
+                i += step
+                break
+            if j + step + 1 < b_hi and i + 1 < a_hi and a[i] == b[j + step] and a[i + 1] == b[j + step + 1]:
+                j += step
+                break
+        else:
+            i += 1
+            j += 1
+
+
+def _histogram_matches(a, b, a_lo, a_hi, b_lo, b_hi, matches, budget):
+    """出現回数の少ない行を軸に分割する histogram 法で一致する行の組を求める（budget を使い切った領域は置換として扱う）"""
+    # 分割が偏って処理量が膨らんだ場合はMyers法に切り替える
+    local_budget = 32 * (a_hi - a_lo + b_hi - b_lo) + 1024
+    stack = [(a_lo, a_hi, b_lo, b_hi)]
+    
+    while stack:
+        a_lo, a_hi, b_lo, b_hi = stack.pop()
+        
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            matches.append((a_hi, b_hi))
+        
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        if budget[0] <= 0:
+            _greedy_matches(a, b, a_lo, a_hi, b_lo, b_hi, matches)
+            continue
+        
+        local_budget -= (a_hi - a_lo) + (b_hi - b_lo)
+        budget[0] -= (a_hi - a_lo) + (b_hi - b_lo)
+        if local_budget < 0:
+            _myers_matches(a, b, a_lo, a_hi, b_lo, b_hi, matches, budget, fallback=False)
+            continue
+        
+        # 領域内の各行の出現位置を数える
+        positions = {}
+        for i in range(a_lo, a_hi):
+            positions.setdefault(a[i], []).append(i)
+        
+        # 出現回数が最も少ない行を含む一致範囲のうち、最も長いものを軸にする
+        best = None
+        best_count = MAX_CHAIN_LENGTH
+        has_common = False
+        j = b_lo
+        while j < b_hi:
+            occurrences = positions.get(b[j])
+            if not occurrences:
+                j += 1
+                continue
+            
+            has_common = True
+            if len(occurrences) > best_count:
+                j += 1
+                continue
+            
+            next_j = j + 1
+            for i in occurrences:
+                start_i, start_j = i, j
+                while start_i > a_lo and start_j > b_lo and a[start_i - 1] == b[start_j - 1]:
+                    start_i -= 1
+                    start_j -= 1
+                end_i, end_j = i + 1, j + 1
+                while end_i < a_hi and end_j < b_hi and a[end_i] == b[end_j]:
+                    end_i += 1
+                    end_j += 1
+                budget[0] -= end_i - start_i
+                
+                if best is None or len(occurrences) < best_count or end_i - start_i > best[2]:
+                    best = (start_i, start_j, end_i - start_i)
+                    best_count = len(occurrences)
+                
+                # 調べ終えた一致範囲の内側は再度調べない
+                next_j = max(next_j, end_j)
+            j = next_j
+        
+        if best is None:
+            if has_common:
+                # 出現回数の多い行しか共通していない
+                _myers_matches(a, b, a_lo, a_hi, b_lo, b_hi, matches, budget, fallback=False)
+            continue
+        
+        start_i, start_j, length = best
+        for offset in range(length):
+            matches.append((start_i + offset, start_j + offset))
+        
+        stack.append((start_i + length, a_hi, start_j + length, b_hi))
+        stack.append((a_lo, start_i, b_lo, start_j))
+
+
+def fingerprint(data):
+    """内容を行（長い行は一定のバイト数ごと）に分割してハッシュし、{ハッシュ: バイト数} を返す"""
+    counts = {}
+    for line in data.splitlines(keepends=True):
+        for start in range(0, len(line), FINGERPRINT_CHUNK_SIZE):
+            chunk = line[start:start + FINGERPRINT_CHUNK_SIZE]
+            key = hash(chunk)
+            counts[key] = counts.get(key, 0) + len(chunk)
+    return counts
+
+
+def similarity(old_fingerprint, new_fingerprint, old_size, new_size):
+    """2つの指紋から類似度（0〜100）を計算する（共通するバイト数 / 大きい方のサイズ）"""
+    total = max(old_size, new_size)
+    if not total:
+        return 100
+    
+    if len(old_fingerprint) > len(new_fingerprint):
+        old_fingerprint, new_fingerprint = new_fingerprint, old_fingerprint
+    common = sum(min(size, new_fingerprint.get(key, 0)) for key, size in old_fingerprint.items())
+    return common * 100 // total
+
+
+def detect_renames(deleted, added, load_old, load_new, threshold=DEFAULT_RENAME_THRESHOLD,
+                   copy_sources=None, max_candidates=MAX_RENAME_CANDIDATES):
+    """削除・追加されたパスの組から名前変更とコピーを検出する
+    
+    deleted / added / copy_sources は {パス: blob ID}、load_old / load_new はパスから内容を返す関数。
+    copy_sources を指定するとコピーも検出する。戻り値は (状態 'R' または 'C', 旧パス, 新パス, 類似度) のリスト。
+    """
+    copies = copy_sources is not None
+    results = []
+    used = set()
+    
+    # 完全一致はblob IDの辞書引きだけで見つける
+    deleted_by_id = {}
+    for path, blob_id in sorted(deleted.items()):
+        deleted_by_id.setdefault(blob_id, []).append(path)
+    copy_by_id = {}
+    if copies:
+        for path, blob_id in sorted(copy_sources.items()):
+            copy_by_id.setdefault(blob_id, path)
+    
+    remaining = {}
+    for path, blob_id in sorted(added.items()):
+        candidates = [source for source in deleted_by_id.get(blob_id, ()) if source not in used]
+        if candidates:
+            # 同じファイル名のものを優先する
+            name = os.path.basename(path)
+            source = next((c for c in candidates if os.path.basename(c) == name), candidates[0])
+            used.add(source)
+            results.append(('R', source, path, 100))
+        elif copies and (blob_id in copy_by_id or blob_id in deleted_by_id):
+            source = copy_by_id.get(blob_id) or deleted_by_id[blob_id][0]
+            results.append(('C', source, path, 100))
+        else:
+            remaining[path] = blob_id
+    
+    sources = {path: blob_id for path, blob_id in deleted.items() if copies or path not in used}
+    if copies:
+        sources.update(copy_sources)
+    if not remaining or not sources:
+        return results
+    
+    # 元ファイルの指紋と、指紋からファイルを引く転置索引を作る（同じ内容は一度だけ読む）
+    fingerprints = {}
+    source_info = {}
+    postings = {}
+    for path, blob_id in sources.items():
+        if blob_id not in fingerprints:
+            data = load_old(path)
+            fingerprints[blob_id] = (fingerprint(data), len(data))
+        source_info[path] = fingerprints[blob_id]
+        for key in source_info[path][0]:
+            postings.setdefault(key, []).append(path)
+    
+    # 多くのファイルに現れる断片（空行や定型文）は候補の絞り込みに使わない
+    common_limit = max(COMMON_FINGERPRINT_MIN, int(len(sources) ** 0.5))
+    
+    pairs = []
+    for path in remaining:
+        data = load_new(path)
+        new_fingerprint, new_size = fingerprint(data), len(data)
+        
+        shared = {}
+        for key, size in new_fingerprint.items():
+            paths = postings.get(key)
+            if not paths or len(paths) > common_limit:
+                continue
+            for source in paths:
+                shared[source] = shared.get(source, 0) + min(size, source_info[source][0][key])
+        
+        # 共通部分の多い上位の候補だけ類似度を計算し、総当たりを避ける
+        candidates = sorted(shared, key=lambda source: (-shared[source], source))[:max_candidates]
+        for source in candidates:
+            old_fingerprint, old_size = source_info[source]
+            if min(old_size, new_size) * 100 < threshold * max(old_size, new_size):
+                continue
+            score = similarity(old_fingerprint, new_fingerprint, old_size, new_size)
+            if score >= threshold:
+                pairs.append((score, source, path))
+    
+    # 類似度の高い組から順に割り当てる（削除されたファイルの名前変更先は1つだけ）
+    assigned = set()
+    for score, source, path in sorted(pairs, key=lambda pair: (-pair[0], pair[2], pair[1])):
+        if path in assigned:
+            continue
+        if source in deleted and source not in used:
+            used.add(source)
+            results.append(('R', source, path, score))
+        elif copies:
+            results.append(('C', source, path, score))
+        else:
+            continue
+        assigned.add(path)
+    
+    return results
+
+
+class DiffCache:
+    """(旧blob ID, 新blob ID, アルゴリズム, コンテキスト行数) をキーとする差分結果のLRUキャッシュ"""
+    
+    def __init__(self, cache_dir=None, max_lines=200000, persist=False):
+        """キャッシュを初期化する"""
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_lines = max_lines
+        self.persist = persist
+        self.entries = OrderedDict()
+        self.total_lines = 0
+        self.lock = threading.Lock()
+    
+    def _key_path(self, key):
+        """永続化ファイルのパスを返す"""
+        digest = hashlib.sha1('\0'.join(str(part) for part in key).encode()).hexdigest()
+        return self.cache_dir / digest[:2] / digest[2:]
+    
+    def get(self, key):
+        """キャッシュされた差分を返す（存在しない場合はNone）"""
+        with self.lock:
+            lines = self.entries.get(key)
+            if lines is not None:
+                self.entries.move_to_end(key)
+                return lines
+        
+        if not (self.persist and self.cache_dir):
+            return None
+        
+        try:
+            with open(self._key_path(key), 'rb') as f:
+                lines = json.loads(zlib.decompress(f.read()).decode())
+        except (OSError, ValueError, zlib.error):
+            return None
+        
+        self._remember(key, lines)
+        return lines
+    
+    def put(self, key, lines):
+        """差分をキャッシュに保存する"""
+        self._remember(key, lines)
+        
+        if not (self.persist and self.cache_dir):
+            return
+        
+        path = self._key_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(json.dumps(lines).encode()))
+            os.replace(tmp_path, path)
+        except OSError:
+            # キャッシュの書き込み失敗は無視する
+            pass
+    
+    def _remember(self, key, lines):
+        """メモリ上のキャッシュに追加し、上限を超えた分を古いものから削除する"""
+        if len(lines) > self.max_lines:
+            return
+        
+        with self.lock:
+            if key in self.entries:
+                self.total_lines -= len(self.entries.pop(key))
+            self.entries[key] = lines
+            self.total_lines += len(lines)
+            
+            while self.total_lines > self.max_lines:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_lines -= len(evicted)
+    
+    def clear(self):
+        """メモリ上のキャッシュを空にする"""
+        with self.lock:
+            self.entries.clear()
+            self.total_lines = 0
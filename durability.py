@@ -0,0 +1,150 @@
+import os
+import itertools
+import threading
+
+# core.fsync で選べる同期の方針
+#   none  : 同期しない（OSの書き戻しに任せる。最も速いが、電源断で直前の書き込みが失われうる）
+#   batch : オブジェクトはファイルごとに同期せず、操作の最後にファイルシステム全体を1回だけ同期する
+#           （os.sync のない Windows では、ためておいたファイルを1つずつ同期する）
+#   full  : ファイルを書き込むたびに、そのファイルとディレクトリを同期する
+FSYNC_POLICIES = ('none', 'batch', 'full')
+DEFAULT_FSYNC_POLICY = 'batch'
+
+# 書き込み途中の一時ファイルの名前の先頭（オブジェクトIDとして扱われない名前にする）
+TMP_PREFIX = 'tmp_'
+
+# 同期のためにファイルを開き直すときのフラグ（Windows の fsync は書き込み可能なハンドルを必要とする）
+_SYNC_OPEN_FLAGS = os.O_RDWR if os.name == 'nt' else os.O_RDONLY
+
+_BINARY_FLAG = getattr(os, 'O_BINARY', 0)
+
+# ファイルシステム全体を同期できるか（Windows にはない）
+_HAVE_SYNC = hasattr(os, 'sync')
+
+# 一時ファイルの名前に付ける通し番号
+_tmp_counter = itertools.count()
+
+
+def fsync_file(path):
+    """書き込み済みのファイルを開き直して同期する"""
+    fd = os.open(path, _SYNC_OPEN_FLAGS | _BINARY_FLAG)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_directory(path):
+    """ディレクトリを同期し、その中で作成・名前変更したエントリを永続化する（Windows では何もしない）"""
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, data, sync=False):
+    """同じディレクトリの一時ファイルに書き込んでから名前を変更し、ファイルを置き換える
+    
+    途中で異常終了しても、path には元の内容か新しい内容のどちらかだけが残る。
+    sync が真の場合は、名前を変更する前に一時ファイルの内容を同期する。
+    """
+    path = os.fspath(path)
+    directory = os.path.dirname(path)
+    while True:
+        tmp_path = os.path.join(directory, f"{TMP_PREFIX}{os.getpid()}_{next(_tmp_counter)}")
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _BINARY_FLAG, 0o666)
+            break
+        except FileExistsError:
+            # 同じプロセスIDの以前のプロセスが残した一時ファイルとは別の名前にする
+            continue
+    
+    try:
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            if sync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SyncBatch:
+    """1つの操作で書き込んだファイルの同期を方針に従って行う
+    
+    オブジェクトは write_object() で、インデックス・参照・設定のようにオブジェクトを指すファイルは write_file() で書き込む。
+    write_file() は、先に書き込んだオブジェクトを同期してから置き換えるため、
+    異常終了してもまだ永続化されていないオブジェクトを指すことはない。
+    """
+    
+    def __init__(self, policy=DEFAULT_FSYNC_POLICY):
+        """同期の方針を指定して初期化する"""
+        if policy not in FSYNC_POLICIES:
+            raise ValueError(f"不明な同期の方針です: {policy}（{', '.join(FSYNC_POLICIES)} のいずれかを指定してください）")
+        self.policy = policy
+        self.lock = threading.Lock()
+        # 'batch' で同期を遅らせているファイル（os.sync を使えない場合だけ記録する）とディレクトリ
+        self.pending_files = []
+        self.pending_dirs = set()
+    
+    def write_object(self, path, data):
+        """オブジェクトのファイルを書き込む（'batch' の場合、同期は flush() まで遅らせる）"""
+        write_atomic(path, data, sync=self.policy == 'full')
+        if self.policy == 'full':
+            fsync_directory(os.path.dirname(os.fspath(path)))
+        elif self.policy == 'batch':
+            with self.lock:
+                if not _HAVE_SYNC:
+                    self.pending_files.append(path)
+                self.pending_dirs.add(os.path.dirname(os.fspath(path)))
+    
+    def created_directory(self, path):
+        """新しく作成したディレクトリを、その親ディレクトリの同期の対象にする"""
+        parent = os.path.dirname(os.fspath(path).rstrip(os.sep))
+        if self.policy == 'full':
+            fsync_directory(parent)
+        elif self.policy == 'batch':
+            with self.lock:
+                self.pending_dirs.add(parent)
+    
+    def write_file(self, path, data):
+        """オブジェクトを指すファイルを置き換える（先に書き込んだオブジェクトを同期してから行う）"""
+        self.flush()
+        sync = self.policy != 'none'
+        write_atomic(path, data, sync=sync)
+        if sync:
+            fsync_directory(os.path.dirname(os.fspath(path)))
+    
+    def flush(self):
+        """遅らせていた同期をまとめて行う
+        
+        os.sync を使える場合は、書き込んだオブジェクトの数によらずファイルシステムの同期を1回だけ行う。
+        """
+        with self.lock:
+            files, self.pending_files = self.pending_files, []
+            dirs, self.pending_dirs = self.pending_dirs, set()
+        if not dirs:
+            return
+        
+        if _HAVE_SYNC:
+            os.sync()
+        for path in files:
+            try:
+                fsync_file(path)
+            except FileNotFoundError:
+                # 同期する前に別のプロセス（gc など）が削除した
+                pass
+        # ファイルの内容を同期してから、名前を記録したディレクトリを同期する
+        for path in sorted(dirs, key=len, reverse=True):
+            fsync_directory(path)
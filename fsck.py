@@ -0,0 +1,245 @@
+import os
+import zlib
+import signal
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from repository import Progress, OperationCancelled, CorruptObjectError, parse_object_header, is_object_id
+
+# 1回の呼び出しでワーカーに渡すオブジェクトの数（プロセス間のやり取りを減らす）
+BATCH_SIZE = 256
+
+# ワーカー1つあたりに先行して渡しておくバッチの数
+BATCHES_PER_WORKER = 4
+
+
+def verify_object(objects_dir, object_id):
+    """1つのオブジェクトを検証し、(ID, 型, 参照するオブジェクトの [(ID, 型)], 問題の説明) を返す
+    
+    ファイルがない場合は型と問題の説明を None とし、参照元での判定に任せる。
+    解凍できない・ヘッダーが正しくないなど型が分からない場合は、型を None として問題の説明を返す。
+    """
+    path = os.path.join(objects_dir, object_id[:2], object_id[2:])
+    try:
+        with open(path, 'rb') as f:
+            compressed = f.read()
+    except FileNotFoundError:
+        return object_id, None, [], None
+    except OSError as e:
+        return object_id, None, [], f"読み込めません（{str(e)}）"
+    
+    try:
+        data = zlib.decompress(compressed)
+    except zlib.error as e:
+        return object_id, None, [], f"解凍できません。ファイルが壊れているか途中で切れています（{str(e)}）"
+    
+    try:
+        obj_type, size, null_index = parse_object_header(object_id, data)
+    except CorruptObjectError as e:
+        return object_id, None, [], e.reason
+    
+    if size != len(data) - null_index - 1:
+        return object_id, obj_type, [], f"サイズが一致しません（ヘッダーは {size} バイト、内容は {len(data) - null_index - 1} バイト）"
+    if hashlib.sha1(data).hexdigest() != object_id:
+        return object_id, obj_type, [], "内容のハッシュがオブジェクトIDと一致しません"
+    
+    try:
+        links = _parse_links(obj_type, data[null_index + 1:])
+    except ValueError as e:
+        return object_id, obj_type, [], str(e)
+    return object_id, obj_type, links, None
+
+
+def _parse_links(obj_type, content):
+    """コミットとツリーが参照するオブジェクトを [(ID, 型)] で返す（形式が正しくない場合は ValueError を送出する）"""
+    if obj_type == 'blob':
+        return []
+    
+    links = []
+    text = content.decode('utf-8')
+    if obj_type == 'commit':
+        for line in text.split('\n'):
+            if not line:
+                break
+            if line.startswith('tree '):
+                links.append((line[5:], 'tree'))
+            elif line.startswith('parent '):
+                links.append((line[7:], 'commit'))
+        if sum(1 for _, link_type in links if link_type == 'tree') != 1:
+            raise ValueError("コミットの tree の行が1つではありません")
+    else:
+        for line in text.split('\n'):
+            if not line:
+                continue
+            entry, separator, name = line.partition('\t')
+            parts = entry.split()
+            if not separator or not name or len(parts) != 3 or parts[1] not in ('blob', 'tree'):
+                raise ValueError(f"ツリーのエントリが正しくありません: {line!r}")
+            links.append((parts[2], parts[1]))
+    
+    for link_id, link_type in links:
+        if not is_object_id(link_id):
+            raise ValueError(f"参照先の {link_type} のIDが正しくありません: {link_id!r}")
+    return links
+
+
+def _verify_batch(objects_dir, object_ids):
+    """ワーカープロセスで複数のオブジェクトを検証する"""
+    return [verify_object(objects_dir, object_id) for object_id in object_ids]
+
+
+def _init_worker():
+    """ワーカープロセスでは Ctrl+C を無視する（取り消しは親プロセスが扱う）"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Fsck:
+    """オブジェクトストアの整合性を検証する
+    
+    各オブジェクトについて、解凍できること、ヘッダーのサイズが内容と一致すること、内容のハッシュが名前と一致することを確かめる。
+    解凍とハッシュ計算はワーカープロセスで並列に行い、コミット・ツリーが参照するオブジェクトが存在して型が正しいことは最後にまとめて確かめる。
+    """
+    
+    def __init__(self, repo, jobs=None, progress=None):
+        """検証を初期化する（jobs が1の場合はワーカープロセスを使わない）"""
+        self.repo = repo
+        self.objects_dir = str(repo.objects_dir)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.progress = progress or Progress()
+        self.checked = 0
+        self.problems = []
+        # 検証したオブジェクトの型（キーは20バイトのID。壊れていて型が分からない場合は None）
+        self.types = {}
+        # 参照されているオブジェクトの (期待する型, 参照元)
+        self.expected = {}
+    
+    def run(self, reachable_only=False):
+        """検証を実行し、(成功したかどうか, 結果の辞書) を返す（reachable_only の場合はブランチ・HEAD・インデックスから到達可能なものだけ）"""
+        try:
+            for object_id, obj_type in self.repo.root_objects():
+                self._expect(object_id, obj_type, 'インデックス' if obj_type == 'blob' else 'ブランチ')
+            
+            executor = None
+            if self.jobs > 1:
+                executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker)
+            try:
+                if reachable_only:
+                    self._walk(executor)
+                else:
+                    for result in self._map_batches(executor, self._iter_store_batches()):
+                        self._record(result)
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=True)
+            
+            self.progress.update('fsck', self.checked, self.checked)
+            self._check_links()
+        except OperationCancelled as e:
+            return False, str(e)
+        except OSError as e:
+            return False, f"検証を中止しました: {str(e)}"
+        
+        return True, {'checked': self.checked, 'problems': self.problems, 'reachable_only': reachable_only}
+    
+    def _expect(self, object_id, obj_type, referrer):
+        """オブジェクトが指定した型で存在するはずであることを記録する"""
+        self.expected.setdefault(bytes.fromhex(object_id), (obj_type, referrer))
+    
+    def _iter_store_batches(self):
+        """オブジェクトのディレクトリを走査し、IDを BATCH_SIZE 件ずつ返す"""
+        with os.scandir(self.objects_dir) as entries:
+            fanout_dirs = sorted(entry.name for entry in entries if entry.is_dir() and len(entry.name) == 2)
+        
+        batch = []
+        for fanout in fanout_dirs:
+            with os.scandir(os.path.join(self.objects_dir, fanout)) as entries:
+                for entry in entries:
+                    object_id = fanout + entry.name
+                    if not is_object_id(object_id):
+                        continue
+                    batch.append(object_id)
+                    if len(batch) >= BATCH_SIZE:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+    
+    def _walk(self, executor):
+        """起点から参照をたどり、到達可能なオブジェクトだけを段階ごとに検証する"""
+        seen = set(self.expected)
+        frontier = [key.hex() for key in self.expected]
+        while frontier:
+            batches = [frontier[start:start + BATCH_SIZE] for start in range(0, len(frontier), BATCH_SIZE)]
+            frontier = []
+            for result in self._map_batches(executor, batches):
+                self._record(result)
+                for link_id, link_type in result[2]:
+                    key = bytes.fromhex(link_id)
+                    if key not in seen:
+                        seen.add(key)
+                        frontier.append(link_id)
+    
+    def _map_batches(self, executor, batches):
+        """バッチを検証し、結果を1つずつ返す（ワーカーに渡すバッチの数を制限してメモリ使用量を抑える）"""
+        if executor is None:
+            for batch in batches:
+                yield from _verify_batch(self.objects_dir, batch)
+            return
+        
+        batches = iter(batches)
+        pending = set()
+        window = self.jobs * BATCHES_PER_WORKER
+        try:
+            while True:
+                for batch in batches:
+                    pending.add(executor.submit(_verify_batch, self.objects_dir, batch))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    return
+                
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        finally:
+            # 取り消された場合は未実行のバッチを取り消す
+            for future in pending:
+                future.cancel()
+    
+    def _record(self, result):
+        """1つのオブジェクトの検証結果を記録する"""
+        object_id, obj_type, links, error = result
+        if obj_type is None and error is None:
+            # ファイルがない（参照元があれば _check_links で報告する）
+            return
+        
+        self.checked += 1
+        self.types[bytes.fromhex(object_id)] = obj_type
+        if error:
+            self.problems.append({'id': object_id, 'type': obj_type, 'error': error})
+        for link_id, link_type in links:
+            self._expect(link_id, link_type, object_id)
+        
+        if self.checked % 1000 == 0:
+            self.progress.update('fsck', self.checked)
+    
+    def _check_links(self):
+        """参照されているオブジェクトが存在し、型が正しいことを確かめる"""
+        for key, (expected_type, referrer) in self.expected.items():
+            if key not in self.types:
+                self.problems.append({
+                    'id': key.hex(), 'type': expected_type, 'error': f"見つかりません（{referrer} から参照されています）"
+                })
+                continue
+            
+            actual_type = self.types[key]
+            if actual_type is not None and actual_type != expected_type:
+                self.problems.append({
+                    'id': key.hex(), 'type': actual_type,
+                    'error': f"型が一致しません（{referrer} から {expected_type} として参照されています）"
+                })
+
+
+def fsck(repo, reachable_only=False, jobs=None, progress=None):
+    """オブジェクトストアを検証し、(成功したかどうか, 結果の辞書) を返す（結果の 'problems' は見つかった問題のリスト）"""
+    return Fsck(repo, jobs, progress).run(reachable_only)
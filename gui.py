@@ -1,10 +1,24 @@
 import os
+import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from pathlib import Path
-import threading
-import queue
-from repository import Repository
+from repository import Repository, Progress, CancelToken, PROGRESS_PHASES
+from background import BackgroundExecutor
+from watcher import WorkingTreeWatcher
+from maintenance import maybe_start_maintenance
+
+# 履歴タブで一度に読み込むコミット数と、同時に表示しておくページ数の上限
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGES = 5
+
+# 自動更新の変更検出の間隔、変更が落ち着くまで待つ時間、更新を遅らせる上限（ミリ秒）
+AUTO_REFRESH_INTERVAL = 1000
+AUTO_REFRESH_DEBOUNCE = 300
+AUTO_REFRESH_MAX_DELAY = 2000
+
+# 進捗バーを表示するまでの時間（秒）。すぐに終わる操作では表示しない
+PROGRESS_SHOW_DELAY = 0.3
 
 class GUI:
     """バージョン管理システムのグラフィカルユーザーインターフェース"""
@@ -36,9 +50,10 @@ class GUI:
         # コンテンツ部分（初期状態では非表示）
         self.content_frame = ttk.Frame(self.main_frame)
         
-        # タスクキュー
-        self.task_queue = queue.Queue()
-        self.root.after(100, self.process_queue)
+        # バックグラウンド処理（ワーカースレッドで実行し、結果をUIスレッドで受け取る）
+        self.executor = BackgroundExecutor()
+        self.root.after(50, self.process_queue)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
     
     def setup_repo_selection(self):
         """リポジトリ選択部分をセットアップ"""
@@ -92,8 +107,17 @@ class GUI:
         self.branch_label = ttk.Label(self.repo_info_frame, text="")
         self.branch_label.pack(side=tk.RIGHT)
         
-        # ステータス更新
+        # 長い操作の進捗と取り消し（操作中のみ表示）
+        self.progress_label = ttk.Label(self.repo_info_frame, text="")
+        self.progress_bar = ttk.Progressbar(self.repo_info_frame, length=200, mode='determinate')
+        self.cancel_button = ttk.Button(self.repo_info_frame, text="取り消し", command=self.cancel_operation)
+        self.active_progress = None
+        self.progress_state = None
+        self.progress_visible = False
+        
+        # ステータスと履歴の最初のページを読み込む
         self.update_repo_status()
+        self.update_history()
     
     def setup_status_tab(self):
         """ステータスタブの内容をセットアップ"""
@@ -142,9 +166,21 @@ class GUI:
         button_frame = ttk.Frame(status_frame)
         button_frame.pack(fill=tk.X, pady=10)
         
-        ttk.Button(button_frame, text="更新", command=self.update_repo_status).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="更新", command=lambda: self.update_repo_status()).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="すべて追加", command=self.add_all_files).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="差分を表示", command=self.show_selected_diff).pack(side=tk.LEFT, padx=5)
+        
+        # 自動更新（ワーキングディレクトリの変更を検出して、変わったファイルの行だけを更新）
+        self.auto_refresh_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="自動更新", variable=self.auto_refresh_var,
+                        command=self.toggle_auto_refresh).pack(side=tk.RIGHT, padx=5)
+        self.watcher = None
+        self.pending_paths = set()
+        self.pending_since = 0
+        self.poll_after_id = None
+        self.debounce_after_id = None
+        # 実行中のステータス更新（終了するまで自動更新を次に回す）
+        self.status_refresh_handle = None
     
     def setup_commit_tab(self):
         """コミットタブの内容をセットアップ"""
@@ -196,17 +232,29 @@ class GUI:
         # コミット履歴
         ttk.Label(history_frame, text="コミット履歴:", style='Header.TLabel').pack(anchor=tk.W, pady=(0, 5))
         
-        # ツリービュー
-        self.history_tree = ttk.Treeview(history_frame, columns=("author", "date"), height=10)
+        # ツリービュー（スクロールに合わせてページ単位で読み込む）
+        tree_frame = ttk.Frame(history_frame)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.history_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL)
+        self.history_tree = ttk.Treeview(tree_frame, columns=("author", "date"), height=10,
+                                         selectmode=tk.BROWSE, yscrollcommand=self.on_history_scroll)
+        self.history_scrollbar.config(command=self.history_tree.yview)
         self.history_tree.heading("#0", text="コミットハッシュ / メッセージ")
         self.history_tree.heading("author", text="作者")
         self.history_tree.heading("date", text="日付")
         self.history_tree.column("#0", width=400)
         self.history_tree.column("author", width=150)
         self.history_tree.column("date", width=150)
-        self.history_tree.pack(fill=tk.BOTH, expand=True)
+        self.history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
-        self.history_tree.bind("<Double-1>", lambda e: self.show_commit_details())
+        self.history_pages = [None]
+        self.history_loaded = []
+        self.history_loading = False
+        self.history_generation = 0
+        
+        self.history_tree.bind("<<TreeviewSelect>>", self.on_history_select)
         
         # コミット詳細
         ttk.Label(history_frame, text="コミット詳細:", style='Header.TLabel').pack(anchor=tk.W, pady=(10, 5))
@@ -260,27 +308,86 @@ class GUI:
         ttk.Button(action_frame, text="ブランチリストを更新", command=self.update_branches).pack(fill=tk.X, pady=10)
     
     def process_queue(self):
-        """バックグラウンド処理のキューを処理"""
+        """完了したバックグラウンド処理の結果をUIに反映"""
         try:
-            while True:
-                task, args, callback = self.task_queue.get_nowait()
-                
-                try:
-                    result = task(*args)
-                    if callback:
-                        callback(result)
-                except Exception as e:
-                    messagebox.showerror("エラー", str(e))
-                
-                self.task_queue.task_done()
-        except queue.Empty:
-            pass
-        
-        self.root.after(100, self.process_queue)
-    
-    def run_background_task(self, task, args=(), callback=None):
-        """タスクをバックグラウンドで実行"""
-        self.task_queue.put((task, args, callback))
+            self.executor.dispatch(on_error=lambda e: messagebox.showerror("エラー", str(e)))
+            self.refresh_progress()
+        finally:
+            self.root.after(50, self.process_queue)
+    
+    def run_background_task(self, task, args=(), callback=None, key=None, exclusive=False, progress=None):
+        """タスクをワーカースレッドで実行
+        
+        key を指定すると、同じキーの処理が実行中の間の依頼は1回にまとめられる。
+        リポジトリを変更する処理は exclusive=True とし、他の処理と同時に実行しない。
+        progress には start_progress() で作成した進捗を渡し、タスクの終了時に進捗表示を閉じる。
+        取り消されて実行されなかった場合や、同じキーの新しい依頼に置き換えられた場合も閉じる。
+        """
+        handle = self.executor.submit(task, args, callback, key, exclusive)
+        if progress is not None:
+            handle.add_done_callback(lambda: setattr(progress, 'finished', True))
+        return handle
+    
+    def cancel_background_tasks(self):
+        """待機中・実行中のタスクを取り消し、結果を待っていた状態も解除する"""
+        self.executor.cancel_all()
+        self.status_refresh_handle = None
+    
+    def start_progress(self):
+        """進捗バーに表示する操作を開始し、リポジトリの操作に渡す Progress を返す"""
+        def report(phase, done, total, bytes_done):
+            # ワーカースレッドから呼ばれるため値の保存だけを行い、表示は process_queue で更新する
+            self.progress_state = (progress, phase, done, total)
+        
+        progress = Progress(report, CancelToken())
+        progress.finished = False
+        progress.started = time.monotonic()
+        self.active_progress = progress
+        return progress
+    
+    def refresh_progress(self):
+        """進捗バーの表示を更新"""
+        progress = self.active_progress
+        if progress is None or progress.finished:
+            if self.progress_visible:
+                self.progress_label.pack_forget()
+                self.progress_bar.pack_forget()
+                self.cancel_button.pack_forget()
+                self.progress_visible = False
+            self.active_progress = None
+            return
+        
+        if time.monotonic() - progress.started < PROGRESS_SHOW_DELAY:
+            return
+        
+        if not self.progress_visible:
+            self.cancel_button.pack(side=tk.RIGHT, padx=5)
+            self.progress_bar.pack(side=tk.RIGHT, padx=5)
+            self.progress_label.pack(side=tk.RIGHT, padx=5)
+            self.progress_visible = True
+        
+        state = self.progress_state
+        if not state or state[0] is not progress:
+            return
+        
+        _, phase, done, total = state
+        label = PROGRESS_PHASES.get(phase, phase)
+        if total:
+            self.progress_bar.config(maximum=total, value=done)
+            self.progress_label.config(text=f"{label} {done}/{total}")
+        else:
+            self.progress_label.config(text=label)
+    
+    def cancel_operation(self):
+        """実行中の操作を取り消し（チェックアウトは書き出したファイルが元に戻される）"""
+        if self.active_progress is not None:
+            self.active_progress.cancel_token.cancel()
+            self.progress_label.config(text="取り消し中...")
+    
+    def on_close(self):
+        """ウィンドウを閉じる（実行中の処理の結果は破棄）"""
+        self.executor.shutdown()
+        self.root.destroy()
     
     def open_repo(self):
         """既存のリポジトリを開く"""
@@ -296,6 +403,8 @@ class GUI:
             messagebox.showerror("エラー", "選択されたディレクトリはLVCSリポジトリではありません")
             return
         
+        # 以前のリポジトリに対する処理の結果は表示しない
+        self.cancel_background_tasks()
         self.repo = repo
         self.repo_path = repo_path
         
@@ -319,6 +428,7 @@ class GUI:
         
         messagebox.showinfo("成功", message)
         
+        self.cancel_background_tasks()
         self.repo = repo
         self.repo_path = repo_path
         
@@ -326,26 +436,20 @@ class GUI:
         self.repo_frame.pack_forget()
         self.setup_content()
     
-    def update_repo_status(self):
-        """リポジトリのステータスを更新"""
+    def update_repo_status(self, paths=None):
+        """リポジトリのステータスを更新（paths を指定した場合は、そのファイルの行だけを更新）"""
         if not self.repo:
             return
         
-        # ブランチ情報を更新
-        self.current_branch = self.repo.get_current_branch() or "（デタッチドHEAD）"
-        self.branch_label.config(text=f"ブランチ: {self.current_branch}")
-        
-        # ファイルリストをクリア
-        for item in self.files_tree.get_children():
-            self.files_tree.delete(item)
-        
-        # ステージングされたファイルリストをクリア
-        self.staged_listbox.delete(0, tk.END)
+        # 全体の更新の場合のみ、他の操作の進捗を表示していなければ進捗を表示する
+        progress = self.start_progress() if paths is None and self.active_progress is None else None
         
         # 非同期でステータスを取得
         def get_status():
-            success, status_info = self.repo.status()
-            return success, status_info
+            try:
+                return self.repo.status(paths, progress)
+            except Exception as e:
+                return False, str(e)
         
         def update_ui(result):
             success, status_info = result
@@ -354,60 +458,271 @@ class GUI:
                 messagebox.showerror("エラー", "リポジトリの状態を取得できませんでした")
                 return
             
+            # ブランチ情報を更新
+            self.current_branch = status_info['branch'] or "（デタッチドHEAD）"
+            self.branch_label.config(text=f"ブランチ: {self.current_branch}")
+            
             # 変更されたファイルを表示
+            rows = {}
             for file_path in status_info['staged_changes']:
-                self.files_tree.insert("", tk.END, text=file_path, values=("ステージング済み",))
+                rows[file_path] = "ステージング済み"
+            for file_path in status_info['unstaged_changes']:
+                rows[file_path] = "変更済み"
+            for rename in status_info['renamed_files']:
+                rows[rename['path']] = f"名前変更（{rename['old_path']} から）"
+            for file_path in status_info['deleted_files']:
+                rows[file_path] = "削除済み"
+            for file_path in status_info['untracked_files']:
+                rows[file_path] = "未追跡"
+            
+            self.apply_status_rows(rows, status_info['staged_changes'], paths)
+        
+        handle = self.run_background_task(get_status, callback=update_ui, key='status', progress=progress)
+        self.status_refresh_handle = handle
+        handle.add_done_callback(lambda: self.finish_status_refresh(handle))
+    
+    def finish_status_refresh(self, handle):
+        """ステータス更新の終了を記録する（取り消されて結果が届かなかった場合も呼ばれる）
+        
+        後から依頼した更新が残っている間は、古い依頼が終わっても実行中のままとする。
+        """
+        if self.status_refresh_handle is handle:
+            self.status_refresh_handle = None
+    
+    def apply_status_rows(self, rows, staged, scope=None):
+        """ファイルリストの行を差分更新（scope が None の場合はすべての行が対象）"""
+        if scope is None:
+            scope = set(self.files_tree.get_children()) | set(rows)
+        
+        for file_path in scope:
+            status = rows.get(file_path)
+            if status is None:
+                if self.files_tree.exists(file_path):
+                    self.files_tree.delete(file_path)
+            elif not self.files_tree.exists(file_path):
+                self.files_tree.insert("", tk.END, iid=file_path, text=file_path, values=(status,))
+            elif self.files_tree.set(file_path, "status") != status:
+                self.files_tree.set(file_path, "status", status)
+        
+        # ステージングされたファイルリストは内容が変わった場合だけ作り直す
+        current = list(self.staged_listbox.get(0, tk.END))
+        updated = list(dict.fromkeys([path for path in current if path not in scope] + list(staged)))
+        if updated != current:
+            self.staged_listbox.delete(0, tk.END)
+            for file_path in updated:
                 self.staged_listbox.insert(tk.END, file_path)
+    
+    def toggle_auto_refresh(self):
+        """自動更新の有効・無効を切り替え"""
+        if self.poll_after_id:
+            self.root.after_cancel(self.poll_after_id)
+            self.poll_after_id = None
+        if self.debounce_after_id:
+            self.root.after_cancel(self.debounce_after_id)
+            self.debounce_after_id = None
+        
+        self.watcher = None
+        if self.auto_refresh_var.get() and self.repo:
+            self.watcher = WorkingTreeWatcher(self.repo)
+            self.pending_paths = set()
+            self.poll_working_tree()
+    
+    def poll_working_tree(self):
+        """ワーキングディレクトリの変更をバックグラウンドで調べる"""
+        self.poll_after_id = None
+        watcher = self.watcher
+        if watcher is None:
+            return
+        
+        def poll():
+            try:
+                return watcher.poll()
+            except OSError:
+                return None
+        
+        def on_changes(changed):
+            if self.watcher is not watcher:
+                return
             
-            for file_path in status_info['unstaged_changes']:
-                self.files_tree.insert("", tk.END, text=file_path, values=("変更済み",))
+            if changed is None:
+                # インデックスやHEADが変わった場合は全体を更新する
+                self.pending_paths = None
+            elif changed and self.pending_paths is not None:
+                self.pending_paths |= changed
             
-            for file_path in status_info['untracked_files']:
-                self.files_tree.insert("", tk.END, text=file_path, values=("未追跡",))
+            if changed is None or changed:
+                self.schedule_auto_refresh()
+            self.poll_after_id = self.root.after(AUTO_REFRESH_INTERVAL, self.poll_working_tree)
         
-        self.run_background_task(get_status, callback=update_ui)
+        self.run_background_task(poll, callback=on_changes, key='watch')
+    
+    def schedule_auto_refresh(self):
+        """変更が落ち着くまで待ってから更新（変更が続く場合も一定時間ごとには更新）"""
+        now = time.monotonic()
+        if self.debounce_after_id:
+            if now - self.pending_since < AUTO_REFRESH_MAX_DELAY / 1000:
+                self.root.after_cancel(self.debounce_after_id)
+                self.debounce_after_id = self.root.after(AUTO_REFRESH_DEBOUNCE, self.apply_auto_refresh)
+            return
+        
+        self.pending_since = now
+        self.debounce_after_id = self.root.after(AUTO_REFRESH_DEBOUNCE, self.apply_auto_refresh)
+    
+    def apply_auto_refresh(self):
+        """たまった変更をステータスに反映"""
+        self.debounce_after_id = None
+        if self.watcher is None:
+            return
+        
+        # 前回の更新が終わっていなければ待つ
+        if self.status_refresh_handle is not None:
+            self.debounce_after_id = self.root.after(AUTO_REFRESH_DEBOUNCE, self.apply_auto_refresh)
+            return
+        
+        paths, self.pending_paths = self.pending_paths, set()
+        self.update_repo_status(paths)
     
     def update_history(self):
-        """コミット履歴を更新"""
+        """コミット履歴を更新（先頭が読み込み済みなら、新しいコミットの行だけを追加）"""
         if not self.repo:
             return
         
-        # 履歴リストをクリア
+        if not self.history_loaded or self.history_loaded[0][0] != 0:
+            self.reset_history()
+            return
+        
+        top_hash = self.history_loaded[0][1][0] if self.history_loaded[0][1] else None
+        generation = self.history_generation
+        
+        # 非同期で最新のページを取得
+        def get_log():
+            return self.repo.log_page(None, HISTORY_PAGE_SIZE)
+        
+        def update_ui(result):
+            if generation != self.history_generation:
+                return
+            
+            success, page = result
+            if not success:
+                messagebox.showerror("エラー", "コミット履歴を取得できませんでした")
+                return
+            
+            hashes = [entry['hash'] for entry in page['entries']]
+            if top_hash not in hashes:
+                # ブランチの切り替えなどで履歴がつながらない場合は読み込み直す
+                self.reset_history()
+                return
+            
+            new_entries = page['entries'][:hashes.index(top_hash)]
+            if not new_entries:
+                return
+            
+            # 新しいコミットを独立したページとして先頭に追加する
+            self.history_pages[0] = top_hash
+            self.history_pages.insert(0, None)
+            self.history_loaded = [(index + 1, items) for index, items in self.history_loaded]
+            self.history_loaded.insert(0, (0, self.insert_history_rows(new_entries, 0)))
+            self.trim_history(keep_top=True)
+        
+        self.run_background_task(get_log, callback=update_ui, key='history')
+    
+    def reset_history(self):
+        """コミット履歴を最初のページから読み込み直す"""
         for item in self.history_tree.get_children():
             self.history_tree.delete(item)
+        self.commit_details.delete(1.0, tk.END)
         
-        # 非同期でログを取得
-        def get_log():
-            success, log_entries = self.repo.log(20)
-            return success, log_entries
+        # 各ページの開始コミット（None はHEAD）だけを保持し、表示中の行は一定数に抑える
+        self.history_generation += 1
+        self.history_pages = [None]
+        self.history_loaded = []
+        self.history_loading = False
+        self.load_history_page(0)
+    
+    def load_history_page(self, page_index):
+        """コミット履歴の1ページを読み込んで表示"""
+        if self.history_loading or not self.repo:
+            return
+        
+        self.history_loading = True
+        cursor = self.history_pages[page_index]
+        generation = self.history_generation
+        
+        def get_page():
+            return self.repo.log_page(cursor, HISTORY_PAGE_SIZE)
         
         def update_ui(result):
-            success, log_entries = result
+            if generation != self.history_generation:
+                return
+            self.history_loading = False
             
+            success, page = result
             if not success:
                 messagebox.showerror("エラー", "コミット履歴を取得できませんでした")
                 return
             
-            # コミット履歴を表示
-            for entry in log_entries:
-                commit_id = entry['hash'][:8]
-                message_first_line = entry['message'].split('\n')[0]
-                display_text = f"{commit_id}: {message_first_line}"
-                
-                self.history_tree.insert("", tk.END, text=display_text, 
-                                        values=(entry['author'], entry['date']),
-                                        tags=(entry['hash'],))
+            if page['next'] and page_index + 1 == len(self.history_pages):
+                self.history_pages.append(page['next'])
+            
+            if self.history_loaded and page_index < self.history_loaded[0][0]:
+                # 上方向へのスクロールで破棄したページを戻す
+                first_item = self.history_loaded[0][1][0] if self.history_loaded[0][1] else None
+                self.history_loaded.insert(0, (page_index, self.insert_history_rows(page['entries'], 0)))
+                self.trim_history(keep_top=True)
+                if first_item:
+                    self.history_tree.see(first_item)
+            else:
+                self.history_loaded.append((page_index, self.insert_history_rows(page['entries'], tk.END)))
+                self.trim_history(keep_top=False)
         
-        self.run_background_task(get_log, callback=update_ui)
+        self.run_background_task(get_page, callback=update_ui, key='history_page')
+    
+    def insert_history_rows(self, entries, position):
+        """コミットの行を挿入し、挿入した行IDのリストを返す"""
+        items = []
+        for offset, entry in enumerate(entries):
+            commit_id = entry['hash'][:8]
+            message_first_line = entry['message'].split('\n')[0]
+            display_text = f"{commit_id}: {message_first_line}"
+            
+            index = position + offset if position != tk.END else tk.END
+            items.append(self.history_tree.insert("", index, iid=entry['hash'], text=display_text,
+                                                  values=(entry['author'], entry['date']),
+                                                  tags=(entry['hash'],)))
+        return items
+    
+    def trim_history(self, keep_top):
+        """表示中のページ数が上限を超えたら、反対側の端のページの行を削除"""
+        while len(self.history_loaded) > HISTORY_MAX_PAGES:
+            page_index, items = self.history_loaded.pop(-1 if keep_top else 0)
+            self.history_tree.delete(*items)
+    
+    def on_history_scroll(self, first, last):
+        """履歴のスクロールに合わせて、前後のページを読み込む"""
+        self.history_scrollbar.set(first, last)
+        if self.history_loading or not self.history_loaded:
+            return
+        
+        if float(last) >= 0.95:
+            next_page = self.history_loaded[-1][0] + 1
+            if next_page < len(self.history_pages):
+                self.load_history_page(next_page)
+        elif float(first) <= 0.05 and self.history_loaded[0][0] > 0:
+            self.load_history_page(self.history_loaded[0][0] - 1)
+    
+    def on_history_select(self, event):
+        """履歴の選択に合わせてコミットの詳細を表示する
+        
+        ページの入れ替えや履歴の再読み込みで選択が外れた場合は、警告を出さずに何もしない。
+        """
+        if self.history_tree.selection():
+            self.show_commit_details()
     
     def update_branches(self):
         """ブランチリストを更新"""
         if not self.repo:
             return
         
-        # ブランチリストをクリア
-        self.branch_listbox.delete(0, tk.END)
-        
         # 非同期でブランチを取得
         def get_branches():
             success, branch_info = self.repo.branch()
@@ -416,6 +731,9 @@ class GUI:
         def update_ui(result):
             success, branch_info = result
             
+            # ブランチリストをクリア
+            self.branch_listbox.delete(0, tk.END)
+            
             if not success:
                 messagebox.showerror("エラー", "ブランチ情報を取得できませんでした")
                 return
@@ -431,7 +749,7 @@ class GUI:
                 else:
                     self.branch_listbox.insert(tk.END, f"  {branch}")
         
-        self.run_background_task(get_branches, callback=update_ui)
+        self.run_background_task(get_branches, callback=update_ui, key='branches')
     
     def show_file_menu(self, event):
         """ファイルのコンテキストメニューを表示"""
@@ -454,8 +772,12 @@ class GUI:
             return
         
         # 非同期で追加
+        progress = self.start_progress()
+        
         def add_file(path):
-            success, message = self.repo.add(path)
+            success, message = self.repo.add(path, progress)
+            if success:
+                maybe_start_maintenance(self.repo)
             return success, message
         
         def update_ui(result):
@@ -468,13 +790,17 @@ class GUI:
             
             self.update_repo_status()
         
-        self.run_background_task(add_file, (file_path,), update_ui)
+        self.run_background_task(add_file, (file_path,), update_ui, exclusive=True, progress=progress)
     
     def add_all_files(self):
         """すべての変更されたファイルを追加"""
+        progress = self.start_progress()
+        
         # 非同期で追加
         def add_all():
-            success, message = self.repo.add(".")
+            success, message = self.repo.add(".", progress)
+            if success:
+                maybe_start_maintenance(self.repo)
             return success, message
         
         def update_ui(result):
@@ -487,7 +813,7 @@ class GUI:
             
             self.update_repo_status()
         
-        self.run_background_task(add_all, callback=update_ui)
+        self.run_background_task(add_all, callback=update_ui, exclusive=True, progress=progress)
     
     def show_selected_diff(self):
         """選択されたファイルの差分を表示"""
@@ -525,7 +851,7 @@ class GUI:
                 else:
                     self.diff_text.insert(tk.END, line + "\n")
         
-        self.run_background_task(get_diff, (file_path,), update_ui)
+        self.run_background_task(get_diff, (file_path,), update_ui, key='diff')
     
     def reset_selected_file(self):
         """選択されたファイルをリセット"""
@@ -538,8 +864,10 @@ class GUI:
         hard_reset = messagebox.askyesno("リセット確認", "変更を完全に破棄しますか？（ハードリセット）")
         
         # 非同期でリセット
+        progress = self.start_progress()
+        
         def do_reset(path, hard):
-            success, message = self.repo.reset(path, hard)
+            success, message = self.repo.reset(path, hard, progress)
             return success, message
         
         def update_ui(result):
@@ -552,7 +880,7 @@ class GUI:
             
             self.update_repo_status()
         
-        self.run_background_task(do_reset, (file_path, hard_reset), update_ui)
+        self.run_background_task(do_reset, (file_path, hard_reset), update_ui, exclusive=True, progress=progress)
     
     def load_user_config(self):
         """ユーザー設定を読み込む"""
@@ -617,6 +945,8 @@ class GUI:
         # 非同期でコミット
         def do_commit(msg):
             success, message = self.repo.commit(msg)
+            if success:
+                maybe_start_maintenance(self.repo)
             return success, message
         
         def update_ui(result):
@@ -631,10 +961,10 @@ class GUI:
             self.update_repo_status()
             self.update_history()
         
-        self.run_background_task(do_commit, (message,), update_ui)
+        self.run_background_task(do_commit, (message,), update_ui, exclusive=True)
     
     def show_commit_details(self):
-        """選択されたコミットの詳細を表示"""
+        """選択されたコミットの詳細を表示（親コミットと変更されたファイルは選択時に読み込む）"""
         selection = self.history_tree.selection()
         if not selection:
             messagebox.showwarning("警告", "コミットが選択されていません")
@@ -643,12 +973,38 @@ class GUI:
         item = self.history_tree.item(selection[0])
         commit_hash = item['tags'][0]
         
-        # コミット詳細を表示
-        self.commit_details.delete(1.0, tk.END)
-        self.commit_details.insert(tk.END, f"コミットハッシュ: {commit_hash}\n\n")
-        self.commit_details.insert(tk.END, f"コミットメッセージ:\n{item['text'].split(':', 1)[1].strip()}\n\n")
-        self.commit_details.insert(tk.END, f"作者: {item['values'][0]}\n")
-        self.commit_details.insert(tk.END, f"日付: {item['values'][1]}\n")
+        def get_details(commit):
+            return self.repo.commit_details(commit)
+        
+        def update_ui(result):
+            success, details = result
+            
+            # 選択が変わっていれば表示しない
+            if self.history_tree.selection() != selection:
+                return
+            
+            self.commit_details.delete(1.0, tk.END)
+            if not success:
+                self.commit_details.insert(tk.END, details)
+                return
+            
+            self.commit_details.insert(tk.END, f"コミットハッシュ: {details['hash']}\n")
+            for parent in details['parents']:
+                self.commit_details.insert(tk.END, f"親コミット: {parent}\n")
+            self.commit_details.insert(tk.END, f"作者: {details['author']}\n")
+            self.commit_details.insert(tk.END, f"日付: {details['date']}\n")
+            if details['committer'] != details['author']:
+                self.commit_details.insert(tk.END, f"コミッター: {details['committer']}\n")
+            self.commit_details.insert(tk.END, f"\nコミットメッセージ:\n{details['message']}\n\n")
+            
+            self.commit_details.insert(tk.END, f"変更されたファイル ({len(details['changes'])}):\n")
+            for change in details['changes']:
+                if change['status'][0] in 'RC':
+                    self.commit_details.insert(tk.END, f"  {change['status']}  {change['old_path']} → {change['path']}\n")
+                else:
+                    self.commit_details.insert(tk.END, f"  {change['status']}  {change['path']}\n")
+        
+        self.run_background_task(get_details, (commit_hash,), update_ui, key='commit_details')
     
     def create_branch(self):
         """新しいブランチを作成"""
@@ -677,7 +1033,7 @@ class GUI:
             
             self.update_branches()
         
-        self.run_background_task(do_create_branch, (branch_name,), update_ui)
+        self.run_background_task(do_create_branch, (branch_name,), update_ui, exclusive=True)
     
     def get_selected_branch(self):
         """選択されたブランチ名を取得"""
@@ -697,8 +1053,10 @@ class GUI:
             return
         
         # 非同期でチェックアウト
+        progress = self.start_progress()
+        
         def do_checkout(name):
-            success, message = self.repo.checkout(name)
+            success, message = self.repo.checkout(name, progress)
             return success, message
         
         def update_ui(result):
@@ -712,7 +1070,7 @@ class GUI:
             self.update_branches()
             self.update_repo_status()
         
-        self.run_background_task(do_checkout, (branch_name,), update_ui)
+        self.run_background_task(do_checkout, (branch_name,), update_ui, exclusive=True, progress=progress)
     
     def merge_branch(self):
         """選択されたブランチをマージ"""
@@ -746,7 +1104,7 @@ class GUI:
             self.update_repo_status()
             self.update_history()
         
-        self.run_background_task(do_merge, (branch_name,), update_ui)
+        self.run_background_task(do_merge, (branch_name,), update_ui, exclusive=True)
     
     def delete_branch(self):
         """選択されたブランチを削除"""
@@ -779,7 +1137,7 @@ class GUI:
             
             self.update_branches()
         
-        self.run_background_task(do_delete, (branch_name,), update_ui)
+        self.run_background_task(do_delete, (branch_name,), update_ui, exclusive=True)
 
 
 def main():
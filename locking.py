@@ -0,0 +1,160 @@
+import os
+import time
+
+# 所有者のプロセスが実行中かどうかを確かめられない場合（別のホスト、Windows など）に、
+# これより古いロックファイルを異常終了したプロセスが残したものとみなす（秒）
+DEFAULT_STALE_SECONDS = 3600
+
+# ロックを待つときの最初と最大の間隔（秒）
+RETRY_INITIAL_DELAY = 0.005
+RETRY_MAX_DELAY = 0.2
+
+# 起動を遅くしないよう、ホスト名は最初にロックを取得するときに求める
+_hostname = None
+
+
+class LockTimeout(TimeoutError):
+    """ロックを時間内に取得できなかったことを表す例外"""
+    
+    def __init__(self, path, owner=None):
+        """ロックファイルと、読み取れた場合はその所有者の情報を指定する"""
+        self.path = str(path)
+        self.owner = owner
+        holder = f"（PID {owner['pid']}）" if owner and owner.get('pid') else ""
+        super().__init__(
+            f"{self.path} は別のプロセス{holder}が使用中です。しばらく待ってから再実行してください"
+            f"（異常終了したプロセスのものであれば、このファイルを削除してください）"
+        )
+
+
+def _get_hostname():
+    """ロックファイルに記録するこのホストの名前を返す"""
+    global _hostname
+    if _hostname is None:
+        if hasattr(os, 'uname'):
+            _hostname = os.uname().nodename
+        else:
+            import platform
+            _hostname = platform.node()
+    return _hostname
+
+
+def _jitter():
+    """待つ間隔に掛ける 0.5〜1.5 の係数を返す（random を読み込まずに、時刻の端数から作る）"""
+    return 0.5 + (time.perf_counter_ns() // 1000 % 1000) / 1000
+
+
+def read_owner(path):
+    """ロックファイルに記録された {'pid', 'time', 'host'} を返す（読み取れない場合は None）"""
+    try:
+        with open(path, 'r') as f:
+            fields = f.read().split()
+    except OSError:
+        return None
+    
+    try:
+        owner = {'pid': int(fields[0]), 'time': int(fields[1])}
+    except (ValueError, IndexError):
+        return None
+    owner['host'] = fields[2] if len(fields) > 2 else None
+    return owner
+
+
+def _process_alive(pid):
+    """プロセスが実行中かどうかを判定する（判定できない場合は None）"""
+    if os.name == 'nt':
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 別のユーザーのプロセスとして存在する
+        return True
+    except OSError:
+        return None
+    return True
+
+
+def is_stale(path, stale_seconds=DEFAULT_STALE_SECONDS):
+    """ロックファイルが、終了したプロセスや古い実行の残したものかどうかを判定する
+    
+    同じホストの所有者のプロセスが実行中であれば、どれだけ長く保持していても残骸とはみなさない。
+    古さ（stale_seconds）で判定するのは、所有者を確かめられない場合
+    （書き込み途中で読み取れない、別のホスト、プロセスの有無を調べられない環境）だけとする。
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return True
+    
+    owner = read_owner(path)
+    if owner is not None and owner['host'] in (None, _get_hostname()):
+        alive = _process_alive(owner['pid'])
+        if alive is not None:
+            return not alive
+    
+    return stale_seconds is not None and time.time() - stat.st_mtime > stale_seconds
+
+
+def _remove_if_stale(path, stale_seconds):
+    """残骸のロックファイルを削除する（削除した場合、またはすでにない場合は True）"""
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except FileNotFoundError:
+        return True
+    except OSError:
+        return False
+    
+    if not is_stale(path, stale_seconds):
+        return False
+    
+    # 判定している間に別のプロセスが取り直したロックは削除しない
+    try:
+        with open(path, 'rb') as f:
+            if f.read() != content:
+                return False
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    return True
+
+
+def try_acquire(path, stale_seconds=DEFAULT_STALE_SECONDS):
+    """ロックファイルを作成してロックを取得する（他のプロセスが保持している場合は False）"""
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if not _remove_if_stale(path, stale_seconds):
+                return False
+            continue
+        
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"{os.getpid()} {int(time.time())} {_get_hostname()}\n")
+        return True
+    return False
+
+
+def acquire(path, timeout, stale_seconds=DEFAULT_STALE_SECONDS):
+    """ロックを取得できるまで待つ（timeout 秒を過ぎたら LockTimeout を送出する。0 の場合は待たない）"""
+    deadline = time.monotonic() + timeout
+    delay = RETRY_INITIAL_DELAY
+    while not try_acquire(path, stale_seconds):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LockTimeout(path, read_owner(path))
+        # 待っているプロセスが同時に再試行しないよう、間隔を少しずらす
+        time.sleep(min(remaining, delay * _jitter()))
+        delay = min(delay * 2, RETRY_MAX_DELAY)
+
+
+def release(path):
+    """ロックファイルを削除してロックを解放する"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import subprocess
+from pathlib import Path
+
+import locking
+from repository import Repository
+
+# 自動メンテナンスの既定の設定（.lvcs/config の maintenance セクションで変更できる）
+DEFAULT_SETTINGS = {
+    'auto': True,
+    # 見積もったルーズオブジェクトの数がこれを超えたら実行する
+    'looseobjects': 6700,
+    # 前回の実行からこの秒数が経つまでは再び実行しない
+    'interval': 3600
+}
+
+# 数を見積もるために数えるファンアウトディレクトリ（オブジェクトIDは一様に分布するため、256倍すると全体の見積もりになる）
+SAMPLE_FANOUT = '17'
+
+# 実行中かどうかを確かめられないプロセスのロックファイルは、これより古ければ異常終了したプロセスが残したものとみなす（秒）
+STALE_LOCK_SECONDS = 6 * 3600
+
+# バックグラウンドで実行するプロセスの優先度を下げる量
+BACKGROUND_NICENESS = 10
+
+LOCK_NAME = 'maintenance.lock'
+STATE_NAME = 'maintenance.json'
+
+
+def get_settings(repo):
+    """自動メンテナンスの設定を読み込む"""
+    return dict(DEFAULT_SETTINGS, **repo.get_config().get('maintenance', {}))
+
+
+def estimate_loose_objects(repo):
+    """1つのファンアウトディレクトリだけを数えて、ルーズオブジェクトの総数を見積もる"""
+    try:
+        with os.scandir(os.path.join(repo.objects_dir, SAMPLE_FANOUT)) as entries:
+            count = sum(1 for entry in entries if len(entry.name) == 38)
+    except FileNotFoundError:
+        return 0
+    return count * 256
+
+
+def read_state(repo):
+    """前回の実行の記録を読み込む（記録がない場合は空の辞書）"""
+    try:
+        with open(repo.vcs_dir / STATE_NAME, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(repo, state):
+    """実行の記録を保存する"""
+    state_file = repo.vcs_dir / STATE_NAME
+    tmp_path = state_file.with_name(state_file.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, state_file)
+
+
+def acquire_lock(repo):
+    """メンテナンスのロックを取得する（他のプロセスが実行中の場合は None）"""
+    lock_file = repo.vcs_dir / LOCK_NAME
+    return lock_file if locking.try_acquire(lock_file, STALE_LOCK_SECONDS) else None
+
+
+def release_lock(lock_file):
+    """メンテナンスのロックを解放する"""
+    locking.release(lock_file)
+
+
+def needs_maintenance(repo, settings=None):
+    """メンテナンスが必要かどうかを安価な目安で判定する"""
+    settings = settings or get_settings(repo)
+    if not settings['auto']:
+        return False
+    
+    last_run = read_state(repo).get('last_run', 0)
+    if time.time() - last_run < settings['interval']:
+        return False
+    if (repo.vcs_dir / LOCK_NAME).exists() and not locking.is_stale(repo.vcs_dir / LOCK_NAME, STALE_LOCK_SECONDS):
+        return False
+    return estimate_loose_objects(repo) > settings['looseobjects']
+
+
+def run_maintenance(repo, progress=None):
+    """ロックを取得して、到達できない古いオブジェクトを削除する"""
+    lock_file = acquire_lock(repo)
+    if lock_file is None:
+        return False, "別のメンテナンスが実行中です"
+    
+    try:
+        start = time.time()
+        estimate = estimate_loose_objects(repo)
+        success, result = repo.gc(progress=progress)
+        
+        state = {'last_run': start, 'duration': time.time() - start, 'loose_objects_estimate': estimate}
+        if success:
+            state['gc'] = result
+        else:
+            state['error'] = result
+        _write_state(repo, state)
+        return success, result
+    finally:
+        release_lock(lock_file)
+
+
+def start_background_maintenance(repo):
+    """優先度を下げた別のプロセスでメンテナンスを開始する（完了は待たない）"""
+    env = dict(os.environ)
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_dir, env.get('PYTHONPATH')]))
+    
+    options = {
+        'cwd': str(repo.repo_path),
+        'env': env,
+        'stdin': subprocess.DEVNULL,
+        'stdout': subprocess.DEVNULL,
+        'stderr': subprocess.DEVNULL,
+        'close_fds': True
+    }
+    if os.name == 'nt':
+        options['creationflags'] = (
+            getattr(subprocess, 'DETACHED_PROCESS', 0)
+            | getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0)
+            | getattr(subprocess, 'BELOW_NORMAL_PRIORITY_CLASS', 0)
+        )
+    else:
+        # 端末のセッションから切り離し、コマンドの終了や Ctrl+C の影響を受けないようにする
+        options['start_new_session'] = True
+    
+    subprocess.Popen([sys.executable, '-m', 'maintenance', str(repo.repo_path)], **options)
+
+
+def maybe_start_maintenance(repo):
+    """必要であればバックグラウンドでメンテナンスを開始する（失敗しても元の操作には影響させない）"""
+    try:
+        if needs_maintenance(repo):
+            start_background_maintenance(repo)
+            return True
+    except Exception:
+        pass
+    return False
+
+
+def main():
+    """バックグラウンドのメンテナンスプロセスの入口（python -m maintenance リポジトリのパス）"""
+    if hasattr(os, 'nice'):
+        try:
+            os.nice(BACKGROUND_NICENESS)
+        except OSError:
+            pass
+    
+    repo_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path.cwd()
+    success, result = run_maintenance(Repository(repo_path))
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import threading
+
+# 計測するフェーズとその表示名
+PHASES = {
+    'walk': 'ディレクトリの走査',
+    'stat': 'ファイル情報の取得',
+    'read': 'オブジェクトの読み込み',
+    'decompress': '解凍',
+    'hash': 'ハッシュ計算',
+    'compress': '圧縮',
+    'write': 'オブジェクトの書き込み',
+    'parse': 'コミット・ツリーの解析',
+    'diff': '差分計算'
+}
+
+# 記録するカウンターとその表示名
+COUNTERS = {
+    'objects_read': '読み込んだオブジェクト数',
+    'objects_written': '書き込んだオブジェクト数',
+    'objects_reused': '既存のため書き込まなかったオブジェクト数',
+    'bytes_read': '読み込んだバイト数',
+    'bytes_written': '書き込んだバイト数',
+    'files_rehashed': 'ハッシュを計算したファイル数',
+    'files_stat_clean': '大きさと更新日時から変更なしと判定したファイル数',
+    'diff_cache_hits': '差分キャッシュのヒット数',
+    'diff_cache_misses': '差分キャッシュのミス数',
+    'blob_cache_hits': 'blobキャッシュのヒット数',
+    'stats_cache_hits': '変更行数キャッシュのヒット数',
+    'object_cache_hits': 'オブジェクトキャッシュのヒット数'
+}
+
+
+class _Phase:
+    """フェーズの開始から終了までの時間を Metrics に記録する"""
+    
+    __slots__ = ('metrics', 'name', 'start')
+    
+    def __init__(self, metrics, name):
+        """フェーズを初期化する"""
+        self.metrics = metrics
+        self.name = name
+        self.start = 0
+    
+    def __enter__(self):
+        """計測を開始する"""
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """計測を終了して記録する"""
+        self.metrics.add_time(self.name, self.start, time.perf_counter())
+        return False
+
+
+class _NullPhase:
+    """何も記録しないフェーズ"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        """何もしない"""
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """何もしない"""
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class NullMetrics:
+    """計測を行わない Metrics（Repository の既定値。呼び出しの負荷を最小にする）"""
+    
+    enabled = False
+    
+    def phase(self, name):
+        """何も記録しないフェーズを返す"""
+        return _NULL_PHASE
+    
+    def count(self, name, amount=1):
+        """何もしない"""
+
+
+NULL_METRICS = NullMetrics()
+
+
+class Metrics:
+    """フェーズごとの経過時間とカウンターを記録する
+    
+    Repository の metrics 属性に設定すると、その操作の内訳が記録される。
+    フェーズの時間は入れ子になったフェーズを含み、ワーカースレッドでの時間も合算される。
+    trace=True の場合は Chrome のトレースイベント形式で出力するため、個々の区間も保存する。
+    """
+    
+    enabled = True
+    
+    def __init__(self, trace=False):
+        """計測を初期化する"""
+        self.lock = threading.Lock()
+        self.trace = trace
+        self.origin = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.events = []
+    
+    def phase(self, name):
+        """with 文で囲んだ区間の時間を name のフェーズとして記録する"""
+        return _Phase(self, name)
+    
+    def add_time(self, name, start, end):
+        """フェーズの区間を記録する（時刻は time.perf_counter() の値）"""
+        with self.lock:
+            entry = self.phases.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += end - start
+            if self.trace:
+                self.events.append((name, start, end, threading.get_ident()))
+    
+    def count(self, name, amount=1):
+        """カウンターを増やす"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def summary(self):
+        """記録した内容を辞書で返す"""
+        with self.lock:
+            return {
+                'phases': {
+                    name: {'calls': calls, 'seconds': seconds}
+                    for name, (calls, seconds) in sorted(self.phases.items(), key=lambda item: -item[1][1])
+                },
+                'counters': dict(sorted(self.counters.items()))
+            }
+    
+    def format_summary(self):
+        """記録した内容を表示用の行のリストにする"""
+        summary = self.summary()
+        lines = ["フェーズ別の時間:"]
+        for name, entry in summary['phases'].items():
+            label = PHASES.get(name, name)
+            lines.append(f"  {name:<12} {entry['seconds'] * 1000:10.1f} ms  {entry['calls']:8d} 回  {label}")
+        
+        if summary['counters']:
+            lines.append("カウンター:")
+            for name, value in summary['counters'].items():
+                lines.append(f"  {name:<18} {value:12d}  {COUNTERS.get(name, name)}")
+        return lines
+    
+    def chrome_trace(self):
+        """Chrome のトレースイベント形式（chrome://tracing や Perfetto で表示できる）の辞書を返す"""
+        pid = os.getpid()
+        with self.lock:
+            events = [
+                {
+                    'name': name,
+                    'cat': 'lvcs',
+                    'ph': 'X',
+                    'ts': (start - self.origin) * 1e6,
+                    'dur': (end - start) * 1e6,
+                    'pid': pid,
+                    'tid': tid
+                }
+                for name, start, end, tid in self.events
+            ]
+            end_ts = max((event['ts'] + event['dur'] for event in events), default=0)
+            events.extend(
+                {'name': name, 'ph': 'C', 'ts': end_ts, 'pid': pid, 'args': {name: value}}
+                for name, value in sorted(self.counters.items())
+            )
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+    
+    def write_chrome_trace(self, path):
+        """Chrome のトレースイベント形式でファイルに保存する"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
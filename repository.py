@@ -2,11 +2,220 @@ import os
 import hashlib
 import json
 import time
-import shutil
-import difflib
 import zlib
+import fnmatch
+import functools
+import itertools
+import threading
+from contextlib import contextmanager
+from collections import deque, OrderedDict
 from pathlib import Path
 from datetime import datetime
+from blob_cache import BlobCache, unlink_if_shared
+from metrics import NULL_METRICS
+from durability import SyncBatch, FSYNC_POLICIES, DEFAULT_FSYNC_POLICY, TMP_PREFIX
+import locking
+from locking import LockTimeout
+import diff_engine
+
+# バイナリ判定のために先頭から調べるバイト数
+BINARY_SNIFF_SIZE = 8000
+
+# 既定の差分対象の最大サイズ（これを超えるファイルは内容の差分を表示しない）
+DEFAULT_BIG_FILE_THRESHOLD = 10 * 1024 * 1024
+
+# 差分キャッシュ内でバイナリファイルであることを表す値
+BINARY_DIFF_MARKER = '\0binary'
+
+# メモリ上にキャッシュする解凍済みオブジェクトの合計サイズの上限と、1つあたりの上限（バイト）
+OBJECT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+OBJECT_CACHE_MAX_OBJECT = 1024 * 1024
+
+# オブジェクトを逐次解凍するときに1回で読み込む・解凍するバイト数
+OBJECT_STREAM_CHUNK_SIZE = 256 * 1024
+
+# 到達できないオブジェクトを削除するまでの既定の猶予期間（日数）
+DEFAULT_PRUNE_EXPIRE_DAYS = 14
+
+# リポジトリを変更する操作が、他のプロセスのロックの解放を待つ既定の秒数
+DEFAULT_LOCK_TIMEOUT = 30
+
+# 参照を書き換える間、参照ファイルの隣に作成するロックファイルの名前の末尾
+LOCK_SUFFIX = '.lock'
+
+# オブジェクトの型
+OBJECT_TYPES = ('blob', 'tree', 'commit')
+
+# オブジェクトIDに使える文字
+_HEX_DIGITS = frozenset('0123456789abcdef')
+
+# iter_status が返す状態と、status() の結果でその状態のファイルを入れるキー（'renamed' は renamed_files に入る）
+STATUS_KEYS = {
+    'staged': 'staged_changes',
+    'modified': 'unstaged_changes',
+    'untracked': 'untracked_files',
+    'deleted': 'deleted_files'
+}
+
+# 進捗を通知するフェーズとその表示名
+PROGRESS_PHASES = {
+    'add': 'ファイルを追加中',
+    'status': '変更を確認中',
+    'checkout': 'ファイルを展開中',
+    'diff': '差分を計算中',
+    'gc_mark': '到達可能なオブジェクトを確認中',
+    'gc_sweep': '不要なオブジェクトを削除中',
+    'fsck': 'オブジェクトを検証中'
+}
+
+
+def is_object_id(value):
+    """完全な形のオブジェクトID（小文字16進数40桁）かどうかを判定する"""
+    return isinstance(value, str) and len(value) == 40 and _HEX_DIGITS.issuperset(value)
+
+
+class CorruptObjectError(ValueError):
+    """オブジェクトのファイルが壊れている（解凍できない、ヘッダーやサイズが正しくない）ことを表す例外"""
+    
+    def __init__(self, object_id, reason):
+        super().__init__(f"オブジェクト {object_id} が壊れています: {reason}（lvcs fsck で確認できます）")
+        self.object_id = object_id
+        self.reason = reason
+
+
+class RefConflictError(ValueError):
+    """参照を書き換えようとしたときに、別の操作によって値が変わっていたことを表す例外"""
+    
+    def __init__(self, name, expected, actual):
+        super().__init__(
+            f"参照 '{name}' は別の操作で更新されました（想定: {expected or 'なし'}、現在: {actual or 'なし'}）。もう一度実行してください"
+        )
+        self.name = name
+        self.expected = expected
+        self.actual = actual
+
+
+def parse_object_header(object_id, data):
+    """解凍したオブジェクトの先頭の「型 サイズ\\0」を解析し、(型, サイズ, NULバイトの位置) を返す"""
+    null_index = data.find(b'\0')
+    if null_index < 0:
+        raise CorruptObjectError(object_id, "ヘッダーがありません")
+    
+    try:
+        obj_type, size = bytes(data[:null_index]).decode('ascii').split(' ')
+        size = int(size)
+    except (ValueError, UnicodeDecodeError):
+        raise CorruptObjectError(object_id, "ヘッダーが正しくありません")
+    if obj_type not in OBJECT_TYPES or size < 0:
+        raise CorruptObjectError(object_id, f"不明な型またはサイズです（{obj_type} {size}）")
+    return obj_type, size, null_index
+
+
+class OperationCancelled(Exception):
+    """操作が取り消されたことを表す例外"""
+    
+    def __init__(self, message="操作は取り消されました"):
+        super().__init__(message)
+
+
+class CancelToken:
+    """操作の取り消しを伝えるトークン（別スレッドから cancel() を呼ぶ）"""
+    
+    def __init__(self):
+        """トークンを初期化する"""
+        self.event = threading.Event()
+    
+    def cancel(self):
+        """操作の取り消しを要求する"""
+        self.event.set()
+    
+    @property
+    def cancelled(self):
+        """取り消しが要求されているかどうか"""
+        return self.event.is_set()
+    
+    def check(self):
+        """取り消しが要求されていれば OperationCancelled を送出する"""
+        if self.event.is_set():
+            raise OperationCancelled()
+
+
+class Progress:
+    """長い操作の進捗の通知と取り消しの確認を行う
+    
+    callback は (フェーズ, 処理済みの件数, 全件数, 処理済みのバイト数) で呼ばれる。
+    通知は interval 秒ごとに間引かれるが、フェーズの切り替わりと完了時は必ず通知する。
+    """
+    
+    def __init__(self, callback=None, cancel_token=None, interval=0.1):
+        """進捗を初期化する"""
+        self.callback = callback
+        self.cancel_token = cancel_token
+        self.interval = interval
+        self.last_phase = None
+        self.last_time = 0
+    
+    def update(self, phase, done, total=None, bytes_done=0):
+        """進捗を通知する（取り消しが要求されていれば OperationCancelled を送出する）"""
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+        if self.callback is None:
+            return
+        
+        now = time.monotonic()
+        if phase == self.last_phase and done != total and now - self.last_time < self.interval:
+            return
+        
+        self.last_phase = phase
+        self.last_time = now
+        self.callback(phase, done, total, bytes_done)
+
+
+class ObjectCache:
+    """解凍済みオブジェクトのLRUキャッシュ（オブジェクトは内容で識別されるため無効化は不要）"""
+    
+    def __init__(self, max_bytes=OBJECT_CACHE_MAX_BYTES, max_object=OBJECT_CACHE_MAX_OBJECT):
+        """キャッシュを初期化する"""
+        self.max_bytes = max_bytes
+        self.max_object = max_object
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+    
+    def get(self, sha1):
+        """キャッシュされた (型, 内容) を返す（存在しない場合はNone）"""
+        with self.lock:
+            entry = self.entries.get(sha1)
+            if entry is not None:
+                self.entries.move_to_end(sha1)
+            return entry
+    
+    def put(self, sha1, obj_type, data):
+        """オブジェクトをキャッシュに追加し、上限を超えた分を古いものから削除する"""
+        if len(data) > self.max_object:
+            return
+        
+        with self.lock:
+            if sha1 in self.entries:
+                return
+            self.entries[sha1] = (obj_type, data)
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes and self.entries:
+                _, (_, old_data) = self.entries.popitem(last=False)
+                self.total_bytes -= len(old_data)
+
+
+def _write_operation(method):
+    """リポジトリを変更するメソッドを書き込みロックの中で実行する（ロックを取得できない場合は (False, メッセージ) を返す）"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            with self.write_lock():
+                return method(self, *args, **kwargs)
+        except LockTimeout as e:
+            return False, str(e)
+    return wrapper
+
 
 class Repository:
     """バージョン管理操作を処理するメインリポジトリクラス"""
@@ -21,7 +230,22 @@ class Repository:
         self.head_file = self.vcs_dir / 'HEAD'
         self.index_file = self.vcs_dir / 'index'
         self.config_file = self.vcs_dir / 'config'
-        
+        self.sparse_file = self.vcs_dir / 'sparse-checkout'
+        self.cache_dir = self.vcs_dir / 'cache'
+        self.lock_file = self.vcs_dir / 'repository.lock'
+        self.diff_cache = diff_engine.DiffCache(self.cache_dir / 'diff')
+        # 計測を行う場合は metrics.Metrics を設定する
+        self.metrics = NULL_METRICS
+        # 長く使うプロセス（GUI・バッチモードなど）で読み込みを省くためのキャッシュ
+        self.object_cache = ObjectCache()
+        self.file_cache = {}
+        self.file_cache_lock = threading.Lock()
+        # write_batch() の中で書き込んだオブジェクトの同期をまとめる SyncBatch
+        self.sync_batch = None
+        # 書き込みロック（同じプロセスのスレッド間の排他と、入れ子になった取得の数）
+        self.write_lock_thread = threading.RLock()
+        self.write_lock_depth = 0
+    
     def init(self):
         """新しいリポジトリを初期化する"""
         if self.vcs_dir.exists():
@@ -47,96 +271,595 @@ class Repository:
                 "core": {
                     "repositoryformatversion": 0,
                     "filemode": False,
-                    "bare": False
+                    "bare": False,
+                    "fsync": DEFAULT_FSYNC_POLICY,
+                    "locktimeout": DEFAULT_LOCK_TIMEOUT
                 },
                 "user": {
                     "name": "",
                     "email": ""
+                },
+                "blobcache": {
+                    "enabled": False,
+                    "threshold": 1024 * 1024,
+                    "max_size": 1024 * 1024 * 1024,
+                    "hardlink": False
+                },
+                "diff": {
+                    "algorithm": diff_engine.DEFAULT_ALGORITHM,
+                    "context": diff_engine.DEFAULT_CONTEXT,
+                    "bigfilethreshold": DEFAULT_BIG_FILE_THRESHOLD,
+                    "persistentcache": False,
+                    "renames": True,
+                    "renamethreshold": diff_engine.DEFAULT_RENAME_THRESHOLD
                 }
             }
             json.dump(config, f, indent=4)
         
         return True, "空のリポジトリを初期化しました"
     
+    def _load_json_file(self, path, copy_data):
+        """JSONファイルを読み込む（ファイルが更新されていなければ前回の内容の複製を返す。存在しない場合はNone）"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        
+        key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self.file_cache_lock:
+            cached = self.file_cache.get(path)
+        
+        if cached is None or cached[0] != key:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            with self.file_cache_lock:
+                self.file_cache[path] = (key, data)
+        else:
+            data = cached[1]
+        
+        # 呼び出し元が変更してもキャッシュが壊れないよう複製を返す
+        return copy_data(data)
+    
+    def _invalidate_file_cache(self, path):
+        """ファイルを書き換えたときにキャッシュを破棄する"""
+        with self.file_cache_lock:
+            self.file_cache.pop(path, None)
+    
     def get_config(self):
         """リポジトリの設定を読み込む"""
-        if not self.config_file.exists():
-            return {}
-        
-        with open(self.config_file, 'r') as f:
-            return json.load(f)
+        config = self._load_json_file(
+            self.config_file,
+            lambda data: {key: dict(value) if isinstance(value, dict) else value for key, value in data.items()}
+        )
+        return config if config is not None else {}
     
     def set_config(self, config):
-        """リポジトリの設定を更新する"""
-        with open(self.config_file, 'w') as f:
-            json.dump(config, f, indent=4)
+        """リポジトリの設定を更新する（同期の方針が正しくない場合は ValueError を送出し、何も書き込まない）"""
+        policy = self.get_fsync_policy(config)
+        self._write_file(self.config_file, json.dumps(config, indent=4), policy)
+    
+    def get_fsync_policy(self, config=None):
+        """ファイルの同期の方針（core.fsync）を返す"""
+        if config is None:
+            config = self.get_config()
+        policy = config.get('core', {}).get('fsync', DEFAULT_FSYNC_POLICY)
+        if policy not in FSYNC_POLICIES:
+            raise ValueError(f"不明な同期の方針です: core.fsync = {policy}（{', '.join(FSYNC_POLICIES)} のいずれかを指定してください）")
+        return policy
+    
+    @contextmanager
+    def write_batch(self):
+        """with 文の中で書き込んだオブジェクトの同期をまとめて行う（入れ子にした場合は外側にまとめる）
+        
+        同期の方針が 'batch' の場合、オブジェクトは書き込むたびには同期せず、
+        インデックスや参照を書き換える直前か with 文を抜けるときに一度だけ同期する。
+        """
+        if self.sync_batch is not None:
+            yield self.sync_batch
+            return
+        
+        self.sync_batch = SyncBatch(self.get_fsync_policy())
+        try:
+            yield self.sync_batch
+            self.sync_batch.flush()
+        finally:
+            self.sync_batch = None
+    
+    @contextmanager
+    def write_lock(self):
+        """リポジトリを変更する処理を、他のプロセス・スレッドの書き込みと排他する（入れ子にできる）
+        
+        .lvcs/repository.lock を O_CREAT | O_EXCL で作成して取得し、他のプロセスが保持している間は
+        core.locktimeout 秒まで待つ。待っても取得できない場合は LockTimeout を送出する。
+        読み込みだけの操作（log・cat-object など）はロックを取得しない。
+        """
+        timeout = self._get_lock_timeout()
+        if not self.write_lock_thread.acquire(timeout=timeout):
+            raise LockTimeout(self.lock_file)
+        try:
+            if self.write_lock_depth == 0:
+                locking.acquire(self.lock_file, timeout)
+            self.write_lock_depth += 1
+            try:
+                yield
+            finally:
+                self.write_lock_depth -= 1
+                if self.write_lock_depth == 0:
+                    locking.release(self.lock_file)
+        finally:
+            self.write_lock_thread.release()
+    
+    def _get_lock_timeout(self):
+        """ロックの解放を待つ秒数（core.locktimeout）を返す"""
+        return self.get_config().get('core', {}).get('locktimeout', DEFAULT_LOCK_TIMEOUT)
+    
+    def _ref_file(self, name):
+        """参照名（'HEAD' またはブランチ名）に対応するファイルのパスを返す"""
+        return self.head_file if name == 'HEAD' else self.branches_dir / name
+    
+    def _read_ref(self, name):
+        """参照の現在の値を返す（存在しない場合は空文字列）"""
+        try:
+            with open(self._ref_file(name), 'r') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ''
+    
+    def update_ref(self, name, new_value, old_value=None):
+        """参照を、現在の値が old_value と一致する場合だけ new_value に書き換える
+        
+        name は 'HEAD' またはブランチ名。old_value が None の場合は現在の値を確かめず、
+        空文字列の場合は参照がまだ存在しないことを確かめる。new_value が None の場合は参照を削除する。
+        比較から書き換えまでは参照ごとのロックファイルの中で行い、一致しない場合は RefConflictError を送出する。
+        """
+        ref_file = self._ref_file(name)
+        lock_path = ref_file.with_name(ref_file.name + LOCK_SUFFIX)
+        locking.acquire(lock_path, self._get_lock_timeout())
+        try:
+            current = self._read_ref(name)
+            if old_value is not None and current != old_value:
+                raise RefConflictError(name, old_value, current)
+            
+            if new_value is None:
+                try:
+                    ref_file.unlink()
+                except FileNotFoundError:
+                    pass
+            else:
+                self._write_file(ref_file, new_value)
+        finally:
+            locking.release(lock_path)
+    
+    def _write_file(self, path, content, policy=None):
+        """インデックス・参照・設定などのファイルをアトミックに置き換える（書き込み済みのオブジェクトを先に同期する）"""
+        self._invalidate_file_cache(path)
+        batch = self.sync_batch or SyncBatch(policy or self.get_fsync_policy())
+        batch.write_file(path, content.encode() if isinstance(content, str) else content)
     
     def hash_object(self, data, obj_type='blob'):
-        """データをリポジトリに保存し、そのハッシュを返す"""
+        """データをリポジトリに保存し、そのハッシュを返す
+        
+        add や commit のようにオブジェクトを書き込む処理からだけ呼ぶ。
+        ハッシュを比べるだけの処理（status など）は、オブジェクトを書き込まず更新日時も変えない _hash_file を使う。
+        """
         header = f"{obj_type} {len(data)}\0"
         full_data = header.encode() + data
         
         # SHA-1ハッシュを計算
-        sha1 = hashlib.sha1(full_data).hexdigest()
+        with self.metrics.phase('hash'):
+            sha1 = hashlib.sha1(full_data).hexdigest()
         
-        # オブジェクトを圧縮して保存
-        compressed_data = zlib.compress(full_data)
+        # 同じオブジェクトがすでにあれば書き込まず、gc の猶予期間が始まり直すよう更新日時だけを新しくする
         object_path = self.objects_dir / sha1[:2] / sha1[2:]
+        try:
+            os.utime(object_path)
+            exists = True
+        except FileNotFoundError:
+            exists = False
+        except OSError:
+            # 更新日時を変更できなくても、既存のオブジェクトはそのまま使える
+            exists = True
+        if exists:
+            self.metrics.count('objects_reused')
+            return sha1
         
-        if not object_path.parent.exists():
-            object_path.parent.mkdir()
-        
-        with open(object_path, 'wb') as f:
-            f.write(compressed_data)
+        # オブジェクトを圧縮して保存
+        with self.metrics.phase('compress'):
+            compressed_data = zlib.compress(full_data)
+        
+        with self.metrics.phase('write'):
+            batch = self.sync_batch or SyncBatch(self.get_fsync_policy())
+            if not object_path.parent.exists():
+                object_path.parent.mkdir(exist_ok=True)
+                batch.created_directory(object_path.parent)
+            
+            batch.write_object(object_path, compressed_data)
+            if batch is not self.sync_batch:
+                batch.flush()
         
+        self.metrics.count('objects_written')
+        self.metrics.count('bytes_written', len(compressed_data))
         return sha1
     
     def get_object(self, sha1, expected_type=None):
         """リポジトリからオブジェクトを取得して解凍する"""
+        cached = self.object_cache.get(sha1)
+        if cached is not None:
+            self.metrics.count('object_cache_hits')
+            obj_type, data = cached
+            if expected_type and obj_type != expected_type:
+                raise ValueError(f"期待される型は {expected_type} ですが、{obj_type} が見つかりました")
+            return obj_type, data
+        
         object_path = self.objects_dir / sha1[:2] / sha1[2:]
         
         if not object_path.exists():
             return None, None
         
-        with open(object_path, 'rb') as f:
-            compressed_data = f.read()
+        with self.metrics.phase('read'):
+            with open(object_path, 'rb') as f:
+                compressed_data = f.read()
+        self.metrics.count('objects_read')
+        self.metrics.count('bytes_read', len(compressed_data))
         
-        # データを解凍
-        data = zlib.decompress(compressed_data)
+        # データを解凍（途中で切れたファイルも解凍のエラーになる）
+        with self.metrics.phase('decompress'):
+            try:
+                data = zlib.decompress(compressed_data)
+            except zlib.error as e:
+                raise CorruptObjectError(sha1, f"解凍できません（{str(e)}）")
         
-        # ヘッダーを解析
-        null_index = data.find(b'\0')
-        header = data[:null_index].decode()
-        obj_type, size = header.split()
+        # ヘッダーを解析し、宣言されたサイズと実際のサイズを比べる
+        obj_type, size, null_index = parse_object_header(sha1, data)
+        if size != len(data) - null_index - 1:
+            raise CorruptObjectError(
+                sha1, f"サイズが一致しません（ヘッダーは {size} バイト、内容は {len(data) - null_index - 1} バイト）"
+            )
         
         # 期待されるタイプが提供されている場合はチェック
         if expected_type and obj_type != expected_type:
             raise ValueError(f"期待される型は {expected_type} ですが、{obj_type} が見つかりました")
         
         # 実際のデータを返す
-        return obj_type, data[null_index+1:]
+        content = data[null_index+1:]
+        self.object_cache.put(sha1, obj_type, content)
+        return obj_type, content
     
     def get_index(self):
         """インデックスファイルを読み込む"""
-        if not self.index_file.exists():
-            return {}
-        
-        with open(self.index_file, 'r') as f:
-            return json.load(f)
+        index = self._load_json_file(
+            self.index_file, lambda data: {path: dict(info) for path, info in data.items()}
+        )
+        return index if index is not None else {}
     
     def update_index(self, index):
-        """インデックスファイルを更新する"""
-        with open(self.index_file, 'w') as f:
-            json.dump(index, f, indent=4)
+        """インデックスファイルを更新する（ロックを取得できない場合は LockTimeout を送出する）"""
+        with self.write_lock():
+            self._write_file(self.index_file, json.dumps(index, indent=4))
+    
+    def get_sparse_patterns(self):
+        """スパースチェックアウトのディレクトリリストを読み込む（無効な場合はNone）"""
+        if not self.sparse_file.exists():
+            return None
+        
+        patterns = []
+        with open(self.sparse_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                pattern = self._normalize_sparse_pattern(line)
+                if pattern and pattern not in patterns:
+                    patterns.append(pattern)
+        
+        return patterns
+    
+    def _normalize_sparse_pattern(self, pattern):
+        """スパースパターンを 'dir/subdir' 形式に正規化する"""
+        pattern = pattern.strip()
+        if pattern.startswith('#'):
+            return ''
+        return pattern.replace('\\', '/').strip('/')
+    
+    def _in_sparse_cone(self, rel_path, patterns):
+        """ファイルがスパースチェックアウトの対象範囲内かどうかを判定する"""
+        if patterns is None:
+            return True
+        
+        rel_path = rel_path.replace('\\', '/')
+        
+        # コーンモードではルート直下のファイルは常に対象
+        if '/' not in rel_path:
+            return True
+        
+        for pattern in patterns:
+            if rel_path == pattern or rel_path.startswith(pattern + '/'):
+                return True
+        return False
+    
+    def _sparse_dir_relevant(self, rel_dir, patterns):
+        """ディレクトリ内にスパース対象のファイルが含まれうるかを判定する"""
+        if patterns is None or not rel_dir:
+            return True
+        
+        rel_dir = rel_dir.replace('\\', '/')
+        for pattern in patterns:
+            # 対象ディレクトリの内側、または対象ディレクトリへ至る途中の階層
+            if rel_dir == pattern or rel_dir.startswith(pattern + '/') or pattern.startswith(rel_dir + '/'):
+                return True
+        return False
+    
+    def _iter_working_files(self, start_dir, patterns=None):
+        """ワーキングディレクトリのファイルを (フルパス, 相対パス) で列挙する"""
+        repo_root = str(self.repo_path.resolve())
+        
+        for dir_path, dir_names, file_names in os.walk(Path(start_dir).resolve()):
+            rel_dir = os.path.relpath(dir_path, repo_root)
+            if rel_dir == '.':
+                rel_dir = ''
+            
+            # .lvcs とスパース範囲外のディレクトリには降りない
+            dir_names[:] = sorted(
+                name for name in dir_names
+                if name != '.lvcs' and self._sparse_dir_relevant(os.path.join(rel_dir, name), patterns)
+            )
+            
+            for name in sorted(file_names):
+                rel_path = os.path.join(rel_dir, name)
+                if self._in_sparse_cone(rel_path, patterns):
+                    yield Path(dir_path) / name, rel_path
+    
+    @_write_operation
+    def sparse_checkout(self, patterns=None, disable=False):
+        """スパースチェックアウトのパターンを設定し、ワーキングディレクトリに反映する"""
+        if disable:
+            if self.sparse_file.exists():
+                self.sparse_file.unlink()
+            patterns = None
+        else:
+            patterns = [p for p in (self._normalize_sparse_pattern(p) for p in patterns or []) if p]
+            if not patterns:
+                return False, "スパースチェックアウトの対象ディレクトリを指定してください"
+            
+            self._write_file(self.sparse_file, "\n".join(patterns) + "\n")
+        
+        index = self.get_index()
+        index_mtime = self._index_mtime()
+        blob_cache = self._get_blob_cache()
+        restored, hidden, kept = 0, 0, []
+        
+        try:
+            for rel_path, info in index.items():
+                file_path = self.repo_path / rel_path
+                
+                if self._in_sparse_cone(rel_path, patterns):
+                    if info.get('skip_worktree'):
+                        # 範囲内に入ったファイルを展開する
+                        self._write_blob(info['hash'], file_path, blob_cache)
+                        del info['skip_worktree']
+                        restored += 1
+                elif not info.get('skip_worktree'):
+                    # 範囲外のファイルは変更がなければワーキングディレクトリから取り除く
+                    if file_path.exists():
+                        if self._file_modified(file_path, info, index_mtime):
+                            kept.append(rel_path)
+                            continue
+                        file_path.unlink()
+                        self._remove_empty_dirs(file_path.parent)
+                    info['skip_worktree'] = True
+                    hidden += 1
+        finally:
+            self.update_index(index)
+            if blob_cache:
+                blob_cache.save()
+        
+        message = f"スパースチェックアウトを更新しました（展開 {restored} 件、除外 {hidden} 件）"
+        if kept:
+            message += f"。変更があるため除外しなかったファイル: {', '.join(kept)}"
+        return True, message
+    
+    def _remove_empty_dirs(self, dir_path):
+        """リポジトリルートまでの空になったディレクトリを削除する"""
+        repo_root = self.repo_path.resolve()
+        dir_path = dir_path.resolve()
+        
+        while dir_path != repo_root and repo_root in dir_path.parents:
+            try:
+                dir_path.rmdir()
+            except OSError:
+                break
+            dir_path = dir_path.parent
+    
+    def _get_blob_cache(self):
+        """設定で有効な場合、非圧縮blobキャッシュを返す"""
+        settings = self.get_config().get('blobcache', {})
+        if not settings.get('enabled'):
+            return None
+        
+        return BlobCache(
+            self.cache_dir / 'blobs',
+            threshold=settings.get('threshold', 1024 * 1024),
+            max_size=settings.get('max_size', 1024 * 1024 * 1024),
+            hardlink=settings.get('hardlink', False)
+        )
+    
+    def _write_blob(self, obj_hash, file_path, blob_cache=None):
+        """blobの内容をワーキングディレクトリのファイルとして書き出し、そのバイト数を返す"""
+        # キャッシュ済みの大きなblobはリンク/クローンで配置する（解凍不要）
+        if blob_cache and blob_cache.place(obj_hash, file_path):
+            self.metrics.count('blob_cache_hits')
+            return os.path.getsize(file_path)
+        
+        _, blob_data = self.get_object(obj_hash, 'blob')
+        
+        # 親ディレクトリが存在することを確認
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        if blob_cache and len(blob_data) >= blob_cache.threshold:
+            blob_cache.store(obj_hash, blob_data)
+            blob_cache.place(obj_hash, file_path)
+            return len(blob_data)
+        
+        # キャッシュとinodeを共有している場合は切り離してから書き込む
+        unlink_if_shared(file_path)
+        with open(file_path, 'wb') as f:
+            f.write(blob_data)
+        return len(blob_data)
     
     def _get_file_hash(self, file_path):
-        """ファイルのハッシュを計算する"""
+        """ファイルをblobとしてリポジトリに保存し、そのハッシュを返す"""
         with open(file_path, 'rb') as f:
             data = f.read()
+        self.metrics.count('files_rehashed')
         return self.hash_object(data)
     
-    def add(self, path_pattern):
-        """ファイルをステージングエリアに追加する"""
+    def _hash_file(self, file_path, chunk_size=1024 * 1024):
+        """ファイルをオブジェクトとして保存せずに、blobとしてのハッシュだけを計算する"""
+        self.metrics.count('files_rehashed')
+        with self.metrics.phase('hash'):
+            sha1 = hashlib.sha1(f"blob {os.path.getsize(file_path)}\0".encode())
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    sha1.update(chunk)
+            return sha1.hexdigest()
+    
+    def _index_mtime(self):
+        """インデックスファイルの更新日時（ナノ秒）を返す（存在しない場合は None）"""
+        try:
+            return os.stat(self.index_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _stat_fields(self, stat):
+        """インデックスのエントリに記録する、内容を読まずに変更を判定するためのファイルの情報"""
+        return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    
+    def _stat_unchanged(self, info, stat, index_mtime):
+        """ファイルの大きさと更新日時が、インデックスのエントリに記録したときのままかどうかを判定する
+        
+        インデックスを書き込んだ時刻以降に更新日時があるファイルは、記録した後の同じ時刻の間に
+        書き換えられた可能性があるため、一致していても変更なしとはみなさない。
+        """
+        if index_mtime is None or stat.st_mtime_ns >= index_mtime:
+            return False
+        if info.get('size') != stat.st_size or info.get('mtime') != stat.st_mtime_ns:
+            return False
+        self.metrics.count('files_stat_clean')
+        return True
+    
+    def _file_modified(self, file_path, info, index_mtime, stat=None):
+        """ワーキングディレクトリのファイルがインデックスのエントリから変更されているかどうかを判定する
+        
+        大きさと更新日時が記録したときのままであればハッシュを計算しない。オブジェクトは書き込まない。
+        """
+        if stat is None:
+            stat = file_path.stat()
+        if self._stat_unchanged(info, stat, index_mtime):
+            return False
+        return self._hash_file(file_path) != info['hash']
+    
+    def _get_object_size(self, sha1):
+        """オブジェクト全体を解凍せずに、ヘッダーから内容のサイズを取得する（壊れている場合は CorruptObjectError を送出する）"""
+        obj_type, size = self.read_object_header(sha1)
+        if obj_type is None:
+            raise ValueError(f"オブジェクト {sha1} が見つかりません")
+        return size
+    
+    def read_object_header(self, sha1):
+        """オブジェクト全体を解凍せずに (型, サイズ) を取得する（存在しない場合は (None, None)）"""
+        if not is_object_id(sha1):
+            return None, None
+        
+        cached = self.object_cache.get(sha1)
+        if cached is not None:
+            self.metrics.count('object_cache_hits')
+            return cached[0], len(cached[1])
+        
+        chunks = self.open_object(sha1, chunk_size=1024)
+        if chunks is None:
+            return None, None
+        try:
+            return next(chunks)
+        finally:
+            chunks.close()
+    
+    def open_object(self, sha1, chunk_size=OBJECT_STREAM_CHUNK_SIZE):
+        """オブジェクトを逐次解凍するイテレーターを返す（存在しない場合は None）
+        
+        最初の要素は (型, サイズ) で、その後に内容を chunk_size 程度ずつ bytes または memoryview で返す。
+        内容全体をメモリに持たず、ヘッダーを取り除くためのコピーも行わないため、大きなオブジェクトをそのまま書き出せる。
+        """
+        if not is_object_id(sha1):
+            return None
+        
+        cached = self.object_cache.get(sha1)
+        if cached is not None:
+            self.metrics.count('object_cache_hits')
+            obj_type, data = cached
+            return iter(((obj_type, len(data)), data))
+        
+        object_path = os.path.join(self.objects_dir, sha1[:2], sha1[2:])
+        try:
+            f = open(object_path, 'rb')
+        except FileNotFoundError:
+            return None
+        
+        return self._iter_object_chunks(f, sha1, chunk_size)
+    
+    def _iter_object_chunks(self, f, sha1, chunk_size):
+        """開いたオブジェクトファイルを解凍しながら (型, サイズ) と内容の断片を返す（終了時にファイルを閉じる）"""
+        with f:
+            self.metrics.count('objects_read')
+            decompressor = zlib.decompressobj()
+            
+            def decompressed():
+                # 解凍後のサイズも chunk_size 程度に抑えながら、ファイルの終わりまで解凍する
+                while True:
+                    if decompressor.unconsumed_tail:
+                        piece = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+                    else:
+                        compressed = f.read(chunk_size)
+                        if not compressed:
+                            piece = decompressor.flush()
+                            if piece:
+                                yield piece
+                            return
+                        self.metrics.count('bytes_read', len(compressed))
+                        piece = decompressor.decompress(compressed, chunk_size)
+                    if piece:
+                        yield piece
+            
+            pieces = decompressed()
+            head = b''
+            try:
+                while b'\0' not in head:
+                    head += next(pieces)
+            except StopIteration:
+                raise CorruptObjectError(sha1, "ヘッダーがありません")
+            except zlib.error as e:
+                raise CorruptObjectError(sha1, f"解凍できません（{str(e)}）")
+            
+            obj_type, size, null_index = parse_object_header(sha1, head)
+            yield obj_type, size
+            
+            # 書き出した量を数え、途中で切れたファイルやサイズの不一致を最後に報告する
+            remaining = size
+            piece = memoryview(head)[null_index + 1:]
+            try:
+                while piece is not None:
+                    if len(piece):
+                        remaining -= len(piece)
+                        yield piece
+                    piece = next(pieces, None)
+            except zlib.error as e:
+                raise CorruptObjectError(sha1, f"解凍できません（{str(e)}）")
+            
+            if not decompressor.eof:
+                raise CorruptObjectError(sha1, "ファイルが途中で切れています")
+            if remaining:
+                raise CorruptObjectError(sha1, f"サイズが一致しません（ヘッダーは {size} バイト、内容は {size - remaining} バイト）")
+    
+    @_write_operation
+    def add(self, path_pattern, progress=None):
+        """ファイルをステージングエリアに追加する（取り消された場合はインデックスを変更しない）"""
+        progress = progress or Progress()
         # レポジトリのルートを基準に相対パスを解決
         full_path = (self.repo_path / path_pattern).resolve()
         
@@ -145,45 +868,61 @@ class Repository:
         except ValueError:
             return False, f"パス {path_pattern} はリポジトリ内にありません"
         
-        # 現在のインデックスを取得
-        index = self.get_index()
-        
-        # ディレクトリとファイルの処理を分ける
-        if full_path.is_dir():
-            # ディレクトリ内のすべてのファイルを追加
-            added_files = []
-            for file_path in full_path.glob('**/*'):
-                if file_path.is_file() and '.lvcs' not in str(file_path):
+        # 書き込んだオブジェクトはまとめて同期する
+        with self.write_batch():
+            # 現在のインデックスを取得
+            index = self.get_index()
+            index_mtime = self._index_mtime()
+            sparse_patterns = self.get_sparse_patterns()
+            
+            # ディレクトリとファイルの処理を分ける
+            if full_path.is_dir():
+                # ディレクトリ内のすべてのファイルを追加（スパース範囲外は対象外）
+                added_files = []
+                with self.metrics.phase('walk'):
+                    working_files = list(self._iter_working_files(full_path, sparse_patterns))
+                bytes_done = 0
+                for done, (file_path, file_rel_path) in enumerate(working_files):
+                    try:
+                        progress.update('add', done, len(working_files), bytes_done)
+                    except OperationCancelled as e:
+                        return False, str(e)
+                    
                     try:
-                        file_rel_path = str(file_path.relative_to(self.repo_path.resolve()))
-                        file_hash = self._get_file_hash(file_path)
-                        index[file_rel_path] = {
-                            'hash': file_hash,
-                            'timestamp': datetime.now().timestamp()
-                        }
+                        stat = file_path.stat()
+                        bytes_done += stat.st_size
+                        entry = index.get(file_rel_path)
+                        # 記録したときから変わっていないファイルは読み込まない
+                        if not (entry and self._stat_unchanged(entry, stat, index_mtime)):
+                            index[file_rel_path] = self._index_entry(self._get_file_hash(file_path), stat)
                         added_files.append(file_rel_path)
                     except Exception as e:
                         return False, f"ファイル {file_path} の追加中にエラーが発生しました: {str(e)}"
-            
-            self.update_index(index)
-            return True, f"{len(added_files)} 個のファイルを追加しました"
-        elif full_path.is_file():
-            # 単一ファイルを追加
-            file_rel_path = str(rel_path)
-            try:
-                file_hash = self._get_file_hash(full_path)
-                
-                index[file_rel_path] = {
-                    'hash': file_hash,
-                    'timestamp': datetime.now().timestamp()
-                }
                 
+                progress.update('add', len(working_files), len(working_files), bytes_done)
                 self.update_index(index)
-                return True, f"{file_rel_path} を追加しました"
-            except Exception as e:
-                return False, f"ファイル {full_path} の追加中にエラーが発生しました: {str(e)}"
-        else:
-            return False, f"パスが見つかりません: {path_pattern}"
+                return True, f"{len(added_files)} 個のファイルを追加しました"
+            elif full_path.is_file():
+                # 単一ファイルを追加
+                file_rel_path = str(rel_path)
+                if not self._in_sparse_cone(file_rel_path, sparse_patterns):
+                    return False, f"{file_rel_path} はスパースチェックアウトの範囲外です"
+                try:
+                    stat = full_path.stat()
+                    entry = index.get(file_rel_path)
+                    if not (entry and self._stat_unchanged(entry, stat, index_mtime)):
+                        index[file_rel_path] = self._index_entry(self._get_file_hash(full_path), stat)
+                    
+                    self.update_index(index)
+                    return True, f"{file_rel_path} を追加しました"
+                except Exception as e:
+                    return False, f"ファイル {full_path} の追加中にエラーが発生しました: {str(e)}"
+            else:
+                return False, f"パスが見つかりません: {path_pattern}"
+    
+    def _index_entry(self, file_hash, stat):
+        """ワーキングディレクトリのファイルのインデックスのエントリを作成する（stat は内容を読む前に取得したもの）"""
+        return dict({'hash': file_hash, 'timestamp': datetime.now().timestamp()}, **self._stat_fields(stat))
     
     def create_tree(self):
         """現在のインデックスからツリーオブジェクトを作成する"""
@@ -253,6 +992,7 @@ class Repository:
         with open(branch_file, 'r') as f:
             return f.read().strip()
     
+    @_write_operation
     def commit(self, message):
         """新しいコミットオブジェクトを作成する"""
         # ステージングされた変更があるかチェック
@@ -260,92 +1000,175 @@ class Repository:
         if not index:
             return False, "コミットするためのステージングされた変更はありません"
         
-        # インデックスからツリーを作成
-        tree_hash = self.create_tree()
-        
-        # 設定から作者情報を取得
-        config = self.get_config()
-        author_name = config.get('user', {}).get('name', '不明')
-        author_email = config.get('user', {}).get('email', 'unknown@example.com')
-        
-        # 親コミットを取得
-        parents = []
-        branch = self.get_current_branch()
-        if branch:
-            parent_hash = self.get_branch_commit(branch)
-            if parent_hash:
-                parents.append(parent_hash)
-        
-        # コミットコンテンツを作成
-        commit_items = [
-            f"tree {tree_hash}",
-        ]
-        
-        for parent in parents:
-            commit_items.append(f"parent {parent}")
-        
-        timestamp = int(time.time())
-        timezone = time.strftime("%z")
-        
-        commit_items.extend([
-            f"author {author_name} <{author_email}> {timestamp} {timezone}",
-            f"committer {author_name} <{author_email}> {timestamp} {timezone}",
-            "",
-            message
-        ])
-        
-        commit_content = "\n".join(commit_items)
-        
-        # コミットをハッシュして保存
-        commit_hash = self.hash_object(commit_content.encode(), 'commit')
+        # ツリーとコミットのオブジェクトはまとめて同期する
+        with self.write_batch():
+            # インデックスからツリーを作成
+            tree_hash = self.create_tree()
+            
+            # 設定から作者情報を取得
+            config = self.get_config()
+            author_name = config.get('user', {}).get('name', '不明')
+            author_email = config.get('user', {}).get('email', 'unknown@example.com')
+            
+            # 親コミットを取得（参照を書き換えるときに、この値から変わっていないことを確かめる）
+            parents = []
+            branch = self.get_current_branch()
+            ref_name = branch or 'HEAD'
+            old_value = self._read_ref(ref_name)
+            if branch and old_value:
+                parents.append(old_value)
+            
+            # コミットコンテンツを作成
+            commit_items = [
+                f"tree {tree_hash}",
+            ]
+            
+            for parent in parents:
+                commit_items.append(f"parent {parent}")
+            
+            timestamp = int(time.time())
+            timezone = time.strftime("%z")
+            
+            commit_items.extend([
+                f"author {author_name} <{author_email}> {timestamp} {timezone}",
+                f"committer {author_name} <{author_email}> {timestamp} {timezone}",
+                "",
+                message
+            ])
+            
+            commit_content = "\n".join(commit_items)
+            
+            # コミットをハッシュして保存
+            commit_hash = self.hash_object(commit_content.encode(), 'commit')
         
-        # ブランチ参照を更新
-        if branch:
-            branch_file = self.branches_dir / branch
-            with open(branch_file, 'w') as f:
-                f.write(commit_hash)
-        else:
-            # デタッチドHEAD状態 - HEADを直接更新
-            with open(self.head_file, 'w') as f:
-                f.write(commit_hash)
+        # ブランチ参照を更新（デタッチドHEAD状態ではHEADを直接更新）
+        try:
+            self.update_ref(ref_name, commit_hash, old_value)
+        except RefConflictError as e:
+            return False, str(e)
         
         return True, f"コミット {commit_hash[:8]} を作成しました"
     
-    def log(self, count=10):
-        """コミットログを表示する"""
-        branch = self.get_current_branch()
-        if not branch:
-            with open(self.head_file, 'r') as f:
-                current_commit = f.read().strip()
-        else:
-            current_commit = self.get_branch_commit(branch)
-        
+    def log(self, count=10, name_status=False, renames=None, stat=False):
+        """コミットログを表示する（name_status / stat が真の場合は親コミットからの変更ファイルや行数も含める）"""
+        current_commit = self.resolve_revision('HEAD')
         if not current_commit:
             return False, "まだコミットがありません"
         
-        log_entries = []
-        commit_hash = current_commit
-        
-        while commit_hash and len(log_entries) < count:
-            obj_type, commit_data = self.get_object(commit_hash, 'commit')
-            if not commit_data:
+        return True, list(itertools.islice(self.iter_log(current_commit, name_status, renames, stat), count))
+    
+    def iter_log(self, start=None, name_status=False, renames=None, stat=False):
+        """start（省略時はHEAD）から最初の親をたどり、ログエントリを1つずつ生成する
+        
+        name_status / stat が真の場合は、各エントリに親コミットからの変更ファイル（'changes'）や行数（'stats'）も含める。
+        """
+        commit_hash = start or self.resolve_revision('HEAD')
+        if name_status:
+            renames, threshold = self._get_rename_settings(renames)
+        
+        while commit_hash:
+            commit_info = self._parse_commit(commit_hash)
+            if commit_info is None:
                 break
-                
-            commit_content = commit_data.decode()
-            commit_lines = commit_content.split('\n')
             
-            # コミットデータを解析
-            commit_info = {
+            # ログエントリをフォーマット
+            author_name, date_str = self._split_signature(commit_info['author'])
+            
+            log_entry = {
                 'hash': commit_hash,
-                'tree': None,
-                'parents': [],
-                'author': None,
-                'committer': None,
-                'message': []
+                'tree': commit_info['tree'],
+                'parents': commit_info['parents'],
+                'author': author_name,
+                'date': date_str,
+                'message': '\n'.join(commit_info['message'])
             }
             
+            if name_status:
+                # 最初の親とのツリー比較で変更されたファイルを求める（ルートコミットは全ファイルが追加）
+                parent_tree = self._get_commit_tree(commit_info['parents'][0]) if commit_info['parents'] else None
+                log_entry['changes'] = [
+                    {'status': status, 'old_path': old_path, 'path': new_path or old_path}
+                    for status, old_path, new_path, old_hash, new_hash
+                    in self._tree_changes(parent_tree, commit_info['tree'], renames, threshold)
+                ]
+            
+            if stat:
+                log_entry['stats'] = self.commit_stats(commit_hash, commit_info['parents'][:1], renames)
+            
+            yield log_entry
+            
+            # 親コミットに移動
+            commit_hash = commit_info['parents'][0] if commit_info['parents'] else None
+    
+    def log_page(self, cursor=None, count=50):
+        """履歴を1ページ分取得する（戻り値の 'next' を次の cursor に渡すと続きを取得できる）"""
+        try:
+            start = cursor or self.resolve_revision('HEAD')
+            if not start:
+                return True, {'entries': [], 'next': None}
+            
+            entries = list(itertools.islice(self.iter_log(start), count))
+        except Exception as e:
+            return False, f"コミット履歴の取得中にエラーが発生しました: {str(e)}"
+        
+        next_cursor = None
+        if len(entries) == count and entries[-1]['parents']:
+            next_cursor = entries[-1]['parents'][0]
+        return True, {'entries': entries, 'next': next_cursor}
+    
+    def commit_details(self, commit_hash, renames=None):
+        """コミットの詳細（親コミット、作者、コミッター、変更されたファイル）を取得する"""
+        try:
+            commit_info = self._parse_commit(commit_hash)
+            if commit_info is None:
+                return False, f"コミット '{commit_hash}' が見つかりません"
+            
+            parent_tree = self._get_commit_tree(commit_info['parents'][0]) if commit_info['parents'] else None
+            changes = [
+                {'status': status, 'old_path': old_path, 'path': new_path or old_path}
+                for status, old_path, new_path, old_hash, new_hash
+                in self._tree_changes(parent_tree, commit_info['tree'], *self._get_rename_settings(renames))
+            ]
+        except Exception as e:
+            return False, f"コミットの詳細を取得できませんでした: {str(e)}"
+        
+        author_name, date_str = self._split_signature(commit_info['author'])
+        committer_name, commit_date_str = self._split_signature(commit_info['committer'])
+        return True, {
+            'hash': commit_hash,
+            'tree': commit_info['tree'],
+            'parents': commit_info['parents'],
+            'author': author_name,
+            'date': date_str,
+            'committer': committer_name,
+            'commit_date': commit_date_str,
+            'message': '\n'.join(commit_info['message']),
+            'changes': changes
+        }
+    
+    def _split_signature(self, signature):
+        """「名前 <メール> タイムスタンプ タイムゾーン」形式の署名を (名前, 日時の文字列) に分ける"""
+        parts = signature.split()
+        timestamp = int(parts[-2])
+        return ' '.join(parts[:-2]), datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+    
+    def _parse_commit(self, commit_hash):
+        """コミットオブジェクトを解析する（存在しない場合はNone）"""
+        obj_type, commit_data = self.get_object(commit_hash, 'commit')
+        if not commit_data:
+            return None
+        
+        commit_info = {
+            'tree': None,
+            'parents': [],
+            'author': None,
+            'committer': None,
+            'message': []
+        }
+        
+        with self.metrics.phase('parse'):
             message_start = False
-            for line in commit_lines:
+            for line in commit_data.decode().split('\n'):
                 if not line.strip() and not message_start:
                     message_start = True
                     continue
@@ -360,59 +1183,107 @@ class Repository:
                     commit_info['author'] = line[7:]
                 elif line.startswith('committer '):
                     commit_info['committer'] = line[10:]
-            
-            # ログエントリをフォーマット
-            author_parts = commit_info['author'].split()
-            author_name = ' '.join(author_parts[:-2])
-            timestamp = int(author_parts[-2])
-            date_str = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-            
-            log_entry = {
-                'hash': commit_hash,
-                'author': author_name,
-                'date': date_str,
-                'message': '\n'.join(commit_info['message'])
-            }
-            
-            log_entries.append(log_entry)
-            
-            # 親コミットに移動
-            if commit_info['parents']:
-                commit_hash = commit_info['parents'][0]
-            else:
-                break
         
-        return True, log_entries
+        return commit_info
     
-    def status(self):
-        """リポジトリの状態を表示する"""
+    def status(self, paths=None, progress=None):
+        """リポジトリの状態を表示する（paths を指定した場合は、そのファイルだけを調べる）"""
         status_info = {
             'branch': self.get_current_branch(),
             'staged_changes': [],
             'unstaged_changes': [],
-            'untracked_files': []
+            'untracked_files': [],
+            'deleted_files': [],
+            'renamed_files': []
         }
         
+        try:
+            for record in self.iter_status(paths, progress):
+                if record['state'] == 'renamed':
+                    status_info['renamed_files'].append(
+                        {'old_path': record['old_path'], 'path': record['path'], 'score': record['score']}
+                    )
+                else:
+                    status_info[STATUS_KEYS[record['state']]].append(record['path'])
+        except OperationCancelled as e:
+            return False, str(e)
+        
+        return True, status_info
+    
+    def iter_status(self, paths=None, progress=None):
+        """ワーキングディレクトリの状態をファイルごとに生成する（取り消されると OperationCancelled を送出する）
+        
+        要素は {'state': 状態, 'path': パス} の辞書で、状態は STATUS_KEYS のキーまたは 'renamed'（'old_path' と 'score' を含む）。
+        変更されたファイルは走査しながら返し、名前変更の検出に使う未追跡・削除のファイルとステージングされたファイルは走査の後に返す。
+        """
+        progress = progress or Progress()
+        
         # 現在のインデックスを取得
         index = self.get_index()
+        index_mtime = self._index_mtime()
+        sparse_patterns = self.get_sparse_patterns()
         
-        # ワーキングディレクトリ内のすべてのファイルをチェック
-        for file_path in self.repo_path.glob('**/*'):
-            if file_path.is_file() and '.lvcs' not in str(file_path):
-                try:
-                    rel_path = str(file_path.relative_to(self.repo_path))
-                    
-                    if rel_path in index:
-                        # ファイルが変更されたかチェック
-                        current_hash = self._get_file_hash(file_path)
-                        if current_hash != index[rel_path]['hash']:
-                            status_info['unstaged_changes'].append(rel_path)
-                    else:
-                        # 未追跡ファイル
-                        status_info['untracked_files'].append(rel_path)
-                except Exception:
-                    # 例外を無視して続行
+        if paths is None:
+            with self.metrics.phase('walk'):
+                working_files = list(self._iter_working_files(self.repo_path, sparse_patterns))
+        else:
+            paths = {os.path.normpath(path) for path in paths}
+            working_files = [
+                (self.repo_path / path, path) for path in sorted(paths)
+                if (self.repo_path / path).is_file() and self._in_sparse_cone(path, sparse_patterns)
+            ]
+        
+        # ワーキングディレクトリ内のファイルをチェック（スパース範囲外は走査しない）
+        seen = set()
+        unstaged = set()
+        untracked = []
+        bytes_done = 0
+        for done, (file_path, rel_path) in enumerate(working_files):
+            progress.update('status', done, len(working_files), bytes_done)
+            
+            seen.add(rel_path)
+            try:
+                if rel_path not in index:
+                    # 未追跡ファイル
+                    untracked.append(rel_path)
                     continue
+                
+                # ファイルが変更されたかチェック（大きさと更新日時が記録したときのままなら内容は読まない）
+                with self.metrics.phase('stat'):
+                    stat = file_path.stat()
+                bytes_done += stat.st_size
+                if not self._file_modified(file_path, index[rel_path], index_mtime, stat):
+                    continue
+            except Exception:
+                # 例外を無視して続行
+                continue
+            
+            unstaged.add(rel_path)
+            yield {'state': 'modified', 'path': rel_path}
+        
+        progress.update('status', len(working_files), len(working_files), bytes_done)
+        
+        # インデックスにあるがワーキングディレクトリから消えたファイル（skip-worktree は除く）
+        pending = {'deleted_files': [], 'untracked_files': untracked, 'renamed_files': []}
+        for path, info in index.items():
+            if paths is not None and path not in paths:
+                continue
+            if path not in seen and not info.get('skip_worktree') and self._in_sparse_cone(path, sparse_patterns):
+                pending['deleted_files'].append(path)
+        
+        # 消えたファイルと未追跡のファイルの組から名前変更を検出する
+        renames, threshold = self._get_rename_settings()
+        if renames and pending['deleted_files'] and untracked:
+            self._detect_working_renames(pending, index, threshold)
+        
+        for rename in pending['renamed_files']:
+            yield dict(rename, state='renamed')
+        for path in pending['deleted_files']:
+            yield {'state': 'deleted', 'path': path}
+        for path in untracked:
+            yield {'state': 'untracked', 'path': path}
+        
+        deleted = set(pending['deleted_files']) | {r['old_path'] for r in pending['renamed_files']}
         
         # ステージングされた変更をチェック
         branch = self.get_current_branch()
@@ -433,18 +1304,46 @@ class Repository:
                     # インデックスとコミットの内容を比較
                     staged_dict = {}
                     for path, info in index.items():
+                        # skip-worktree のエントリはコミット時のまま
+                        if info.get('skip_worktree') or (paths is not None and path not in paths):
+                            continue
                         staged_dict[path] = info['hash']
                     
                     # 最後のコミットのファイルリストと比較
                     for file_path, file_hash in staged_dict.items():
                         # コミットされたバージョンのハッシュを取得するには、ツリーを再帰的に辿る必要があります
                         # 簡略化のため、ここではステージングされたファイルはすべて変更としてマークします
-                        if file_path not in status_info['unstaged_changes']:
-                            status_info['staged_changes'].append(file_path)
-        
-        return True, status_info
+                        if file_path not in unstaged and file_path not in deleted:
+                            yield {'state': 'staged', 'path': file_path}
+    
+    def _detect_working_renames(self, status_info, index, threshold):
+        """ワーキングディレクトリで名前変更されたファイルを検出し、ステータス情報を更新する"""
+        try:
+            found = diff_engine.detect_renames(
+                {path: index[path]['hash'] for path in status_info['deleted_files']},
+                {path: self._hash_file(self.repo_path / path) for path in status_info['untracked_files']},
+                lambda path: self.get_object(index[path]['hash'], 'blob')[1],
+                lambda path: (self.repo_path / path).read_bytes(),
+                threshold
+            )
+        except Exception:
+            # 検出に失敗しても、削除と未追跡のファイルとして表示する
+            return
+        
+        for status, old_path, new_path, score in found:
+            status_info['deleted_files'].remove(old_path)
+            status_info['untracked_files'].remove(new_path)
+            status_info['renamed_files'].append({'old_path': old_path, 'path': new_path, 'score': score})
+    
+    def _get_rename_settings(self, renames=None):
+        """名前変更の検出設定（False / True / 'copies'）と類似度のしきい値を読み込む"""
+        config = self.get_config().get('diff', {})
+        if renames is None:
+            renames = config.get('renames', True)
+        return renames, config.get('renamethreshold', diff_engine.DEFAULT_RENAME_THRESHOLD)
     
-    def checkout(self, branch_name):
+    @_write_operation
+    def checkout(self, branch_name, progress=None):
         """指定されたブランチにチェックアウトする"""
         # ブランチが存在するか確認
         branch_file = self.branches_dir / branch_name
@@ -456,15 +1355,26 @@ class Repository:
         with open(branch_file, 'r') as f:
             commit_hash = f.read().strip()
         
+        # 失敗・取り消し時に戻せるよう、元のHEADを保存しておく
+        head_backup = self._read_ref('HEAD')
+        
         # HEADファイルを更新
-        with open(self.head_file, 'w') as f:
-            f.write(f"ref: refs/heads/{branch_name}")
+        new_head = f"ref: refs/heads/{branch_name}"
+        try:
+            self.update_ref('HEAD', new_head, head_backup)
+        except RefConflictError as e:
+            return False, str(e)
         
         # ワーキングディレクトリを更新
-        return self._update_working_directory(commit_hash)
+        success, message = self._update_working_directory(commit_hash, progress)
+        if not success:
+            self.update_ref('HEAD', head_backup, new_head)
+        return success, message
     
-    def _update_working_directory(self, commit_hash):
-        """指定されたコミットでワーキングディレクトリを更新する"""
+    def _update_working_directory(self, commit_hash, progress=None):
+        """指定されたコミットでワーキングディレクトリを更新する（失敗・取り消し時は書き出したファイルを元に戻す）"""
+        progress = progress or Progress()
+        
         # コミットからツリーハッシュを取得
         obj_type, commit_data = self.get_object(commit_hash, 'commit')
         commit_lines = commit_data.decode().split('\n')
@@ -480,27 +1390,58 @@ class Repository:
         
         # 現在のインデックスをバックアップ
         index_backup = self.get_index()
+        written = []
+        blob_cache = None
         
         try:
-            # ファイルを取得して更新
+            # 書き出すファイルを先に列挙し、件数を確定させる
             new_index = {}
-            success, message = self._checkout_tree(tree_hash, self.repo_path, '', new_index)
+            writes = []
+            self._checkout_tree(tree_hash, '', new_index, writes, self.get_sparse_patterns())
             
-            if not success:
-                # 失敗した場合はバックアップを復元
-                self.update_index(index_backup)
-                return False, message
+            blob_cache = self._get_blob_cache()
+            bytes_done = 0
+            for done, (rel_path, obj_hash) in enumerate(writes):
+                progress.update('checkout', done, len(writes), bytes_done)
+                file_path = self.repo_path / rel_path
+                written.append((rel_path, file_path.exists()))
+                bytes_done += self._write_blob(obj_hash, file_path, blob_cache)
+                new_index[rel_path].update(self._stat_fields(file_path.stat()))
+            progress.update('checkout', len(writes), len(writes), bytes_done)
             
             # インデックスを更新
             self.update_index(new_index)
             return True, f"ブランチに正常にチェックアウトしました（コミット {commit_hash[:8]}）"
+        except OperationCancelled:
+            self._rollback_checkout(written, index_backup, blob_cache)
+            return False, "チェックアウトは取り消されました（書き出したファイルは元に戻しました）"
         except Exception as e:
             # エラーの場合はバックアップを復元
-            self.update_index(index_backup)
+            self._rollback_checkout(written, index_backup, blob_cache)
             return False, f"チェックアウト中にエラーが発生しました: {str(e)}"
+        finally:
+            if blob_cache:
+                blob_cache.save()
+    
+    def _rollback_checkout(self, written, index_backup, blob_cache=None):
+        """途中まで書き出したファイルを、元のインデックスの内容に戻す"""
+        for rel_path, existed in reversed(written):
+            file_path = self.repo_path / rel_path
+            info = index_backup.get(rel_path) or index_backup.get(os.path.normpath(rel_path))
+            try:
+                if info and not info.get('skip_worktree'):
+                    self._write_blob(info['hash'], file_path, blob_cache)
+                elif not existed and file_path.exists():
+                    # 新しく作成したファイルは削除する（元からあった未追跡のファイルはそのまま）
+                    file_path.unlink()
+            except Exception:
+                # 復元できないファイルがあっても残りの復元を続ける
+                continue
+        
+        self.update_index(index_backup)
     
-    def _checkout_tree(self, tree_hash, dir_path, prefix, index):
-        """ツリーオブジェクトを再帰的に展開してワーキングディレクトリを更新する"""
+    def _checkout_tree(self, tree_hash, prefix, index, writes, sparse_patterns=None):
+        """ツリーオブジェクトを再帰的にたどり、書き出すファイルとインデックスのエントリを列挙する"""
         obj_type, tree_data = self.get_object(tree_hash, 'tree')
         tree_content = tree_data.decode()
         
@@ -522,38 +1463,37 @@ class Repository:
             name = parts[1]
             
             # ファイルパスを構築
-            file_path = dir_path / name
             rel_path = prefix + name if not prefix else prefix + '/' + name
             
             if obj_type == 'tree':
-                # ディレクトリの場合は再帰的に処理
-                file_path.mkdir(exist_ok=True)
-                success, message = self._checkout_tree(obj_hash, file_path, rel_path, index)
-                if not success:
-                    return False, message
+                # ディレクトリの場合は再帰的に処理（スパース範囲外はインデックスのみ）
+                self._checkout_tree(obj_hash, rel_path, index, writes, sparse_patterns)
+            elif obj_type == 'blob' and not self._in_sparse_cone(rel_path, sparse_patterns):
+                # スパース範囲外のファイルは書き出さず skip-worktree としてインデックスに残す
+                index[rel_path] = {
+                    'hash': obj_hash,
+                    'timestamp': datetime.now().timestamp(),
+                    'skip_worktree': True
+                }
             elif obj_type == 'blob':
-                # ファイルの場合はコンテンツを取得して書き込む
-                _, blob_data = self.get_object(obj_hash, 'blob')
-                
-                # 親ディレクトリが存在することを確認
-                file_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                with open(file_path, 'wb') as f:
-                    f.write(blob_data)
+                # ファイルの場合は書き出す対象に加える
+                writes.append((rel_path, obj_hash))
                 
                 # インデックスを更新
                 index[rel_path] = {
                     'hash': obj_hash,
                     'timestamp': datetime.now().timestamp()
                 }
-        
-        return True, "成功"
     
     def branch(self, branch_name=None, delete=False):
         """新しいブランチを作成または既存のブランチを削除する"""
         if branch_name is None:
-            # すべてのブランチを一覧表示
-            branches = [path.name for path in self.branches_dir.glob('*')]
+            # すべてのブランチを一覧表示（ロックは取得しない）
+            # 書き込み途中の一時ファイルとロックファイルはブランチとして扱わない
+            branches = [
+                path.name for path in self.branches_dir.glob('*')
+                if not path.name.startswith(TMP_PREFIX) and not path.name.endswith(LOCK_SUFFIX)
+            ]
             current_branch = self.get_current_branch()
             
             return True, {
@@ -561,6 +1501,11 @@ class Repository:
                 'current': current_branch
             }
         
+        return self._change_branch(branch_name, delete)
+    
+    @_write_operation
+    def _change_branch(self, branch_name, delete):
+        """ブランチを作成または削除する"""
         branch_file = self.branches_dir / branch_name
         
         if delete:
@@ -573,10 +1518,15 @@ class Repository:
             if current_branch == branch_name:
                 return False, f"ブランチ '{branch_name}' はHEADが指しているため削除できません"
             
-            branch_file.unlink()
+            try:
+                self.update_ref(branch_name, None, self._read_ref(branch_name))
+            except RefConflictError as e:
+                return False, str(e)
             return True, f"ブランチ '{branch_name}' を削除しました"
         else:
             # ブランチを作成
+            if branch_name.startswith(TMP_PREFIX) or branch_name.endswith(LOCK_SUFFIX):
+                return False, f"ブランチ名に '{TMP_PREFIX}' で始まる名前や '{LOCK_SUFFIX}' で終わる名前は使えません"
             if branch_file.exists():
                 return False, f"ブランチ '{branch_name}' はすでに存在します"
             
@@ -591,86 +1541,605 @@ class Repository:
             if not current_commit:
                 return False, "ブランチを作成するためのコミットがありません"
             
-            # 新しいブランチを作成
-            with open(branch_file, 'w') as f:
-                f.write(current_commit)
-                
+            # 新しいブランチを作成（同時に作成された場合は失敗させる）
+            try:
+                self.update_ref(branch_name, current_commit, '')
+            except RefConflictError:
+                return False, f"ブランチ '{branch_name}' はすでに存在します"
+            
             return True, f"ブランチ '{branch_name}' を作成しました"
     
-    def diff(self, path=None):
+    def diff(self, path=None, algorithm=None, context=None, progress=None):
         """インデックスとワーキングディレクトリ間の差分を表示する"""
+        try:
+            return True, list(self.iter_diff(path, algorithm, context=context, progress=progress))
+        except OperationCancelled as e:
+            return False, str(e)
+        except Exception as e:
+            return False, f"差分の取得中にエラーが発生しました: {str(e)}"
+    
+    def iter_diff(self, path=None, algorithm=None, status_info=None, context=None, progress=None):
+        """インデックスとワーキングディレクトリ間の差分を1行ずつ生成する（取り消されると OperationCancelled を送出する）"""
+        for record in self.iter_diff_files(path, algorithm, status_info, context, progress):
+            # ファイルを指定した場合は見出しを付けない
+            if not path:
+                yield self._diff_file_header(record['status'], record['old_path'], record['path'])
+            yield from record['lines']
+            if not path:
+                yield ""  # 空行を追加
+    
+    def iter_diff_files(self, path=None, algorithm=None, status_info=None, context=None, progress=None):
+        """インデックスとワーキングディレクトリ間の差分をファイルごとに生成する（取り消されると OperationCancelled を送出する）
+        
+        要素は {'status': 'M'/'A'/'D'/'R<類似度>', 'old_path': 変更前のパス, 'path': パス, 'lines': 差分の行のリスト} の辞書。
+        """
+        progress = progress or Progress()
+        algorithm = self._get_diff_algorithm(algorithm)
+        
+        # インデックスと設定は一度だけ読み込み、すべてのファイルで共有する
         index = self.get_index()
-        diff_output = []
+        diff_settings = self._get_diff_settings(context)
         
         if path:
             # 特定のファイルの差分
             full_path = (self.repo_path / path).resolve()
+            rel_path = str(full_path.relative_to(self.repo_path.resolve()))
+            lines = self._diff_working_file(rel_path, full_path, index, algorithm, diff_settings)
+            if lines:
+                if rel_path not in index:
+                    status = 'A'
+                else:
+                    status = 'M' if full_path.exists() else 'D'
+                yield {'status': status, 'old_path': None if status == 'A' else rel_path, 'path': rel_path, 'lines': lines}
+            return
+        
+        # すべての変更ファイルの差分（呼び出し元のステータス結果があれば再利用する）
+        if status_info is None:
+            status_success, status_info = self.status(progress=progress)
+            progress.update('diff', 0, None)
+            if not status_success:
+                raise RuntimeError("ステータス情報を取得できませんでした")
+        
+        jobs = [('M', file_path, file_path) for file_path in status_info['unstaged_changes']]
+        jobs += [('A', None, file_path) for file_path in status_info['untracked_files']]
+        jobs += [('D', file_path, file_path) for file_path in status_info.get('deleted_files', [])]
+        jobs += [
+            (f"R{rename['score']:03d}", rename['old_path'], rename['path'])
+            for rename in status_info.get('renamed_files', [])
+        ]
+        
+        def compute(job):
+            status, old_path, file_path = job
             try:
-                rel_path = str(full_path.relative_to(self.repo_path.resolve()))
-                
-                if rel_path in index:
-                    # インデックスからファイルのコンテンツを取得
-                    obj_type, staged_data = self.get_object(index[rel_path]['hash'], 'blob')
-                    staged_content = staged_data.decode('utf-8', errors='replace').splitlines()
-                    
-                    # 現在のファイルコンテンツを取得
-                    if full_path.exists():
-                        with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
-                            current_content = f.read().splitlines()
-                    else:
-                        current_content = []
-                    
-                    # 差分を計算
-                    diff = list(difflib.unified_diff(
-                        staged_content, current_content,
-                        f'a/{rel_path}', f'b/{rel_path}',
-                        lineterm=''
-                    ))
-                    
-                    if diff:
-                        diff_output.extend(diff)
-                    
-                elif full_path.exists():
-                    # 未追跡のファイル
-                    with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
-                        current_content = f.read().splitlines()
-                    
-                    diff = list(difflib.unified_diff(
-                        [], current_content,
-                        f'/dev/null', f'b/{rel_path}',
-                        lineterm=''
-                    ))
-                    
-                    if diff:
-                        diff_output.extend(diff)
+                lines = self._diff_working_file(
+                    file_path, self.repo_path / file_path, index, algorithm, diff_settings, old_path
+                )
+            except Exception:
+                # 個別ファイルのエラーは無視して続行
+                lines = []
+            return {'status': status, 'old_path': old_path, 'path': file_path, 'lines': lines}
+        
+        for done, record in enumerate(self._iter_parallel(compute, jobs), 1):
+            progress.update('diff', done, len(jobs))
             
-            except Exception as e:
-                return False, f"差分の取得中にエラーが発生しました: {str(e)}"
+            # 名前変更は内容が同じでも返す
+            if record['lines'] or record['status'][0] == 'R':
+                yield record
+    
+    def _diff_file_header(self, status, old_path, path):
+        """差分のファイルごとの見出し行を作成する"""
+        if status[0] == 'R':
+            return f"--- {old_path} → {path} (名前変更 {int(status[1:])}%) ---"
+        if status[0] == 'C':
+            return f"--- {old_path} → {path} (コピー {int(status[1:])}%) ---"
+        if status == 'A':
+            return f"--- {path} (新規) ---"
+        if status == 'D':
+            return f"--- {path} (削除) ---"
+        return f"--- {path} ---"
+    
+    def _diff_working_file(self, rel_path, full_path, index, algorithm, diff_settings=None, old_path=None):
+        """1つのファイルについて、インデックスとワーキングディレクトリの差分を計算する（old_path は名前変更前のパス）"""
+        diff_settings = diff_settings or self._get_diff_settings()
+        old_path = old_path or rel_path
+        
+        if old_path in index:
+            staged_hash = index[old_path]['hash']
+            staged = (staged_hash, self._get_object_size(staged_hash), lambda: self.get_object(staged_hash, 'blob')[1])
+            
+            # 現在のファイルの状態を取得（内容はblobハッシュをキーにキャッシュされる）
+            if full_path.exists():
+                current_hash = self._hash_file(full_path)
+                # ハッシュが同じなら内容を読まずに差分なしとする
+                if current_hash == staged_hash:
+                    return []
+                current = (current_hash, full_path.stat().st_size, full_path.read_bytes)
+            else:
+                current = (None, 0, bytes)
+            
+            return self._diff_data(rel_path, staged, current, f'a/{old_path}', f'b/{rel_path}', algorithm, diff_settings)
+        elif full_path.exists():
+            # 未追跡のファイル
+            current = (self._hash_file(full_path), full_path.stat().st_size, full_path.read_bytes)
+            return self._diff_data(rel_path, (None, 0, bytes), current, f'/dev/null', f'b/{rel_path}', algorithm, diff_settings)
+        
+        return []
+    
+    def _get_diff_settings(self, context=None):
+        """差分表示の設定（コンテキスト行数、大きなファイルのしきい値、.lvcsattributes）を読み込む"""
+        config = self.get_config().get('diff', {})
+        self.diff_cache.persist = config.get('persistentcache', False)
+        return {
+            'context': config.get('context', diff_engine.DEFAULT_CONTEXT) if context is None else context,
+            'bigfilethreshold': config.get('bigfilethreshold', DEFAULT_BIG_FILE_THRESHOLD),
+            'attributes': self._get_attributes()
+        }
+    
+    def _get_attributes(self):
+        """リポジトリルートの .lvcsattributes を (パターン, 属性リスト) のリストとして読み込む"""
+        attributes_file = self.repo_path / '.lvcsattributes'
+        if not attributes_file.exists():
+            return []
+        
+        rules = []
+        with open(attributes_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if not parts or parts[0].startswith('#'):
+                    continue
+                rules.append((parts[0], parts[1:]))
+        return rules
+    
+    def _get_diff_attribute(self, rel_path, attributes):
+        """ファイルの差分属性を返す（'binary'、'text'、または指定なしのNone）"""
+        rel_path = rel_path.replace('\\', '/')
+        name = rel_path.rsplit('/', 1)[-1]
+        result = None
+        
+        # 後に書かれたルールを優先する
+        for pattern, attrs in attributes:
+            target = rel_path if '/' in pattern else name
+            if not fnmatch.fnmatchcase(target, pattern.lstrip('/')):
+                continue
+            for attr in attrs:
+                if attr in ('binary', '-diff', '-text'):
+                    result = 'binary'
+                elif attr in ('diff', 'text'):
+                    result = 'text'
+        return result
+    
+    def _is_binary(self, data):
+        """先頭ブロックにNULバイトが含まれるかどうかでバイナリファイルを判定する"""
+        return b'\0' in data[:BINARY_SNIFF_SIZE]
+    
+    def _diff_data(self, rel_path, old, new, fromfile, tofile, algorithm, diff_settings):
+        """2つの内容の差分を計算する（old/new は (blob ID, サイズ, 内容を読み込む関数) の組）"""
+        old_id, old_size, load_old = old
+        new_id, new_size, load_new = new
+        attr = self._get_diff_attribute(rel_path, diff_settings['attributes'])
+        
+        binary_message = f"バイナリファイル {fromfile} と {tofile} は異なります（{old_size} → {new_size} バイト）"
+        if attr == 'binary':
+            return [binary_message]
+        
+        if attr != 'text' and max(old_size, new_size) > diff_settings['bigfilethreshold']:
+            return [f"大きなファイル {fromfile} と {tofile} は異なります（{old_size} → {new_size} バイト）"]
+        
+        # 同じ内容の組み合わせの差分はキャッシュから返す（ファイル名を含むヘッダーは除いて保存）
+        cache_key = (old_id or '', new_id or '', algorithm, diff_settings['context'], attr or '')
+        hunks = self.diff_cache.get(cache_key)
+        
+        if hunks is None:
+            self.metrics.count('diff_cache_misses')
+            old_data = load_old()
+            new_data = load_new()
+            
+            with self.metrics.phase('diff'):
+                if attr != 'text' and (self._is_binary(old_data) or self._is_binary(new_data)):
+                    hunks = [BINARY_DIFF_MARKER]
+                else:
+                    hunks = list(diff_engine.unified_diff(
+                        old_data.decode('utf-8', errors='replace').splitlines(),
+                        new_data.decode('utf-8', errors='replace').splitlines(),
+                        n=diff_settings['context'], lineterm='', algorithm=algorithm
+                    ))[2:]
+            
+            self.diff_cache.put(cache_key, hunks)
         else:
-            # すべての変更ファイルの差分
-            status_success, status_info = self.status()
-            if not status_success:
-                return False, "ステータス情報を取得できませんでした"
-            
-            # 未ステージングの変更を処理
-            for file_path in status_info['unstaged_changes']:
-                sub_success, sub_diff = self.diff(file_path)
-                if sub_success and sub_diff:
-                    diff_output.append(f"--- {file_path} ---")
-                    diff_output.extend(sub_diff)
-                    diff_output.append("")  # 空行を追加
-            
-            # 未追跡ファイルを処理
-            for file_path in status_info['untracked_files']:
-                sub_success, sub_diff = self.diff(file_path)
-                if sub_success and sub_diff:
-                    diff_output.append(f"--- {file_path} (新規) ---")
-                    diff_output.extend(sub_diff)
-                    diff_output.append("")  # 空行を追加
-        
-        return True, diff_output
-    
-    def reset(self, path=None, hard=False):
+            self.metrics.count('diff_cache_hits')
+        
+        if hunks == [BINARY_DIFF_MARKER]:
+            return [binary_message]
+        if not hunks:
+            return []
+        return [f'--- {fromfile}', f'+++ {tofile}'] + hunks
+    
+    def _iter_parallel(self, func, items, max_workers=None):
+        """items に func をワーカープールで適用し、結果を入力順に返す"""
+        # concurrent.futures の読み込みは重いため、並列処理を行う操作でだけ読み込む
+        from concurrent.futures import ThreadPoolExecutor
+        
+        max_workers = max_workers or min(8, os.cpu_count() or 1)
+        items = iter(items)
+        pending = deque()
+        
+        # 先行して計算する件数を制限し、メモリ使用量を抑える
+        window = max_workers * 2
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                for item in itertools.islice(items, window):
+                    pending.append(executor.submit(func, item))
+                
+                while pending:
+                    result = pending.popleft().result()
+                    for item in itertools.islice(items, 1):
+                        pending.append(executor.submit(func, item))
+                    yield result
+            finally:
+                # 途中で読み捨てられた場合は未実行のタスクを取り消す
+                for future in pending:
+                    future.cancel()
+    
+    def _get_diff_algorithm(self, algorithm=None):
+        """使用する差分アルゴリズムを決定する（未指定の場合は設定値）"""
+        if algorithm is None:
+            algorithm = self.get_config().get('diff', {}).get('algorithm', diff_engine.DEFAULT_ALGORITHM)
+        if algorithm not in diff_engine.ALGORITHMS:
+            raise ValueError(f"不明な差分アルゴリズムです: {algorithm}")
+        return algorithm
+    
+    def resolve_revision(self, revision):
+        """ブランチ名・HEAD・コミットハッシュ（短縮形可）をコミットハッシュに解決する"""
+        if revision == 'HEAD':
+            branch = self.get_current_branch()
+            if branch:
+                return self.get_branch_commit(branch)
+            with open(self.head_file, 'r') as f:
+                return f.read().strip() or None
+        
+        # ブランチ名を優先する
+        if (self.branches_dir / revision).is_file():
+            return self.get_branch_commit(revision)
+        
+        revision = revision.lower()
+        if len(revision) < 4 or any(c not in '0123456789abcdef' for c in revision):
+            return None
+        
+        # 短縮ハッシュは同じファンアウトディレクトリ内から前方一致で探す
+        fanout_dir = self.objects_dir / revision[:2]
+        if not fanout_dir.is_dir():
+            return None
+        
+        candidates = [revision[:2] + name for name in os.listdir(fanout_dir) if name.startswith(revision[2:])]
+        commits = []
+        for candidate in candidates:
+            obj_type, _ = self.get_object(candidate)
+            if obj_type == 'commit':
+                commits.append(candidate)
+        
+        return commits[0] if len(commits) == 1 else None
+    
+    def _get_commit_tree(self, commit_hash):
+        """コミットが指すツリーのハッシュを取得する"""
+        obj_type, commit_data = self.get_object(commit_hash, 'commit')
+        if not commit_data:
+            return None
+        
+        for line in commit_data.decode().split('\n'):
+            if line.startswith('tree '):
+                return line[5:]
+            if not line.strip():
+                break
+        return None
+    
+    def _read_tree(self, tree_hash):
+        """ツリーオブジェクトを {名前: (型, ハッシュ)} の辞書として読み込む"""
+        entries = {}
+        if not tree_hash:
+            return entries
+        
+        obj_type, tree_data = self.get_object(tree_hash, 'tree')
+        if not tree_data:
+            return entries
+        
+        with self.metrics.phase('parse'):
+            for line in tree_data.decode().split('\n'):
+                parts = line.split('\t')
+                if len(parts) != 2:
+                    continue
+                
+                mode_type_hash = parts[0].split()
+                if len(mode_type_hash) != 3:
+                    continue
+                
+                mode, obj_type, obj_hash = mode_type_hash
+                entries[parts[1]] = (obj_type, obj_hash)
+        
+        return entries
+    
+    def _iter_tree_changes(self, old_tree, new_tree, prefix=''):
+        """2つのツリーを再帰的に比較し、変更を (状態, パス, 旧ハッシュ, 新ハッシュ) で返す"""
+        # ハッシュが同じサブツリーは中身を読まずにスキップする
+        if old_tree == new_tree:
+            return
+        
+        old_entries = self._read_tree(old_tree)
+        new_entries = self._read_tree(new_tree)
+        
+        for name in sorted(set(old_entries) | set(new_entries)):
+            old_entry = old_entries.get(name)
+            new_entry = new_entries.get(name)
+            if old_entry == new_entry:
+                continue
+            
+            path = prefix + '/' + name if prefix else name
+            old_type, old_hash = old_entry or (None, None)
+            new_type, new_hash = new_entry or (None, None)
+            
+            if old_type == 'tree' or new_type == 'tree':
+                # ディレクトリ（ファイルとディレクトリが入れ替わった場合も含む）
+                if old_type == 'blob':
+                    yield 'D', path, old_hash, None
+                yield from self._iter_tree_changes(
+                    old_hash if old_type == 'tree' else None,
+                    new_hash if new_type == 'tree' else None,
+                    path
+                )
+                if new_type == 'blob':
+                    yield 'A', path, None, new_hash
+            elif old_entry is None:
+                yield 'A', path, None, new_hash
+            elif new_entry is None:
+                yield 'D', path, old_hash, None
+            else:
+                yield 'M', path, old_hash, new_hash
+    
+    def _tree_changes(self, old_tree, new_tree, renames=False, threshold=diff_engine.DEFAULT_RENAME_THRESHOLD):
+        """2つのツリーの変更を (状態, 旧パス, 新パス, 旧ハッシュ, 新ハッシュ) として順に生成する
+        
+        変更はパスの順（ツリーを名前順にたどった順）に生成し、名前変更とコピーは新しいパスの位置に置く。
+        renames が真の場合は名前変更（'copies' の場合はコピーも）を検出し、状態を 'R087' のように類似度付きで返す。
+        このとき最初の追加・削除（名前変更の候補）より前の変更は見つかり次第生成し、それ以降は検出が終わるまでためておく。
+        """
+        changes = (
+            (status, path if old_hash else None, path if new_hash else None, old_hash, new_hash)
+            for status, path, old_hash, new_hash in self._iter_tree_changes(old_tree, new_tree)
+        )
+        if not renames:
+            yield from changes
+            return
+        
+        # 名前変更の候補が現れた後の変更は、順序を保つため検出が終わるまでためておく
+        pending = []
+        deleted = {}
+        added = {}
+        # コピー元の候補は変更または削除されたファイルに限る
+        copy_sources = {} if renames == 'copies' else None
+        for change in changes:
+            status, old_path, new_path, old_hash, new_hash = change
+            if status == 'D':
+                deleted[old_path] = old_hash
+            elif status == 'A':
+                added[new_path] = new_hash
+            elif status == 'M' and copy_sources is not None:
+                copy_sources[old_path] = old_hash
+            
+            if pending or status in ('A', 'D'):
+                pending.append(change)
+            else:
+                yield change
+        
+        if not added or not (deleted or copy_sources):
+            yield from pending
+            return
+        
+        sources = dict(deleted, **(copy_sources or {}))
+        found = diff_engine.detect_renames(
+            deleted, added,
+            lambda path: self.get_object(sources[path], 'blob')[1],
+            lambda path: self.get_object(added[path], 'blob')[1],
+            threshold, copy_sources
+        )
+        renamed_from = {old_path for status, old_path, new_path, score in found if status == 'R'}
+        matched = {new_path: (status, old_path, score) for status, old_path, new_path, score in found}
+        
+        for change in pending:
+            status, old_path, new_path, old_hash, new_hash = change
+            if status == 'D' and old_path in renamed_from:
+                continue
+            if status == 'A' and new_path in matched:
+                kind, source, score = matched[new_path]
+                change = (f"{kind}{score:03d}", source, new_path, sources[source], new_hash)
+            yield change
+    
+    def diff_trees(self, old_revision, new_revision, renames=None):
+        """2つのコミット（ブランチ）間で変更されたファイルの一覧を取得する"""
+        try:
+            old_tree, new_tree = self._resolve_trees(old_revision, new_revision)
+        except ValueError as e:
+            return False, str(e)
+        
+        changes = [
+            {'status': status, 'path': new_path or old_path, 'old_path': old_path, 'old_hash': old_hash, 'new_hash': new_hash}
+            for status, old_path, new_path, old_hash, new_hash
+            in self._tree_changes(old_tree, new_tree, *self._get_rename_settings(renames))
+        ]
+        return True, changes
+    
+    def _resolve_trees(self, *revisions):
+        """リビジョンをそれぞれのルートツリーのハッシュに解決する"""
+        trees = []
+        for revision in revisions:
+            commit_hash = self.resolve_revision(revision)
+            if not commit_hash:
+                raise ValueError(f"リビジョン '{revision}' が見つかりません")
+            trees.append(self._get_commit_tree(commit_hash))
+        return trees
+    
+    def diff_commits(self, old_revision, new_revision, name_status=False, algorithm=None, context=None, renames=None):
+        """2つのコミット（ブランチ）間の差分を表示する"""
+        try:
+            return True, list(self.iter_diff_commits(old_revision, new_revision, name_status, algorithm, context, renames))
+        except Exception as e:
+            return False, str(e)
+    
+    def iter_diff_commits(self, old_revision, new_revision, name_status=False, algorithm=None, context=None, renames=None):
+        """2つのコミット（ブランチ）間の差分を1行ずつ生成する"""
+        records = self.iter_diff_commit_files(old_revision, new_revision, name_status, algorithm, context, renames)
+        
+        if name_status:
+            for record in records:
+                if record['status'][0] in 'RC':
+                    yield f"{record['status']}\t{record['old_path']}\t{record['path']}"
+                else:
+                    yield f"{record['status']}\t{record['path']}"
+            return
+        
+        for record in records:
+            yield self._diff_file_header(record['status'], record['old_path'], record['path'])
+            yield from record['lines']
+            yield ""  # 空行を追加
+    
+    def iter_diff_commit_files(self, old_revision, new_revision, name_status=False, algorithm=None, context=None, renames=None):
+        """2つのコミット（ブランチ）間の差分をファイルごとに生成する
+        
+        要素は {'status': 状態, 'old_path': 変更前のパス, 'path': パス, 'lines': 差分の行のリスト} の辞書。
+        name_status が真の場合は内容を読まず、'lines' を含めない。
+        """
+        old_tree, new_tree = self._resolve_trees(old_revision, new_revision)
+        algorithm = self._get_diff_algorithm(algorithm)
+        diff_settings = self._get_diff_settings(context)
+        changes = self._tree_changes(old_tree, new_tree, *self._get_rename_settings(renames))
+        
+        if name_status:
+            for status, old_path, new_path, old_hash, new_hash in changes:
+                yield {'status': status, 'old_path': old_path, 'path': new_path or old_path}
+            return
+        
+        def compute(change):
+            status, old_path, new_path, old_hash, new_hash = change
+            path = new_path or old_path
+            
+            # 差分のあるパスのblobだけを読み込む（サイズはヘッダーのみで判定）
+            return {'status': status, 'old_path': old_path, 'path': path, 'lines': self._diff_data(
+                path,
+                (old_hash, self._get_object_size(old_hash) if old_hash else 0,
+                 lambda: self.get_object(old_hash, 'blob')[1] if old_hash else b''),
+                (new_hash, self._get_object_size(new_hash) if new_hash else 0,
+                 lambda: self.get_object(new_hash, 'blob')[1] if new_hash else b''),
+                f'a/{old_path}' if old_hash else '/dev/null',
+                f'b/{path}' if new_hash else '/dev/null',
+                algorithm, diff_settings
+            )}
+        
+        yield from self._iter_parallel(compute, changes)
+    
+    def diff_stat(self, old_revision, new_revision, algorithm=None, renames=None):
+        """2つのコミット（ブランチ）間の変更ファイルごとの追加・削除行数を取得する"""
+        try:
+            old_tree, new_tree = self._resolve_trees(old_revision, new_revision)
+            return True, self._tree_stats(old_tree, new_tree, algorithm, renames)
+        except Exception as e:
+            return False, str(e)
+    
+    def commit_stats(self, commit_hash, parents=None, renames=None):
+        """コミットの最初の親からの変更行数を取得する（履歴は変わらないため、コミットIDごとにキャッシュする）"""
+        algorithm = self._get_diff_algorithm()
+        diff_settings = self._get_diff_settings()
+        renames, threshold = self._get_rename_settings(renames)
+        
+        # 結果を変えうる設定ごとに別のキャッシュとする
+        settings_key = hashlib.sha1(json.dumps(
+            [renames, threshold, algorithm, diff_settings['bigfilethreshold'], diff_settings['attributes']]
+        ).encode()).hexdigest()[:12]
+        cache_file = self.cache_dir / 'stats' / commit_hash[:2] / commit_hash[2:]
+        
+        cached = {}
+        try:
+            with open(cache_file, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if settings_key in cached:
+            self.metrics.count('stats_cache_hits')
+            return cached[settings_key]
+        
+        if parents is None:
+            parents = self._get_commit_parents(commit_hash)
+        parent_tree = self._get_commit_tree(parents[0]) if parents else None
+        stats = self._tree_stats(
+            parent_tree, self._get_commit_tree(commit_hash), algorithm, renames, threshold, diff_settings
+        )
+        
+        cached[settings_key] = stats
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_file.with_name(cache_file.name + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(cached, f)
+            os.replace(tmp_path, cache_file)
+        except OSError:
+            # キャッシュの書き込み失敗は無視する
+            pass
+        
+        return stats
+    
+    def _get_commit_parents(self, commit_hash):
+        """コミットの親コミットのハッシュのリストを取得する"""
+        obj_type, commit_data = self.get_object(commit_hash, 'commit')
+        parents = []
+        for line in commit_data.decode().split('\n'):
+            if line.startswith('parent '):
+                parents.append(line[7:])
+            if not line.strip():
+                break
+        return parents
+    
+    def _tree_stats(self, old_tree, new_tree, algorithm=None, renames=None, threshold=None, diff_settings=None):
+        """2つのツリー間で変更されたファイルごとの追加・削除行数を計算する"""
+        algorithm = self._get_diff_algorithm(algorithm)
+        diff_settings = diff_settings or self._get_diff_settings()
+        if threshold is None:
+            renames, threshold = self._get_rename_settings(renames)
+        
+        # 同じサブツリーは読まずに飛ばし、変更されたblobだけを読み込む
+        changes = self._tree_changes(old_tree, new_tree, renames, threshold)
+        return list(self._iter_parallel(
+            lambda change: self._change_stat(change, algorithm, diff_settings), changes
+        ))
+    
+    def _change_stat(self, change, algorithm, diff_settings):
+        """1つの変更について追加・削除行数を計算する（バイナリや大きなファイルはサイズのみ）"""
+        status, old_path, new_path, old_hash, new_hash = change
+        path = new_path or old_path
+        stat = {'status': status, 'old_path': old_path, 'path': path, 'added': 0, 'deleted': 0, 'binary': False}
+        if old_hash == new_hash:
+            return stat
+        
+        old_size = self._get_object_size(old_hash) if old_hash else 0
+        new_size = self._get_object_size(new_hash) if new_hash else 0
+        attr = self._get_diff_attribute(path, diff_settings['attributes'])
+        binary = attr == 'binary' or (attr != 'text' and max(old_size, new_size) > diff_settings['bigfilethreshold'])
+        
+        if not binary:
+            old_data = self.get_object(old_hash, 'blob')[1] if old_hash else b''
+            new_data = self.get_object(new_hash, 'blob')[1] if new_hash else b''
+            binary = attr != 'text' and (self._is_binary(old_data) or self._is_binary(new_data))
+        
+        if binary:
+            stat.update(binary=True, old_size=old_size, new_size=new_size)
+            return stat
+        
+        stat['added'], stat['deleted'] = diff_engine.count_changes(
+            old_data.decode('utf-8', errors='replace').splitlines(),
+            new_data.decode('utf-8', errors='replace').splitlines(),
+            algorithm
+        )
+        return stat
+    
+    @_write_operation
+    def reset(self, path=None, hard=False, progress=None):
         """インデックスまたはワーキングディレクトリをリセットする"""
         if path:
             # 特定のファイルをリセット
@@ -684,9 +2153,7 @@ class Repository:
                 if rel_path in index:
                     if hard:
                         # ハードリセット：ファイルをインデックスバージョンに復元
-                        obj_type, file_data = self.get_object(index[rel_path]['hash'], 'blob')
-                        with open(full_path, 'wb') as f:
-                            f.write(file_data)
+                        self._write_blob(index[rel_path]['hash'], full_path)
                     
                     # インデックスからファイルを削除
                     del index[rel_path]
@@ -706,7 +2173,7 @@ class Repository:
                 if branch:
                     commit_hash = self.get_branch_commit(branch)
                     if commit_hash:
-                        return self._update_working_directory(commit_hash)
+                        return self._update_working_directory(commit_hash, progress)
                     else:
                         return False, "ブランチにコミットがありません"
                 else:
@@ -716,6 +2183,7 @@ class Repository:
                 self.update_index({})
                 return True, "インデックスをリセットしました"
     
+    @_write_operation
     def merge(self, branch_name):
         """指定されたブランチを現在のブランチにマージする"""
         # 現在のブランチを取得
@@ -748,8 +2216,161 @@ class Repository:
         with open(branch_file, 'r') as f:
             target_commit = f.read().strip()
             
-        current_branch_file = self.branches_dir / current_branch
-        with open(current_branch_file, 'w') as f:
-            f.write(target_commit)
+        try:
+            self.update_ref(current_branch, target_commit, current_commit)
+        except RefConflictError as e:
+            return False, str(e)
             
         return True, f"ブランチ '{branch_name}' を '{current_branch}' にマージしました"
+    
+    def reachable_objects(self, progress=None):
+        """ブランチ・HEAD・インデックスから到達可能なオブジェクトのIDの集合（20バイトの bytes）を返す
+        
+        コミットはすべての親を、ツリーは同じものを一度だけたどり、blob は読み込まない。
+        起点から参照されるコミットやツリーを読み込めない場合は、その先を判定できないため ValueError を送出する。
+        """
+        progress = progress or Progress()
+        reachable = set()
+        pending = self.root_objects()
+        
+        while pending:
+            object_id, obj_type = pending.pop()
+            key = bytes.fromhex(object_id)
+            if key in reachable:
+                continue
+            reachable.add(key)
+            if len(reachable) % 1000 == 0:
+                progress.update('gc_mark', len(reachable))
+            
+            if obj_type == 'blob':
+                continue
+            
+            try:
+                found_type, data = self.get_object(object_id, obj_type)
+            except (OSError, ValueError, zlib.error) as e:
+                raise ValueError(f"{obj_type} オブジェクト {object_id} を読み込めません: {str(e)}")
+            if found_type is None:
+                raise ValueError(f"{obj_type} オブジェクト {object_id} が見つかりません")
+            
+            if obj_type == 'commit':
+                for line in data.decode().split('\n'):
+                    if not line.strip():
+                        break
+                    if line.startswith('tree '):
+                        pending.append((line[5:], 'tree'))
+                    elif line.startswith('parent '):
+                        pending.append((line[7:], 'commit'))
+            else:
+                for entry_type, entry_id in self._read_tree(object_id).values():
+                    if is_object_id(entry_id):
+                        pending.append((entry_id, entry_type))
+        
+        progress.update('gc_mark', len(reachable), len(reachable))
+        return reachable
+    
+    def root_objects(self):
+        """到達可能性を調べる起点（インデックスのblob、すべてのブランチとデタッチドHEADのコミット）を (ID, 型) のリストで返す"""
+        return [(object_id, 'blob') for object_id in self._index_blob_ids()] + [
+            (object_id, 'commit') for object_id in self._ref_commit_ids()
+        ]
+    
+    def _ref_commit_ids(self):
+        """すべてのブランチと、デタッチドHEADが指すコミットのIDを返す"""
+        commit_ids = []
+        for dir_path, dir_names, file_names in os.walk(self.branches_dir):
+            for name in file_names:
+                if name.startswith(TMP_PREFIX) or name.endswith(LOCK_SUFFIX):
+                    continue
+                with open(os.path.join(dir_path, name), 'r') as f:
+                    commit_ids.append(f.read().strip())
+        
+        with open(self.head_file, 'r') as f:
+            head = f.read().strip()
+        if not head.startswith('ref: '):
+            commit_ids.append(head)
+        
+        return [commit_id for commit_id in commit_ids if is_object_id(commit_id)]
+    
+    def _index_blob_ids(self):
+        """インデックスに記録されたblobのIDを返す"""
+        return [info['hash'] for info in self.get_index().values() if is_object_id(info.get('hash'))]
+    
+    def gc(self, expire_days=None, dry_run=False, progress=None):
+        """到達できないオブジェクトのうち、猶予期間（日数）より前に書き込まれたものを削除する
+        
+        到達可能なオブジェクトに印を付けた後、ファンアウトディレクトリを1つずつ走査して削除する。
+        猶予期間は、実行中の add などが書き込んだばかりでまだ参照されていないオブジェクトを守るためのもの。
+        dry_run が真の場合は削除せず、削除される件数とバイト数だけを数える。
+        """
+        progress = progress or Progress()
+        if expire_days is None:
+            expire_days = self.get_config().get('gc', {}).get('pruneexpire', DEFAULT_PRUNE_EXPIRE_DAYS)
+        cutoff = time.time() - expire_days * 86400
+        
+        result = {
+            'reachable': 0,
+            'examined': 0,
+            'pruned': 0,
+            'pruned_bytes': 0,
+            'kept_recent': 0,
+            'dry_run': dry_run
+        }
+        
+        try:
+            reachable = self.reachable_objects(progress)
+            result['reachable'] = len(reachable)
+            
+            with os.scandir(self.objects_dir) as entries:
+                fanout_dirs = sorted(entry.name for entry in entries if entry.is_dir() and len(entry.name) == 2)
+            
+            for done, fanout in enumerate(fanout_dirs):
+                progress.update('gc_sweep', done, len(fanout_dirs), result['pruned_bytes'])
+                
+                # 一度に扱うのは1つのディレクトリの分だけにする
+                expired = []
+                with os.scandir(os.path.join(self.objects_dir, fanout)) as entries:
+                    for entry in entries:
+                        object_id = fanout + entry.name
+                        if not is_object_id(object_id):
+                            # 異常終了した書き込みが残した一時ファイルも、猶予期間を過ぎていれば削除する
+                            if entry.name.startswith(TMP_PREFIX):
+                                try:
+                                    stat = entry.stat()
+                                except FileNotFoundError:
+                                    continue
+                                if stat.st_mtime <= cutoff:
+                                    expired.append((entry.path, stat.st_size))
+                            continue
+                        result['examined'] += 1
+                        if bytes.fromhex(object_id) in reachable:
+                            continue
+                        
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        if stat.st_mtime > cutoff:
+                            result['kept_recent'] += 1
+                        else:
+                            expired.append((entry.path, stat.st_size))
+                
+                for path, size in expired:
+                    if not dry_run:
+                        try:
+                            # 走査の後に add などが同じオブジェクトを書き込み、更新日時を新しくした場合は残す
+                            if os.stat(path).st_mtime > cutoff:
+                                result['kept_recent'] += 1
+                                continue
+                            os.unlink(path)
+                        except FileNotFoundError:
+                            continue
+                    result['pruned'] += 1
+                    result['pruned_bytes'] += size
+            
+            progress.update('gc_sweep', len(fanout_dirs), len(fanout_dirs), result['pruned_bytes'])
+        except OperationCancelled as e:
+            return False, str(e)
+        except (OSError, ValueError) as e:
+            return False, f"ガベージコレクションを中止しました: {str(e)}"
+        
+        return True, result
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from blob_cache import BlobCache
+
+
+class BlobCacheTest(unittest.TestCase):
+    """非圧縮blobキャッシュの LRU 削除と配置方法の切り替えを検証する"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def cache(self, **kwargs):
+        return BlobCache(self.cache_dir, threshold=1, **kwargs)
+    
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self.cache(max_size=10)
+        for index, sha1 in enumerate(('a' * 40, 'b' * 40, 'c' * 40)):
+            cache.store(sha1, b"1234")
+            cache.manifest[sha1]['last_used'] = index
+        # 最も古い a を使い直すと、次に古い b が削除される
+        self.assertIsNotNone(cache.lookup('a' * 40))
+        cache.save()
+        
+        reloaded = self.cache(max_size=10)
+        self.assertIsNotNone(reloaded.lookup('a' * 40))
+        self.assertIsNone(reloaded.lookup('b' * 40))
+        self.assertIsNotNone(reloaded.lookup('c' * 40))
+        self.assertFalse(os.path.exists(reloaded._entry_path('b' * 40)))
+    
+    def test_modified_cache_file_is_discarded(self):
+        cache = self.cache()
+        path = cache.store('a' * 40, b"original")
+        with open(path, 'wb') as f:
+            f.write(b"edited through a hard link")
+        
+        self.assertIsNone(cache.lookup('a' * 40))
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(cache.place('a' * 40, os.path.join(self.directory, 'out.bin')))
+    
+    def test_place_falls_back_to_plain_copy(self):
+        cache = self.cache(hardlink=True)
+        source = cache.store('a' * 40, b"content")
+        dest = os.path.join(self.directory, 'work', 'file.bin')
+        
+        # クローンもハードリンクもできないファイルシステムでは通常のコピーになる
+        with mock.patch.object(BlobCache, '_reflink', return_value=False), \
+                mock.patch('blob_cache.os.link', side_effect=OSError("not supported")):
+            self.assertTrue(cache.place('a' * 40, dest))
+        
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), b"content")
+        self.assertFalse(os.path.samefile(source, dest))
+        self.assertEqual(os.listdir(os.path.dirname(dest)), ['file.bin'])
+    
+    def test_place_uses_hardlink_when_enabled(self):
+        cache = self.cache(hardlink=True)
+        source = cache.store('a' * 40, b"content")
+        dest = os.path.join(self.directory, 'file.bin')
+        
+        with mock.patch.object(BlobCache, '_reflink', return_value=False):
+            self.assertTrue(cache.place('a' * 40, dest))
+        
+        self.assertTrue(os.path.samefile(source, dest))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import random
+import unittest
+
+import diff_engine
+
+
+def check_opcodes(testcase, a, b, opcodes):
+    """opcode が difflib の get_opcodes() と同じ規則を満たし、a から b を再構成できることを確かめる"""
+    testcase.assertTrue(opcodes or (not a and not b))
+    i = j = 0
+    previous = None
+    rebuilt = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        testcase.assertIn(tag, ('equal', 'replace', 'delete', 'insert'))
+        testcase.assertEqual((i1, j1), (i, j))
+        testcase.assertTrue(i1 <= i2 and j1 <= j2)
+        if tag == 'equal':
+            testcase.assertEqual(a[i1:i2], b[j1:j2])
+            testcase.assertNotEqual(previous, 'equal')
+            rebuilt.extend(a[i1:i2])
+        else:
+            testcase.assertNotEqual(previous, tag)
+            if tag == 'delete':
+                testcase.assertTrue(i1 < i2 and j1 == j2)
+            elif tag == 'insert':
+                testcase.assertTrue(i1 == i2 and j1 < j2)
+            else:
+                testcase.assertTrue(i1 < i2 and j1 < j2)
+            rebuilt.extend(b[j1:j2])
+        i, j = i2, j2
+        previous = tag
+    testcase.assertEqual((i, j), (len(a), len(b)))
+    testcase.assertEqual(rebuilt, b)
+
+
+class DiffOpcodesTest(unittest.TestCase):
+    """diff_opcodes の結果を検証する"""
+    
+    def test_line_repeated_just_over_chain_limit(self):
+        # 出現回数が MAX_CHAIN_LENGTH + 1 の行しか共通しない場合に TypeError になっていた
+        a = ['x', 'y'] * (diff_engine.MAX_CHAIN_LENGTH + 1)
+        b = ['y', 'z', 'x']
+        for algorithm in ('myers', 'histogram'):
+            with self.subTest(algorithm=algorithm):
+                check_opcodes(self, a, b, diff_engine.diff_opcodes(a, b, algorithm))
+    
+    def test_random_edits_match_difflib_invariants(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            alphabet = rng.choice((2, 5, 50, 1000))
+            a = [str(rng.randrange(alphabet)) for _ in range(rng.randrange(0, 300))]
+            b = list(a)
+            for _ in range(rng.randrange(0, 40)):
+                position = rng.randrange(len(b) + 1)
+                kind = rng.randrange(3)
+                if kind == 0 and position < len(b):
+                    del b[position]
+                elif kind == 1:
+                    b.insert(position, str(rng.randrange(alphabet)))
+                elif position < len(b):
+                    b[position] = str(rng.randrange(alphabet))
+            
+            for algorithm in diff_engine.ALGORITHMS:
+                with self.subTest(algorithm=algorithm, a=a, b=b):
+                    check_opcodes(self, a, b, diff_engine.diff_opcodes(a, b, algorithm))
+    
+    def test_exhausted_budget_still_produces_valid_diff(self):
+        # 探索量を使い切った領域も、正しい（最短とは限らない）差分になる
+        rng = random.Random(1)
+        a = [str(rng.randrange(5)) for _ in range(3000)]
+        b = [str(rng.randrange(5)) for _ in range(3000)]
+        original = diff_engine.WORK_MIN
+        diff_engine.WORK_MIN = 0
+        try:
+            for algorithm in ('myers', 'histogram'):
+                with self.subTest(algorithm=algorithm):
+                    check_opcodes(self, a, b, diff_engine.diff_opcodes(a, b, algorithm))
+        finally:
+            diff_engine.WORK_MIN = original
+
+
+if __name__ == '__main__':
+    unittest.main()
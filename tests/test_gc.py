@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from repository import Repository
+
+
+class GarbageCollectionTest(unittest.TestCase):
+    """gc が到達可能性と猶予期間に従ってオブジェクトを削除することを検証する"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.repo = Repository(self.directory)
+        self.repo.init()
+        config = self.repo.get_config()
+        config.setdefault('core', {})['fsync'] = 'none'
+        self.repo.set_config(config)
+        
+        with open(os.path.join(self.directory, 'tracked.txt'), 'w') as f:
+            f.write("tracked\n")
+        self.repo.add('tracked.txt')
+        self.repo.commit("first")
+        # コミットから到達できるオブジェクトも、猶予期間より古くしておく
+        for object_id in self.object_ids():
+            self.make_old(object_id)
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def object_path(self, object_id):
+        return self.repo.objects_dir / object_id[:2] / object_id[2:]
+    
+    def object_ids(self):
+        return {
+            os.path.basename(dir_path) + name
+            for dir_path, _, names in os.walk(self.repo.objects_dir) for name in names
+        }
+    
+    def make_old(self, object_id, days=30):
+        old = time.time() - days * 86400
+        os.utime(self.object_path(object_id), (old, old))
+    
+    def test_prunes_only_old_unreachable_objects(self):
+        reachable = self.object_ids()
+        garbage = self.repo.hash_object(b"garbage\n")
+        self.make_old(garbage)
+        recent = self.repo.hash_object(b"recent\n")
+        
+        success, result = self.repo.gc(expire_days=14)
+        
+        self.assertTrue(success)
+        self.assertEqual(result['pruned'], 1)
+        self.assertEqual(result['kept_recent'], 1)
+        self.assertFalse(self.object_path(garbage).exists())
+        self.assertTrue(self.object_path(recent).exists())
+        self.assertEqual(self.object_ids(), reachable | {recent})
+    
+    def test_dry_run_does_not_delete(self):
+        garbage = self.repo.hash_object(b"garbage\n")
+        self.make_old(garbage)
+        
+        success, result = self.repo.gc(expire_days=14, dry_run=True)
+        
+        self.assertTrue(success)
+        self.assertEqual(result['pruned'], 1)
+        self.assertTrue(self.object_path(garbage).exists())
+    
+    def test_object_written_during_sweep_is_kept(self):
+        # 走査で古いと判定した後に add などが同じ内容を書き込んだオブジェクトは、削除の直前の確認で残す
+        revived = self.repo.hash_object(b"revived\n")
+        self.make_old(revived)
+        scandir = os.scandir
+        
+        def scandir_then_write(path):
+            if os.path.basename(path) != revived[:2]:
+                return scandir(path)
+            with scandir(path) as entries:
+                entries = list(entries)
+            for entry in entries:
+                # 走査した時点の更新日時を DirEntry に記録させる
+                entry.stat()
+            self.repo.hash_object(b"revived\n")
+            return _EntryList(entries)
+        
+        with mock.patch('repository.os.scandir', scandir_then_write):
+            success, result = self.repo.gc(expire_days=14)
+        
+        self.assertTrue(success)
+        self.assertEqual(result['pruned'], 0)
+        self.assertEqual(result['kept_recent'], 1)
+        self.assertTrue(self.object_path(revived).exists())
+
+
+class _EntryList(list):
+    """os.scandir と同じく with 文で使える DirEntry のリスト"""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import locking
+from repository import LOCK_SUFFIX, Repository, RefConflictError
+
+
+class LockFileTest(unittest.TestCase):
+    """ロックファイルの取得と残骸の判定を検証する"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.lock')
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def write_lock(self, pid, age=0):
+        with open(self.path, 'w') as f:
+            f.write(f"{pid} {int(time.time() - age)} {locking._get_hostname()}\n")
+        mtime = time.time() - age
+        os.utime(self.path, (mtime, mtime))
+    
+    def test_old_lock_of_live_process_is_not_broken(self):
+        # 実行中のプロセスのロックは、stale_seconds より古くても残骸とみなさない
+        self.write_lock(os.getpid(), age=locking.DEFAULT_STALE_SECONDS * 2)
+        self.assertFalse(locking.is_stale(self.path))
+        self.assertFalse(locking.try_acquire(self.path))
+        with self.assertRaises(locking.LockTimeout) as context:
+            locking.acquire(self.path, timeout=0.05)
+        self.assertEqual(context.exception.owner['pid'], os.getpid())
+        self.assertTrue(os.path.exists(self.path))
+    
+    def test_lock_of_exited_process_is_taken_over(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        self.write_lock(process.pid)
+        self.assertTrue(locking.is_stale(self.path))
+        locking.acquire(self.path, timeout=0)
+        self.assertEqual(locking.read_owner(self.path)['pid'], os.getpid())
+        locking.release(self.path)
+        self.assertFalse(os.path.exists(self.path))
+    
+    def test_unreadable_owner_falls_back_to_age(self):
+        # 書き込み途中などで所有者を読み取れない場合は、古さだけで判定する
+        open(self.path, 'w').close()
+        self.assertFalse(locking.is_stale(self.path))
+        old = time.time() - locking.DEFAULT_STALE_SECONDS * 2
+        os.utime(self.path, (old, old))
+        self.assertTrue(locking.is_stale(self.path))
+
+
+class RepositoryLockTest(unittest.TestCase):
+    """参照の比較更新と、同時に実行した書き込みを検証する"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.repo = Repository(self.directory)
+        self.repo.init()
+        config = self.repo.get_config()
+        config.setdefault('core', {})['fsync'] = 'none'
+        self.repo.set_config(config)
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def test_update_ref_with_wrong_old_value_does_not_write(self):
+        first, second, other = 'a' * 40, 'b' * 40, 'c' * 40
+        self.repo.update_ref('topic', first, '')
+        with self.assertRaises(RefConflictError):
+            self.repo.update_ref('topic', second, other)
+        with self.assertRaises(RefConflictError):
+            self.repo.update_ref('topic', second, '')
+        self.assertEqual(self.repo._read_ref('topic'), first)
+        self.assertFalse((self.repo.branches_dir / ('topic' + LOCK_SUFFIX)).exists())
+        
+        self.repo.update_ref('topic', second, first)
+        self.assertEqual(self.repo._read_ref('topic'), second)
+    
+    def test_concurrent_writers_keep_every_change(self):
+        workers, rounds = 4, 5
+        errors = []
+        
+        def work(worker):
+            # インスタンスを分け、プロセスをまたぐ場合と同じくロックファイルで排他させる
+            repo = Repository(self.directory)
+            for i in range(rounds):
+                name = f"w{worker}_{i}.txt"
+                with open(os.path.join(self.directory, name), 'w') as f:
+                    f.write(f"{worker} {i}\n")
+                for result in (repo.add(name), repo.commit(f"{worker}-{i}")):
+                    if not result[0]:
+                        errors.append(result[1])
+        
+        threads = [threading.Thread(target=work, args=(worker,)) for worker in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.repo.get_index()), workers * rounds)
+        success, log = self.repo.log(workers * rounds + 1)
+        self.assertTrue(success)
+        self.assertEqual(len(log), workers * rounds)
+        self.assertFalse(self.repo.lock_file.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
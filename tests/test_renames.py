@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import diff_engine
+from repository import Repository
+
+
+def numbered_lines(start, count):
+    return ''.join(f"line {i}\n" for i in range(start, start + count))
+
+
+class DetectRenamesTest(unittest.TestCase):
+    """diff_engine.detect_renames の名前変更とコピーの判定を検証する"""
+    
+    def detect(self, old_contents, new_contents, threshold=diff_engine.DEFAULT_RENAME_THRESHOLD, copy_contents=None):
+        # blob ID の代わりに内容そのものを使う
+        deleted = {path: data for path, data in old_contents.items()}
+        added = {path: data for path, data in new_contents.items()}
+        copy_sources = None if copy_contents is None else dict(copy_contents)
+        sources = dict(old_contents, **(copy_contents or {}))
+        return diff_engine.detect_renames(
+            deleted, added, sources.__getitem__, new_contents.__getitem__, threshold, copy_sources
+        )
+    
+    def score(self, old, new):
+        return diff_engine.similarity(
+            diff_engine.fingerprint(old), diff_engine.fingerprint(new), len(old), len(new)
+        )
+    
+    def test_exact_rename(self):
+        content = numbered_lines(0, 20).encode()
+        self.assertEqual(self.detect({'old.txt': content}, {'new.txt': content}), [('R', 'old.txt', 'new.txt', 100)])
+    
+    def test_exact_rename_prefers_same_file_name(self):
+        content = numbered_lines(0, 20).encode()
+        found = self.detect({'a/x.txt': content, 'b/y.txt': content}, {'c/y.txt': content})
+        self.assertEqual(found, [('R', 'b/y.txt', 'c/y.txt', 100)])
+    
+    def test_similar_rename_above_threshold(self):
+        old = numbered_lines(0, 40).encode()
+        new = (numbered_lines(0, 30) + numbered_lines(1000, 10)).encode()
+        score = self.score(old, new)
+        self.assertTrue(diff_engine.DEFAULT_RENAME_THRESHOLD <= score < 100)
+        self.assertEqual(self.detect({'old.txt': old}, {'new.txt': new}), [('R', 'old.txt', 'new.txt', score)])
+        # 類似度がしきい値ちょうどであれば名前変更とみなす
+        self.assertEqual(len(self.detect({'old.txt': old}, {'new.txt': new}, threshold=score)), 1)
+    
+    def test_similar_rename_below_threshold(self):
+        old = numbered_lines(0, 40).encode()
+        new = (numbered_lines(0, 10) + numbered_lines(1000, 30)).encode()
+        score = self.score(old, new)
+        self.assertTrue(score < diff_engine.DEFAULT_RENAME_THRESHOLD)
+        self.assertEqual(self.detect({'old.txt': old}, {'new.txt': new}), [])
+        self.assertEqual(self.detect({'old.txt': old}, {'new.txt': new}, threshold=score + 1), [])
+        self.assertEqual(self.detect({'old.txt': old}, {'new.txt': new}, threshold=score), [('R', 'old.txt', 'new.txt', score)])
+    
+    def test_copy_from_modified_file(self):
+        source = numbered_lines(0, 40).encode()
+        similar = (numbered_lines(0, 36) + numbered_lines(1000, 4)).encode()
+        new_contents = {'copy.txt': source, 'similar.txt': similar}
+        found = self.detect({}, new_contents, copy_contents={'src.txt': source})
+        self.assertEqual(sorted(found), [
+            ('C', 'src.txt', 'copy.txt', 100),
+            ('C', 'src.txt', 'similar.txt', self.score(source, similar)),
+        ])
+        # コピーを検出しない場合、変更されただけのファイルは候補にならない
+        self.assertEqual(self.detect({}, new_contents), [])
+    
+    def test_deleted_source_is_renamed_once_and_copied_otherwise(self):
+        content = numbered_lines(0, 20).encode()
+        found = self.detect({'old.txt': content}, {'a.txt': content, 'b.txt': content}, copy_contents={})
+        self.assertEqual(found, [('R', 'old.txt', 'a.txt', 100), ('C', 'old.txt', 'b.txt', 100)])
+        found = self.detect({'old.txt': content}, {'a.txt': content, 'b.txt': content})
+        self.assertEqual(found, [('R', 'old.txt', 'a.txt', 100)])
+
+
+class TreeChangesOrderTest(unittest.TestCase):
+    """名前変更を検出した場合も、変更がパスの順に返ることを検証する"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.repo = Repository(self.directory)
+        self.repo.init()
+        config = self.repo.get_config()
+        config.setdefault('core', {})['fsync'] = 'none'
+        self.repo.set_config(config)
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def write(self, path, content):
+        full_path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(content)
+    
+    def commit_all(self, message):
+        self.repo.update_index({})
+        self.repo.add('.')
+        self.repo.commit(message)
+        return self.repo.resolve_revision('HEAD')
+    
+    def test_rename_and_modify_are_returned_in_path_order(self):
+        self.write('b.txt', numbered_lines(0, 40))
+        self.write('d/old.txt', numbered_lines(100, 40))
+        self.write('m.txt', "m\n")
+        self.write('z.txt', "z\n")
+        first = self.commit_all("first")
+        
+        os.remove(os.path.join(self.directory, 'd/old.txt'))
+        self.write('a.txt', numbered_lines(100, 40))
+        self.write('b.txt', numbered_lines(0, 41))
+        self.write('m.txt', "m2\n")
+        self.write('z.txt', "z2\n")
+        second = self.commit_all("second")
+        
+        expected = [
+            ('R100', 'd/old.txt', 'a.txt'),
+            ('M', 'b.txt', 'b.txt'),
+            ('M', 'm.txt', 'm.txt'),
+            ('M', 'z.txt', 'z.txt'),
+        ]
+        success, changes = self.repo.diff_trees(first, second, renames=True)
+        self.assertTrue(success)
+        self.assertEqual([(c['status'], c['old_path'], c['path']) for c in changes], expected)
+        
+        records = list(self.repo.iter_diff_commit_files(first, second, name_status=True, renames=True))
+        self.assertEqual([(r['status'], r['old_path'], r['path']) for r in records], expected)
+        
+        success, stats = self.repo.diff_stat(first, second, renames=True)
+        self.assertTrue(success)
+        self.assertEqual([s['path'] for s in stats], ['a.txt', 'b.txt', 'm.txt', 'z.txt'])
+    
+    def test_copy_of_modified_file_is_reported_only_with_copies(self):
+        self.write('src.txt', numbered_lines(0, 40))
+        first = self.commit_all("first")
+        self.write('copy.txt', numbered_lines(0, 40))
+        self.write('src.txt', numbered_lines(0, 41))
+        second = self.commit_all("second")
+        
+        success, changes = self.repo.diff_trees(first, second, renames='copies')
+        self.assertTrue(success)
+        self.assertEqual(
+            [(c['status'], c['old_path'], c['path']) for c in changes],
+            [('C100', 'src.txt', 'copy.txt'), ('M', 'src.txt', 'src.txt')]
+        )
+        success, changes = self.repo.diff_trees(first, second, renames=True)
+        self.assertEqual([(c['status'], c['path']) for c in changes], [('A', 'copy.txt'), ('M', 'src.txt')])
+
+
+if __name__ == '__main__':
+    unittest.main()
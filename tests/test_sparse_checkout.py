@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from repository import Repository
+
+
+class SparseConeTest(unittest.TestCase):
+    """コーンモードのパターンの判定を検証する"""
+    
+    def setUp(self):
+        self.repo = Repository(tempfile.gettempdir())
+    
+    def test_files_under_pattern_directories_are_in_cone(self):
+        patterns = ['src', 'lib/core']
+        self.assertTrue(self.repo._in_sparse_cone('src/main.py', patterns))
+        self.assertTrue(self.repo._in_sparse_cone('src/deep/nested/file.py', patterns))
+        self.assertTrue(self.repo._in_sparse_cone('lib/core/util.py', patterns))
+        self.assertTrue(self.repo._in_sparse_cone('src\\windows.py', patterns))
+    
+    def test_files_outside_pattern_directories_are_not_in_cone(self):
+        patterns = ['src', 'lib/core']
+        # 名前の先頭が一致するだけのディレクトリは対象外
+        self.assertFalse(self.repo._in_sparse_cone('srcx/main.py', patterns))
+        self.assertFalse(self.repo._in_sparse_cone('lib/other.py', patterns))
+        self.assertFalse(self.repo._in_sparse_cone('lib/coreutils/a.py', patterns))
+        self.assertFalse(self.repo._in_sparse_cone('docs/index.md', patterns))
+    
+    def test_root_files_are_always_in_cone(self):
+        self.assertTrue(self.repo._in_sparse_cone('README.md', ['src']))
+        self.assertTrue(self.repo._in_sparse_cone('docs/index.md', None))
+    
+    def test_parent_directories_of_patterns_are_walked(self):
+        patterns = ['lib/core']
+        self.assertTrue(self.repo._sparse_dir_relevant('lib', patterns))
+        self.assertTrue(self.repo._sparse_dir_relevant('lib/core', patterns))
+        self.assertTrue(self.repo._sparse_dir_relevant('lib/core/sub', patterns))
+        self.assertFalse(self.repo._sparse_dir_relevant('lib/other', patterns))
+        self.assertFalse(self.repo._sparse_dir_relevant('libx', patterns))
+    
+    def test_patterns_are_normalized(self):
+        self.assertEqual(self.repo._normalize_sparse_pattern(' /src/app/ \n'), 'src/app')
+        self.assertEqual(self.repo._normalize_sparse_pattern('lib\\core'), 'lib/core')
+        self.assertEqual(self.repo._normalize_sparse_pattern('# comment'), '')
+
+
+class SparseCheckoutTest(unittest.TestCase):
+    """sparse_checkout がワーキングディレクトリと skip-worktree を更新することを検証する"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.repo = Repository(self.directory)
+        self.repo.init()
+        config = self.repo.get_config()
+        config.setdefault('core', {})['fsync'] = 'none'
+        self.repo.set_config(config)
+        
+        for path in ('README.md', 'src/main.py', 'docs/guide.md', 'docs/notes.md'):
+            self.write(path, f"{path}\n")
+        self.repo.add('.')
+        self.repo.commit("first")
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def path(self, rel_path):
+        return os.path.join(self.directory, rel_path)
+    
+    def write(self, rel_path, content):
+        os.makedirs(os.path.dirname(self.path(rel_path)), exist_ok=True)
+        with open(self.path(rel_path), 'w') as f:
+            f.write(content)
+    
+    def test_files_outside_cone_are_hidden_and_restored(self):
+        success, message = self.repo.sparse_checkout(['src'])
+        self.assertTrue(success, message)
+        
+        self.assertTrue(os.path.exists(self.path('README.md')))
+        self.assertTrue(os.path.exists(self.path('src/main.py')))
+        self.assertFalse(os.path.exists(self.path('docs')))
+        index = self.repo.get_index()
+        self.assertTrue(index['docs/guide.md'].get('skip_worktree'))
+        self.assertFalse(index['src/main.py'].get('skip_worktree'))
+        
+        # skip-worktree のファイルは削除されたとはみなさない
+        success, status = self.repo.status()
+        self.assertTrue(success)
+        self.assertEqual(status['deleted_files'], [])
+        
+        success, message = self.repo.sparse_checkout(disable=True)
+        self.assertTrue(success, message)
+        with open(self.path('docs/guide.md')) as f:
+            self.assertEqual(f.read(), "docs/guide.md\n")
+        self.assertFalse(any(info.get('skip_worktree') for info in self.repo.get_index().values()))
+    
+    def test_modified_file_outside_cone_is_kept(self):
+        self.write('docs/notes.md', "local change\n")
+        
+        success, message = self.repo.sparse_checkout(['src'])
+        
+        self.assertTrue(success)
+        self.assertIn('docs/notes.md', message)
+        with open(self.path('docs/notes.md')) as f:
+            self.assertEqual(f.read(), "local change\n")
+        self.assertFalse(self.repo.get_index()['docs/notes.md'].get('skip_worktree'))
+        self.assertFalse(os.path.exists(self.path('docs/guide.md')))
+
+
+if __name__ == '__main__':
+    unittest.main()
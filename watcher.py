@@ -0,0 +1,135 @@
+import os
+
+
+class WorkingTreeWatcher:
+    """ワーキングディレクトリの変更を stat のポーリングで検出する
+    
+    ファイルは (更新時刻, サイズ) を、ディレクトリは更新時刻を記録しておき、
+    更新時刻が変わったディレクトリだけを読み直して追加されたファイルを見つける。
+    """
+    
+    def __init__(self, repo):
+        """ウォッチャーを初期化する"""
+        self.repo = repo
+        self.files = {}
+        self.dirs = {}
+        self.meta = None
+        self.patterns = None
+    
+    def _meta_state(self):
+        """インデックス・HEAD・スパースチェックアウト設定の更新時刻を取得する"""
+        state = []
+        for path in (self.repo.index_file, self.repo.head_file, self.repo.sparse_file):
+            try:
+                stat = os.stat(path)
+                state.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                state.append(None)
+        return state
+    
+    def reset(self):
+        """現在のワーキングディレクトリの状態を記録し直す"""
+        self.patterns = self.repo.get_sparse_patterns()
+        self.files = {}
+        self.dirs = {}
+        self.meta = self._meta_state()
+        self._scan_dir('')
+    
+    def _scan_dir(self, rel_dir):
+        """ディレクトリ以下を走査して記録し、見つかったファイルの相対パスを返す"""
+        found = set()
+        root = self.repo.repo_path / rel_dir if rel_dir else self.repo.repo_path
+        
+        for dir_path, dir_names, file_names in os.walk(root):
+            current = os.path.relpath(dir_path, self.repo.repo_path)
+            current = '' if current == '.' else current
+            
+            try:
+                self.dirs[current] = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+            
+            dir_names[:] = [
+                name for name in dir_names
+                if name != '.lvcs' and self.repo._sparse_dir_relevant(os.path.join(current, name), self.patterns)
+            ]
+            
+            for name in file_names:
+                rel_path = os.path.join(current, name)
+                if not self.repo._in_sparse_cone(rel_path, self.patterns):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(dir_path, name))
+                except OSError:
+                    continue
+                self.files[rel_path] = (stat.st_mtime_ns, stat.st_size)
+                found.add(rel_path)
+        
+        return found
+    
+    def poll(self):
+        """前回からの変更を調べる
+        
+        変更されたファイルの相対パスの集合を返す。インデックスやHEADが変わった場合など、
+        全体を調べ直す必要があるときは None を返す。
+        """
+        meta = self._meta_state()
+        if self.meta is None or meta != self.meta:
+            self.reset()
+            return None
+        
+        changed = set()
+        
+        # 記録済みのファイルの変更・削除
+        for rel_path, state in list(self.files.items()):
+            try:
+                stat = os.stat(self.repo.repo_path / rel_path)
+                current = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                current = None
+            
+            if current != state:
+                changed.add(rel_path)
+                if current is None:
+                    del self.files[rel_path]
+                else:
+                    self.files[rel_path] = current
+        
+        # 更新時刻が変わったディレクトリだけを読み直し、追加されたファイルを探す
+        for rel_dir, mtime in list(self.dirs.items()):
+            if rel_dir not in self.dirs:
+                continue
+            
+            dir_path = self.repo.repo_path / rel_dir if rel_dir else self.repo.repo_path
+            try:
+                current_mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                # 削除されたディレクトリ（中のファイルは上で検出済み）
+                for known in [d for d in self.dirs if d == rel_dir or d.startswith(rel_dir + os.sep)]:
+                    del self.dirs[known]
+                continue
+            
+            if current_mtime == mtime:
+                continue
+            self.dirs[rel_dir] = current_mtime
+            
+            try:
+                entries = list(os.scandir(dir_path))
+            except OSError:
+                continue
+            
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    if (rel_path not in self.dirs and entry.name != '.lvcs'
+                            and self.repo._sparse_dir_relevant(rel_path, self.patterns)):
+                        changed |= self._scan_dir(rel_path)
+                elif rel_path not in self.files and self.repo._in_sparse_cone(rel_path, self.patterns):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    self.files[rel_path] = (stat.st_mtime_ns, stat.st_size)
+                    changed.add(rel_path)
+        
+        return changed